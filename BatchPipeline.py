@@ -0,0 +1,117 @@
+# Command-line entry point running the whole pipeline (fetch -> extract -> audio features -> merge -> recommendations) over many playlists
+# in parallel, without the Streamlit UI. The client credentials are read from the SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET environment
+# variables (or from the Streamlit secrets).
+#
+# USAGE:
+#   python BatchPipeline.py playlist_ids.txt --workers 8 --summary output/batch-summary.ndjson
+#
+# The input file contains one playlist ID (or playlist URL/URI) per line. Empty lines and lines starting with '#' are ignored.
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from utilities import SpotifyClient, Pipeline, RecommendationHarvester, Metrics
+
+
+def readPlaylistIDs(filename):
+    '''
+    Reads the playlist IDs from the input file. Playlist URLs (https://open.spotify.com/playlist/{id}?si=...) and URIs (spotify:playlist:{id})
+    are accepted as well.
+    '''
+    playlist_ids = []
+    with open(filename) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            playlist_id = line.split('?')[0].rstrip('/').split('/')[-1].split(':')[-1]
+            playlist_ids.append(playlist_id)
+
+    # Drop duplicates but keep the order of the file
+    return list(dict.fromkeys(playlist_ids))
+
+
+def configureWorker(client_settings):
+    '''
+    Runs once in every worker process (with --processes) to give it a shared client configured like the one of the main process.
+    '''
+    SpotifyClient.configureClient(**client_settings)
+
+
+def parseArguments(argv=None):
+    parser = argparse.ArgumentParser(description='Run the playlist pipeline over many playlists without the Streamlit UI.')
+    parser.add_argument('playlist_file', help='File with one playlist ID per line.')
+    parser.add_argument('--workers', type=int, default=4, help='Number of playlists processed at the same time (default: 4).')
+    parser.add_argument('--processes', action='store_true', help='Use worker processes instead of threads.')
+    parser.add_argument('--target-count', type=int, default=RecommendationHarvester.DEFAULT_TARGET_COUNT,
+                        help='Number of unique recommended tracks to harvest per playlist.')
+    parser.add_argument('--rate', type=float, default=SpotifyClient.DEFAULT_RATE,
+                        help=f'Requests per second sent to Spotify by the whole batch (default: {SpotifyClient.DEFAULT_RATE:g}). '
+                             'With --processes, it is split evenly between the worker processes.')
+    parser.add_argument('--no-recommendations', action='store_true', help='Stop after the full dataset of each playlist.')
+    parser.add_argument('--force', action='store_true', help='Download every playlist again, even if its snapshot ID has not changed.')
+    parser.add_argument('--summary', help='Append the summary of every playlist to this NDJSON file.')
+    parser.add_argument('--metrics-file', help='Write the request metrics to this file in the Prometheus text format after every playlist. '
+                                               'With --processes, only the requests of the main process are counted.')
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parseArguments(argv)
+    playlist_ids = readPlaylistIDs(arguments.playlist_file)
+
+    # Each playlist runs its own pools of page and audio-feature requests, so keep enough connections for all of them. Worker processes
+    # configure their own client with the same settings, since the shared client of this process is not carried over to them.
+    client_settings = {'pool_maxsize': max(SpotifyClient.DEFAULT_POOL_MAXSIZE, arguments.workers * 8)}
+    SpotifyClient.configureClient(rate=arguments.rate, **client_settings)
+
+    if arguments.processes:
+        # Every process has its own rate limiter, so each one gets its share of the budget
+        worker_settings = {**client_settings, 'rate': arguments.rate / arguments.workers}
+        executor = ProcessPoolExecutor(max_workers=arguments.workers, initializer=configureWorker, initargs=(worker_settings,))
+    else:
+        executor = ThreadPoolExecutor(max_workers=arguments.workers)
+    summary_file = open(arguments.summary, 'a') if arguments.summary else None
+
+    start_time = time.perf_counter()
+    num_failed = 0
+    try:
+        with executor:
+            futures = [
+                executor.submit(
+                    Pipeline.runPlaylistPipeline,
+                    playlist_id,
+                    target_count=arguments.target_count,
+                    force=arguments.force,
+                    recommend=not arguments.no_recommendations,
+                )
+                for playlist_id in playlist_ids
+            ]
+
+            for number, future in enumerate(as_completed(futures), start=1):
+                summary = future.result()
+                num_failed += 'error' in summary
+
+                status = f"ERROR: {summary['error']}" if 'error' in summary else f"{summary.get('num_tracks', 0)} tracks"
+                print(f"[{number}/{len(playlist_ids)}] {summary['playlist_id']} {summary.get('name', '')} - {status} ({summary['seconds']}s)")
+
+                if summary_file is not None:
+                    summary_file.write(json.dumps(summary) + '\n')
+                    summary_file.flush()
+                if arguments.metrics_file:
+                    Metrics.writePrometheusFile(arguments.metrics_file)
+    finally:
+        if summary_file is not None:
+            summary_file.close()
+
+    print(f"Processed {len(playlist_ids)} playlists in {time.perf_counter() - start_time:.1f}s ({num_failed} failed).")
+
+    return 1 if num_failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
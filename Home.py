@@ -1,30 +1,50 @@
 import os
-import json
-import pandas as pd
-import streamlit as st
-import streamlit_authenticator as stauth
-from utilities import SpotifyAuth, Playlists, Tracks
-from tabulate import tabulate
-import yaml
-from yaml.loader import SafeLoader
 import streamlit as st
-import streamlit_authenticator as stauth
+from utilities import Profiler
+
+CONFIG_PATH = 'config.yaml'
 
 st.set_page_config(
   page_title="HOME",
   page_icon="🏠"
 )
 
-with open("config.yaml") as f:
-    config = yaml.load(f, Loader=SafeLoader)
-    
-authenticator = stauth.Authenticate(
-    config['credentials'],
-    config['cookie']['name'],
-    config['cookie']['key'],
-    config['cookie']['expiry_days'],
-    config['preauthorized']
-)
+profiler = Profiler.startRerun('Home')
+
+
+@st.cache_data
+def loadConfig(path, modified_at):
+    '''
+    Parses the YAML config once per version of the file (`modified_at` is its modification time) instead of on every rerun.
+    '''
+    import yaml
+    from yaml.loader import SafeLoader
+
+    with open(path) as f:
+        return yaml.load(f, Loader=SafeLoader)
+
+
+def getAuthenticator():
+    '''
+    Returns the Authenticate object of the session. It is kept across the reruns of an authenticated session; until then it is created again on
+    every rerun, since its cookie manager only reads the login cookie when it is created.
+    '''
+    if st.session_state.get('authenticator') is None or not st.session_state.get('authentication_status'):
+        import streamlit_authenticator as stauth
+
+        config = loadConfig(CONFIG_PATH, os.path.getmtime(CONFIG_PATH))
+        st.session_state['authenticator'] = stauth.Authenticate(
+            config['credentials'],
+            config['cookie']['name'],
+            config['cookie']['key'],
+            config['cookie']['expiry_days'],
+            config['preauthorized']
+        )
+
+    return st.session_state['authenticator']
+
+
+authenticator = getAuthenticator()
 
 authenticator.login('Login', 'main')
 
@@ -35,72 +55,39 @@ if st.session_state['authentication_status']:
     # st.toast('You can now use the app.', icon='🎉')
     # st.toast('Make sure to check the general description provided in the shared Notion page before using.', icon='📝')
     authenticator.logout('Logout', 'sidebar', key='logout_button')
+
+    # The metrics panel imports pandas, so it is only loaded once the user is logged in
+    from utilities import MetricsPanel
+    MetricsPanel.renderMetricsPanel()
 elif st.session_state["authentication_status"] is False:
     st.error('Username/password is incorrect')
     st.stop()
 else:
     st.error('You are not yet logged in. Please login first.')
     st.stop()
+
+# The modules needed by the rest of the page are only imported once the user is logged in, so that the login form shows up sooner
+import pandas as pd
+from utilities import SpotifyAuth, Playlists, Tracks, Storage
     
 st.header('🏠 Spotify Data Scraper')
 st.write('by **HQuizzagan** -- *25th July 2023*')
 
 # Define some session state variables
-st.session_state['token_is_valid'] = None
 st.session_state['playlistInfo'] = None
 
-# CALLBACK FUNCTIONS
-def resetAccessToken(access_token):
-    # Check if access token is still valid. If it is invalid, the function will request for a new one
-    new_spotify_access_token, validateResponse, success = SpotifyAuth.validateToken(access_token)
-
-    # Case 1: CURRENT access token is still valid
-    if new_spotify_access_token is None and success:
-        st.session_state['token_is_valid'] = True
-        st.session_state['spotify_access_token'] = access_token
-    # Case 2: CURRENT access token is invalid and a NEW access token has been generated
-    elif new_spotify_access_token is not None and success:
-        st.session_state['token_is_valid'] = False
-        # Reset the access token
-        st.session_state['spotify_access_token'] = new_spotify_access_token
-    # Case 3: CURRENT access token is invalid and a NEW access token has NOT been generated
-    else:
-        st.session_state['token_is_valid'] = False
-        st.session_state['spotify_access_token'] = None
-        st.error(f'''
-                 There was an error in validating your access token.
-                 Error:
-                    {validateResponse}''')
-        st.stop()
-
-    return validateResponse
-
-
 # MAIN LAYOUT OF THE APP
 st.info('*This app allows you to request data from Spotify\'s API. You can request for a playlist, track, artist, or album. You can also request for multiple playlists, tracks, artists, or albums.*')
 
 with st.sidebar:
     st.header('Data Request')
-    st.write("*You need a **SPOTIFY ACCESS TOKEN** before we can use the Spotify Web API to request for data. Unfortunately, the access token only has a validity of one hour. Thus, you will need to request for new tokens when it's no longer valid.*")
+    st.write("*A **SPOTIFY ACCESS TOKEN** is needed before we can use the Spotify Web API to request for data. The access token only has a validity of one hour, so it is refreshed automatically shortly before it expires, or as soon as Spotify rejects it.*")
 
-    spotify_access_token = st.text_input(
-        label='Spotify Access Token',
-        key='spotify_access_token_input'
-    )
-
-    if spotify_access_token:
-        # Validate the token
-        if st.button('Validate Token'):
-            validateResponse = resetAccessToken(spotify_access_token)
-
-            if st.session_state.token_is_valid:
-                st.success('Token is valid.')
-                st.balloons()
-            else:
-                st.error(f"Token is invalid. Error: {validateResponse}")
-                st.write(f"A new access token has been generated. Please copy the new access token and paste it in the text box.")
-                st.text(f"{st.session_state.spotify_access_token}")
-                st.stop()
+    token_manager = SpotifyAuth.getTokenManager()
+    if token_manager.isFresh():
+        st.success(f'Access token is valid for another {int(token_manager.expiresIn() // 60)} minutes.')
+    else:
+        st.warning('A new access token will be requested on the next call to Spotify.')
 
     st.write('Select which data you want to request from Spotify.')
 
@@ -118,110 +105,106 @@ with st.sidebar:
         )
 
 if input_id:
-    playlistInfo, playlistData = Playlists.getPublicPlaylist(
-        st.session_state['spotify_access_token'],
-        input_id
-    )
+    # The header of the playlist is checked first (conditionally), and its items are only downloaded again if it has changed since it was
+    # saved in the track store. The items are saved as they arrive, and the tracks extracted chunk by chunk.
+    try:
+        with Profiler.stage('playlist'):
+            playlistInfo, trackList_df, numItems, _ = Playlists.getCachedPlaylist(
+                SpotifyAuth.getAccessToken(),
+                input_id
+            )
+    except Exception as e:
+        st.error(f"Error: {e}")
+        print(f"Saving to Output Error: {e}")
+        st.stop()
 
-    # Save playlistInfo to session state
-    st.session_state['playlistInfo'] = playlistInfo
+    if 'error' not in playlistInfo:
+        # Save playlistInfo to session state
+        st.session_state['playlistInfo'] = playlistInfo
+
+        name, id = playlistInfo['name'], playlistInfo['id']
+
+        # Check if the `output` folder exists. If not, create it.
+        if not os.path.exists('output'):
+            os.mkdir('output')
+            
+        # Inside the `output` folder, create subfolders: `playlists`, `temporary_storage`, and `cache`
+        if not os.path.exists('output/playlist'):
+            os.mkdir('output/playlist')
+        if not os.path.exists('output/temporary_storage'):
+            os.mkdir('output/temporary_storage')
+        if not os.path.exists('output/cache'):
+            os.mkdir('output/cache')
+        
+        # Inside `output` folder, delete other sub-folders that are not `playlist`, `temporary_storage`, or `cache`
+        for folder in os.listdir('output'):
+            if folder not in ['playlist', 'temporary_storage', 'cache']:
+                os.rmdir(f'output/{folder}')
+    
+        # st.info(f'Directories Created: {os.listdir()}')
+        # st.info(f'Subdirectories: {os.listdir("output")}')
+
+        st.success(f"Playlist data has been saved to the track store.")
 
-    if 'error' not in playlistData:
         # Write information about the album to be scraped
         st.subheader(f"Playlist Information:")
         st.markdown(
             f"""
                 **Name:** {playlistInfo['name']}\n
                 **Created By:** {playlistInfo['owner']}\n
-                **Number of Tracks:** {len(playlistData)}\n
+                **Number of Tracks:** {numItems}\n
                 **Number of Followers:** {playlistInfo['followers']}\n
                 **Description:** {playlistInfo['description']}
             """
         )
 
-        # Extract the tracks in the playlist
-        trackList_df = Playlists.extractTracks(playlistData)
-
-        # Display a spinner while the data is being loaded
-        while trackList_df is None:
-            st.spinner()
-
         st.subheader(f"Track List:")
-        st.dataframe(trackList_df, use_container_width=True)
-
-        name, id = playlistInfo['name'], playlistInfo['id']
+        with Profiler.stage('render track list'):
+            st.dataframe(trackList_df, use_container_width=True)
 
         # Create a 2-column layout each containing a button
         col1, col2 = st.columns(2)
         # Create a download button
         with col1:
+            with Profiler.stage('track list CSV'):
+                trackList_csv = Storage.toCSVBytes(trackList_df)
             download_button = st.download_button(
                 'Download Track List Data as CSV',
                 key='download_button',
-                data=trackList_df.to_csv(index=False).encode('utf-8'),
+                data=trackList_csv,
                 file_name=f'{name.title()}-{id}.csv',
                 mime='text/csv',
             )
-            
-        # Check if the `output` folder exists. If not, create it.
-        if not os.path.exists('output'):
-            os.mkdir('output')
-            
-        # Inside the `output` folder, create subfolders: `playlists`, and `temporary_storage`
-        if not os.path.exists('output/playlist'):
-            os.mkdir('output/playlist')
-        if not os.path.exists('output/temporary_storage'):
-            os.mkdir('output/temporary_storage')
-        
-        # Inside `output` folder, delete other sub-folders that are not `playlist` or `temporary_storage`
-        for folder in os.listdir('output'):
-            if folder not in ['playlist', 'temporary_storage']:
-                os.rmdir(f'output/{folder}')
-    
-        # st.info(f'Directories Created: {os.listdir()}')
-        # st.info(f'Subdirectories: {os.listdir("output")}')
-
-        # Save the playlist to a JSON file
-        try:
-            filename = f'output/{data_request_type.lower()}/{name.title()}--{id}.json'
-            with open(filename, 'w') as f:
-                json.dump(playlistData, f, indent=4)
-            st.success(f"Playlist data has been saved to {filename}")
-        except Exception as e:
-            st.error(f"Error: {e}")
-            print(f"Saving to Output Error: {e}")
-            st.stop()
 
         if col2.button('Extract Audio Features'):
-            audioFeatures = Tracks.getAudioFeatures(
-                st.session_state['spotify_access_token'],
-                trackList_df['id'].values
-            )
+            with Profiler.stage('audio features'):
+                audioFeatures = Tracks.getCachedAudioFeatures(
+                    SpotifyAuth.getAccessToken(),
+                    trackList_df['id'].values
+                )
             
             # Display success once the audio features have been extracted
             while audioFeatures is None:
                 st.spinner()
             st.balloons()
             st.success(f"Audio features have been extracted successfully.")
+            if audioFeatures.attrs.get('failed_ids'):
+                st.warning(f"Audio features could not be extracted for {len(audioFeatures.attrs['failed_ids'])} tracks: {audioFeatures.attrs['failed_ids']}")
             
             # Save to the global variable
             audioFeatures_df = pd.DataFrame(audioFeatures)
             st.dataframe(audioFeatures_df)
             
+            from tabulate import tabulate
             print(f"Audio Features 1:\n\n")
             print(tabulate(audioFeatures_df.head(), headers='keys', tablefmt='psql'))
             
-            # Check if the `output/temporary_storage` folder exists
-            if not os.path.exists('output/temporary_storage'):
-                os.mkdir('output/temporary_storage')
-
-            # Save the trackList_df and audioFeatures_df to temporary_storage folder
+            # The track list and audio features are already saved once per track in the track and feature stores
             if trackList_df is not None and audioFeatures_df is not None:
-                trackList_df.to_csv(f"output/temporary_storage/{name}-{id}-track-list.csv", index=False)
-                audioFeatures_df.to_csv(f"output/temporary_storage/{name}-{id}-audio-features.csv", index=False)
-                
-                st.success(f"Track list and audio features data has been saved to output/temporary_storage folder.")
+                st.success(f"Track list and audio features data has been saved to the output/cache folder.")
                 st.info('Now, proceed to the **MergeDataset** page to create the combined dataset (i.e. Track List + Audio Features).')
 
     else:
-        st.error(f"Error: {playlistData['error']['message']}")
+        st.error(f"Error: {playlistInfo['error']['message']}")
+
+profiler.finish()
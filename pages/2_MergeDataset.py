@@ -2,12 +2,25 @@ import os
 import streamlit as st
 from tabulate import tabulate
 import pandas as pd
+from utilities import Storage
+from utilities import PlaylistCatalog
+from utilities import Playlists
+from utilities import FeatureStore
+from utilities import FeatureTable
+from utilities import SpotifyAuth
+from utilities import Tracks
+from utilities import MetricsPanel
+from utilities import Profiler
 
 st.set_page_config(
   page_title="2 - Merge Dataset",
   page_icon="📊"
 )
 
+profiler = Profiler.startRerun('2_MergeDataset')
+
+MetricsPanel.renderMetricsPanel()
+
 st.header('📊 Merge Playlist Dataset')
 
 # Provide description
@@ -18,23 +31,22 @@ selected_playlist_ID = None
 
 # Get session state variables by checking first if they exist
 if 'playlistInfo' not in st.session_state:
-  # Check if there's any existing Playlist data inside the `output/playlist` directory
-  if not os.listdir('output/playlist'):
+  # Check if there's any existing Playlist data in the catalog of the playlists saved in the `output/playlist` directory
+  available_playlists = PlaylistCatalog.getCatalog().listPlaylists()
+  if not available_playlists:
     st.error('You have not pulled any playlist yet. Please go to the **🏠 Home** page first and extract a public playlist.')
     st.stop()
   else:
-    # Get the latest playlist
-    available_playlists = [x.split('--')[0] for x in os.listdir('output/playlist')]
-    availably_playlist_IDs = [x.split('--')[1] for x in os.listdir('output/playlist')]
-
-    # Show the available playlist data to select from
+    # Show the available playlist data to select from, the latest playlist first
     st.subheader('**Available Playlist Data**')
-    selected_playlist_NAME = st.selectbox(
+    selected_playlist = st.selectbox(
       label='Select a playlist to view the data',
       options=available_playlists,
+      format_func=lambda playlist: playlist['name'],
       key='playlist_data_selection',
     )
-    selected_playlist_ID = availably_playlist_IDs[available_playlists.index(selected_playlist_NAME)].removesuffix(".json")
+    selected_playlist_NAME = selected_playlist['name']
+    selected_playlist_ID = selected_playlist['playlist_id']
     
     st.success(f'You have selected the playlist: **{selected_playlist_NAME}** with ID: **{selected_playlist_ID}**')
 else:
@@ -44,39 +56,70 @@ else:
 if selected_playlist_NAME == None or selected_playlist_ID == None:
   st.stop()
 else:
-  # Check if the `temporary_storage` folder contains CSV files
-  if not os.listdir('output/temporary_storage'):
-    st.error('You have not extracted any data yet. Please go to the **🏠 Home** page first and extract the track list and audio features of a specific playlist.')
-    st.stop()
-  else:
-    try:
-      # Read the CSV files from the "output/temporary_storage" folder
-      trackList_df = pd.read_csv(f"output/temporary_storage/{selected_playlist_NAME}-{selected_playlist_ID}-track-list.csv")
-      audioFeatures_df = pd.read_csv(f"output/temporary_storage/{selected_playlist_NAME}-{selected_playlist_ID}-audio-features.csv")
-    except:
-      st.error(f'There are no extracted data for {selected_playlist_NAME} yet. Please go to the **🏠 Home** page first and extract the track list and audio features for this playlist using the Playlist ID.')
-      st.stop()
-    
+  # Read the track list and audio features from the track and feature stores, or from the artifacts saved in `output/temporary_storage`
+  # for playlists extracted before the stores existed
+  with Profiler.stage('load artifacts'):
+    trackList_df = None
+    audioFeatures_df = None
+    catalog_entry = PlaylistCatalog.getCatalog().get(selected_playlist_ID)
+    if catalog_entry is not None and Playlists.isSavedSnapshot(catalog_entry, catalog_entry['snapshot_id']):
+      trackList_df, _ = Playlists.loadSavedPlaylist(catalog_entry)
+      audio_features = FeatureStore.getStore().table(trackList_df['id'])
+
+      # The feature store only holds the tracks whose audio features were extracted for some playlist, so the other tracks of this one
+      # get theirs now (from the on-disk cache, or from Spotify)
+      stored_ids = set(audio_features.ids)
+      unstored_ids = [track_id for track_id in dict.fromkeys(trackList_df['id']) if track_id not in stored_ids]
+      if unstored_ids:
+        with st.spinner(f'Extracting the audio features of {len(unstored_ids)} tracks...'):
+          Tracks.getAudioFeatureTable(SpotifyAuth.getAccessToken(), unstored_ids)
+        audio_features = FeatureStore.getStore().table(trackList_df['id'])
+
+      if len(audio_features):
+        audioFeatures_df = audio_features.toDataFrame()
+
+    if audioFeatures_df is None:
+      try:
+        trackList_df = Storage.loadCatalogArtifact(catalog_entry, Storage.TRACK_LIST)
+        audioFeatures_df = Storage.loadCatalogArtifact(catalog_entry, Storage.AUDIO_FEATURES)
+      except:
+        st.error(f'There are no extracted data for {selected_playlist_NAME} yet. Please go to the **🏠 Home** page first and extract the track list and audio features for this playlist using the Playlist ID.')
+        st.stop()
+
+  # The tracks without audio features are left out of the full dataset
+  missing_ids = set(trackList_df['id']) - set(audioFeatures_df['id'])
+  if missing_ids:
+    st.warning(f'{len(missing_ids)} of the {trackList_df["id"].nunique()} tracks have no audio features and are left out of the full dataset: {sorted(missing_ids)}')
+
+  with Profiler.stage('render tables'):
     st.header(f'{selected_playlist_NAME} - Track List')
     st.dataframe(trackList_df)
 
     st.header(f'{selected_playlist_NAME} - Audio Features')
     st.dataframe(audioFeatures_df)
 
-    # Combine the two dataframes
-    playlist_full_dataset = trackList_df.merge(audioFeatures_df, on='id', suffixes=('_track', '_audio'))
-
-    if playlist_full_dataset is not None:
-        
-        if st.download_button(
-            label='Merge and Download Full Dataset',
-            data=playlist_full_dataset.to_csv(index=False).encode('utf-8'),
-            file_name=f'{selected_playlist_NAME.title()}-full-dataset.csv',
-            mime='text/csv',
-        ):
-            st.balloons()
-            
-            # Save to temporary_storage as well
-            playlist_full_dataset.to_csv(f"output/temporary_storage/{selected_playlist_NAME}-{selected_playlist_ID}-full-dataset.csv", index=False)
-            
-            st.info('Now, proceed right away to ExtractRecommendations to generate up to 50 recommended songs based on SEED TRACKS from your playlist.')
\ No newline at end of file
+  # Combine the two dataframes
+  with Profiler.stage('merge'):
+    playlist_full_dataset = FeatureTable.mergeDataset(trackList_df, audioFeatures_df)
+
+  if playlist_full_dataset is not None:
+      
+      with Profiler.stage('full dataset CSV'):
+          playlist_full_dataset_csv = Storage.toCSVBytes(playlist_full_dataset)
+      
+      if st.download_button(
+          label='Merge and Download Full Dataset',
+          data=playlist_full_dataset_csv,
+          file_name=f'{selected_playlist_NAME.title()}-full-dataset.csv',
+          mime='text/csv',
+      ):
+          st.balloons()
+          
+          # Save to temporary_storage as well
+          with Profiler.stage('save full dataset'):
+              full_dataset_path = Storage.saveArtifact(playlist_full_dataset, Storage.artifactName(selected_playlist_NAME, selected_playlist_ID, Storage.FULL_DATASET))
+          PlaylistCatalog.getCatalog().addArtifact(selected_playlist_ID, Storage.FULL_DATASET, full_dataset_path)
+          
+          st.info('Now, proceed right away to ExtractRecommendations to generate up to 50 recommended songs based on SEED TRACKS from your playlist.')
+
+profiler.finish()
@@ -4,12 +4,24 @@ from tabulate import tabulate
 import pandas as pd
 from utilities import ExtractRecommendedTracks as Recommend
 from utilities import Tracks
+from utilities import SpotifyAuth
+from utilities import Storage
+from utilities import PlaylistCatalog
+from utilities import LocalRecommender
+from utilities import SeedSelection
+from utilities import RecommendationHarvester
+from utilities import MetricsPanel
+from utilities import Profiler
 
 st.set_page_config(
   page_title="3 - Extract Recommended Songs",
   page_icon="🎶"
 )
 
+profiler = Profiler.startRerun('3_ExtractRecommendations')
+
+MetricsPanel.renderMetricsPanel()
+
 st.header('🎶 Extract Recommended Songs')
 
 # Description
@@ -23,38 +35,80 @@ recommended_tracks_df = None
 
 # Get session state variables
 if 'playlistInfo' not in st.session_state or st.session_state['playlistInfo'] is None:
-  # Check if there's any existing Playlist data inside the `output/playlist` directory
-  if not os.listdir('output/playlist'):
+  # Check if there's any existing Playlist data in the catalog of the playlists saved in the `output/playlist` directory
+  available_playlists = PlaylistCatalog.getCatalog().listPlaylists()
+  if not available_playlists:
     st.error('You have not pulled any playlist yet. Please go to the **🏠 Home** page first and extract a public playlist.')
     st.stop()
   else:
-    # Get the latest playlist
-    available_playlists = [x.split('--')[0] for x in os.listdir('output/playlist')]
-    availably_playlist_IDs = [x.split('--')[1] for x in os.listdir('output/playlist')]
-
-    # Show the available playlist data to select from
+    # Show the available playlist data to select from, the latest playlist first
     st.subheader('**Available Playlist Data**')
-    selected_playlist_NAME = st.selectbox(
+    selected_playlist = st.selectbox(
       label='Select a playlist to view the data',
       options=available_playlists,
+      format_func=lambda playlist: playlist['name'],
       key='playlist_data_selection',
     )
-    selected_playlist_ID = availably_playlist_IDs[available_playlists.index(selected_playlist_NAME)].removesuffix(".json")
+    selected_playlist_NAME = selected_playlist['name']
+    selected_playlist_ID = selected_playlist['playlist_id']
     
     st.success(f'You have selected the playlist: **{selected_playlist_NAME}** with ID: **{selected_playlist_ID}**')
 else:
   selected_playlist_NAME = st.session_state['playlistInfo']['name']
   selected_playlist_ID = st.session_state['playlistInfo']['id']
   
+# Columns of the full dataset needed to pick the seed tracks (every audio feature used by SeedSelection) and generate the recommendations
+full_dataset_columns = ['id', 'name'] + LocalRecommender.FEATURE_COLUMNS
+
 # Read the full dataset from the "output/temporary_storage" folder
 try:
-  full_dataset = pd.read_csv(f"output/temporary_storage/{selected_playlist_NAME}-{selected_playlist_ID}-full-dataset.csv")
+  with Profiler.stage('load full dataset'):
+    full_dataset = Storage.loadCatalogArtifact(
+      PlaylistCatalog.getCatalog().get(selected_playlist_ID),
+      Storage.FULL_DATASET,
+      columns=full_dataset_columns
+    )
 except:
   st.error(f'There is no FULL DATASET generated for {selected_playlist_NAME} yet. Please go to the **🏠 Home** or **📊 Merge Dataset** page first and generate the FULL DATASET for this playlist.')
   st.stop()
 
 st.header('Full Dataset')
-st.dataframe(full_dataset)
+with Profiler.stage('render full dataset'):
+  st.dataframe(full_dataset)
+
+# Harvest many rounds of recommendations automatically instead of generating them one round at a time
+with st.expander('Harvest Recommended Tracks Automatically'):
+  st.write('Runs rounds of 5 seed tracks from the FULL DATASET concurrently, dropping duplicates and tracks already in the playlist, until the target number of unique recommended tracks is reached.')
+  
+  target_count = st.number_input(
+    label='Number of Unique Recommended Tracks to Harvest',
+    min_value=1,
+    max_value=1000,
+    value=RecommendationHarvester.DEFAULT_TARGET_COUNT,
+    step=1,
+    key='harvest_target_count_input'
+  )
+  
+  if st.button('Harvest Recommended Tracks'):
+    progress_bar = st.progress(0.0)
+    with Profiler.stage('harvest recommendations'):
+      harvested_tracks_df = RecommendationHarvester.harvestRecommendations(
+        SpotifyAuth.getAccessToken(),
+        full_dataset,
+        target_count=target_count,
+        progress_callback=lambda num_tracks, num_rounds: progress_bar.progress(min(1.0, num_tracks / target_count))
+      )
+    
+    st.write(f'There are {len(harvested_tracks_df)} unique recommended tracks.')
+    st.dataframe(harvested_tracks_df)
+    
+    st.download_button(
+      label='Download Harvested Recommended Tracks as CSV',
+      data=Storage.toCSVBytes(harvested_tracks_df),
+      file_name=f'{selected_playlist_NAME.title()}-recommended-tracks.csv',
+      mime='text/csv',
+      key='harvested_tracks_download_button'
+    )
 
 # Extract the recommended songs
 if full_dataset is not None:
@@ -66,17 +120,25 @@ if full_dataset is not None:
   st.sidebar.write('Choose **three** songs from the dataset that you want to use as seed tracks. They shall be chosen such that they are the **most representative** of the main CHARACTERISTIC of the playlist.')
   
   # Gather all the track 'names' from the FULL DATASET and use them as options for the selectbox. Enable multiple selection and searching. Limit to 3 selections, and default to the first 3 tracks.
-  playlist_tracks = full_dataset['name'].tolist()
+  with Profiler.stage('seed options'):
+    playlist_tracks = full_dataset['name'].tolist()
+    
+    # Make sure to convert the track names into title case
+    options = [x.title() for x in playlist_tracks]
   
-  # Make sure to convert the track names into title case
-  options = [x.title() for x in playlist_tracks]
+  # Optionally pre-select the seed tracks that best cover the audio features of the playlist
+  suggested_seed_tracks = []
+  if st.sidebar.checkbox('Suggest representative seed tracks automatically', key='suggest_seed_tracks_checkbox'):
+    with Profiler.stage('suggest seed tracks'):
+      # Tracks with the same title would show up twice in the defaults of the multiselect, so only the first one is kept
+      suggested_seed_tracks = list(dict.fromkeys(options[x] for x in SeedSelection.selectSeedIndices(full_dataset)))
   
   main_seed_tracks = st.sidebar.multiselect(
     label='Select three songs from the dataset',
     label_visibility='hidden',
     options=options,
     max_selections=3,
-    # default=options[:3],
+    default=suggested_seed_tracks[:3],
     key='main_seed_tracks'
   )
   
@@ -89,14 +151,15 @@ if full_dataset is not None:
     label='Select two songs from the dataset',
     label_visibility='hidden',
     options=options,
-    default=options[-2:],
+    default=suggested_seed_tracks[3:] or options[-2:],
     key='additional_seed_tracks'
   )
   
   # Get the index in 'options' of the selected tracks
   if main_seed_tracks and additional_seed_tracks:
     seed_tracks = main_seed_tracks + additional_seed_tracks
-    seed_tracks_idx = [ options.index(x) for x in seed_tracks]
+    with Profiler.stage('seed index lookup'):
+      seed_tracks_idx = [ options.index(x) for x in seed_tracks]
   else:
     st.error('You have not selected or completed the list of seed tracks yet.')
     st.stop()
@@ -108,14 +171,24 @@ if full_dataset is not None:
       st.markdown(f'* {track}')
       
     # Get the track infos for the corresponding seed_tracks_idx
-    seedTrackInfos = full_dataset.iloc[seed_tracks_idx].to_dict('records')
+    with Profiler.stage('seed track infos'):
+      seedTrackInfos = full_dataset.iloc[seed_tracks_idx].to_dict('records')
     st.dataframe(pd.DataFrame(seedTrackInfos))
     
-    # Create a number input from 1 to 100 only for the number of recommended tracks to generate
+    # Choose between Spotify's recommendations and the local nearest-neighbour search over the cached audio features
+    recommendation_source = st.radio(
+      label='Recommendation Source',
+      options=('Spotify API', 'Local (Cached Audio Features)'),
+      horizontal=True,
+      key='recommendation_source_radio'
+    )
+    use_local_recommender = recommendation_source != 'Spotify API'
+    
+    # Create a number input for the number of recommended tracks to generate. Spotify's API returns at most 50 tracks per request.
     num_tracks = st.number_input(
       label='Number of Recommended Tracks to Generate',
       min_value=1,
-      max_value=50,
+      max_value=500 if use_local_recommender else 50,
       value=50,
       step=1,
       key='num_tracks_input'
@@ -130,11 +203,25 @@ if full_dataset is not None:
         st.info('The recommended tracks will be generated based on the seed tracks you have selected. The recommended tracks will be saved in the **output/recommended_tracks** folder.')
         
         # Generate the recommended tracks
-        recommended_tracks = Recommend.generateRecommendations(
-          st.session_state['spotify_access_token'],
-          seedTrackInfos=seedTrackInfos,
-          num_tracks=num_tracks
-        )
+        if use_local_recommender:
+          try:
+            with Profiler.stage('local recommendations'):
+              recommended_tracks = LocalRecommender.generateRecommendations(
+                seedTrackInfos=seedTrackInfos,
+                num_tracks=num_tracks,
+                exclude_ids=full_dataset['id'].tolist(),
+                access_token=SpotifyAuth.getAccessToken()
+              )
+          except ValueError as e:
+            st.error(f'Error: {e}')
+            st.stop()
+        else:
+          with Profiler.stage('spotify recommendations'):
+            recommended_tracks = Recommend.generateRecommendations(
+              SpotifyAuth.getAccessToken(),
+              seedTrackInfos=seedTrackInfos,
+              num_tracks=num_tracks
+            )
         
         st.balloons()
         
@@ -146,9 +233,11 @@ if full_dataset is not None:
         st.info('**DOWNLOAD** then open the downloaded CSV file and **manually label** each recommended track as either **0** or **1** based on whether the recommended track indeed belongs to the playlist or not. Create a LABEL column on the file and save it.')
         
         # Download the recommended tracks as CSV
+        with Profiler.stage('recommended tracks CSV'):
+          recommended_tracks_csv = Storage.toCSVBytes(recommended_tracks_df)
         if st.download_button(
           label='Download Recommended Tracks as CSV',
-          data=recommended_tracks_df.to_csv(index=False).encode('utf-8'),
+          data=recommended_tracks_csv,
           file_name=f'{selected_playlist_NAME.title()}-recommended-tracks.csv',
           mime='text/csv',
         ):
@@ -158,4 +247,6 @@ if full_dataset is not None:
         st.error('You have not selected or completed the list of seed tracks yet.')
         st.stop()
   else:
-    st.error('You have not selected or completed the list of seed tracks yet.')
\ No newline at end of file
+    st.error('You have not selected or completed the list of seed tracks yet.')
+
+profiler.finish()
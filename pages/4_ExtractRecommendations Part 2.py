@@ -2,12 +2,20 @@ import streamlit as st
 import pandas as pd
 from utilities import ExtractRecommendedTracks as Recommend
 from utilities import Tracks
+from utilities import SpotifyAuth
+from utilities import Storage
+from utilities import MetricsPanel
+from utilities import Profiler
 
 st.set_page_config(
   page_title="4 - Extract Recommended Songs Again",
   page_icon="🎶"
 )
 
+profiler = Profiler.startRerun('4_ExtractRecommendations Part 2')
+
+MetricsPanel.renderMetricsPanel()
+
 st.header('🎶 Extract Recommended Songs AGAIN')
 st.info('You use this page **AFTER** labelling the initial list of recommended songs as either 0 or 1 based on whether the recommended track indeed belongs to the playlist or not. This is a MANUAL LABELLING process. In this page, you will be able to extract another list of recommended songs based on the labelled recommended songs.')
 
@@ -30,7 +38,8 @@ uploaded_file = st.file_uploader(
 # Get the uploaded file
 if uploaded_file is not None:
     # Read the CSV file
-    raw_csv_df = pd.read_csv(uploaded_file)
+    with Profiler.stage('read upload'):
+        raw_csv_df = pd.read_csv(uploaded_file)
     
     # Check if a column called LABEL exists
     if 'LABEL' not in raw_csv_df.columns:
@@ -69,10 +78,15 @@ if uploaded_file is not None:
         st.stop()
     elif len(seed_tracks_IDs) == 5:
         # Get the AUDIO FEATURES of the selected seed tracks
-        seed_tracks_audio_features = Tracks.getAudioFeatures(
-            st.session_state['spotify_access_token'],
-            seed_tracks_IDs,
-        )
+        with Profiler.stage('audio features'):
+            seed_tracks_audio_features = Tracks.getCachedAudioFeatures(
+                SpotifyAuth.getAccessToken(),
+                seed_tracks_IDs,
+            )
+        
+        if seed_tracks_audio_features.attrs.get('failed_ids'):
+            st.error(f"The audio features could not be extracted for these seed tracks: {seed_tracks_audio_features.attrs['failed_ids']}. Please try again.")
+            st.stop()
         
         st.success('The audio features for the selected seed tracks have been extracted successfully.')
         
@@ -89,11 +103,12 @@ if uploaded_file is not None:
         )
         
         # Generate the next list of recommended tracks
-        recommended_tracks_df = Recommend.generateRecommendations(
-            st.session_state['spotify_access_token'],
-            seedTrackInfos=seed_tracks_audio_features.to_dict('records'),
-            num_tracks=num_tracks,
-        )
+        with Profiler.stage('recommendations'):
+            recommended_tracks_df = Recommend.generateRecommendations(
+                SpotifyAuth.getAccessToken(),
+                seedTrackInfos=seed_tracks_audio_features.to_dict('records'),
+                num_tracks=num_tracks,
+            )
         
         st.success('The new list of recommended tracks have been generated successfully.')
         
@@ -107,13 +122,17 @@ if uploaded_file is not None:
         st.dataframe(new_recommended_tracks_df)
         
         # Create a download button and tag it with the current date and time
+        with Profiler.stage('recommended tracks CSV'):
+            new_recommended_tracks_csv = Storage.toCSVBytes(new_recommended_tracks_df)
         download_button = st.download_button(
             label='Download Latest Recommended Tracks as CSV',
-            data=new_recommended_tracks_df.to_csv(index=False).encode('utf-8'),
+            data=new_recommended_tracks_csv,
             file_name=f'latest-recommended-tracks-{pd.Timestamp.now().strftime("%Y-%m-%d-%H-%M-%S")}.csv',
         )
         
         st.balloons()
         st.success(' AGAIN, Open the downloaded CSV file and **manually label** each NEWLY recommended track as either **0** or **1** based on whether the recommended track indeed belongs to the playlist or not. Create a LABEL column on the file and save it. **RE-UPLOAD IT ON THIS PAGE** until all 200 recommended tracks have been labelled.')
     else:
-        st.stop()
\ No newline at end of file
+        st.stop()
+
+profiler.finish()
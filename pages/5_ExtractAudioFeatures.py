@@ -1,12 +1,20 @@
 import streamlit as st
 import pandas as pd
 from utilities import Tracks
+from utilities import SpotifyAuth
+from utilities import Storage
+from utilities import MetricsPanel
+from utilities import Profiler
 
 st.set_page_config(
   page_title="5 - Extract Audio Features of Recommended Tracks",
   page_icon="🎻"
 )
 
+profiler = Profiler.startRerun('5_ExtractAudioFeatures')
+
+MetricsPanel.renderMetricsPanel()
+
 st.header('🎻 Extract Audio Features of Recommended Tracks')
 st.info('Once all the RECOMMENDED TRACKS have been generated **and labelled**, you can use this page to extract the corresponding AUDIO FEATURES for each recommended track.')
 
@@ -29,7 +37,8 @@ target_num_tracks = 200
 # Get the uploaded file
 if uploaded_file is not None:
     # Read the CSV file
-    raw_csv_df = pd.read_csv(uploaded_file)
+    with Profiler.stage('read upload'):
+        raw_csv_df = pd.read_csv(uploaded_file)
     
     # Check if a column called LABEL exists
     if 'LABEL' not in raw_csv_df.columns:
@@ -60,16 +69,19 @@ if uploaded_file is not None:
     # Extract the audio features of the recommended tracks
 if st.button(f'Extract AUDIO Features of the {target_num_tracks} Recommended Tracks'):
         # Extract the audio features of the recommended tracks
-        recommended_tracks_audio_features = Tracks.getAudioFeatures(
-            st.session_state['spotify_access_token'],
-            raw_csv_df['id'].values
-        )
+        with Profiler.stage('audio features'):
+            recommended_tracks_audio_features = Tracks.getCachedAudioFeatures(
+                SpotifyAuth.getAccessToken(),
+                raw_csv_df['id'].values
+            )
         
         # Display success once the audio features have been extracted
         while recommended_tracks_audio_features is None:
             st.spinner()
         st.balloons()
         st.success(f"Audio features have been extracted successfully.")
+        if recommended_tracks_audio_features.attrs.get('failed_ids'):
+            st.warning(f"Audio features could not be extracted for {len(recommended_tracks_audio_features.attrs['failed_ids'])} tracks: {recommended_tracks_audio_features.attrs['failed_ids']}")
         
         # Save to the global variable
         recommended_tracks_audio_features_df = pd.DataFrame(recommended_tracks_audio_features)
@@ -88,9 +100,11 @@ if st.button(f'Extract AUDIO Features of the {target_num_tracks} Recommended Tra
             # )
             
             # Download as CSV file
+            with Profiler.stage('audio features CSV'):
+                recommended_tracks_audio_features_csv = Storage.toCSVBytes(recommended_tracks_audio_features_df)
             if st.download_button(
                 label='Download Recommended Tracks with Audio Features as CSV',
-                data=recommended_tracks_audio_features_df.to_csv(index=False).encode('utf-8'),
+                data=recommended_tracks_audio_features_csv,
                 # file_name=f'{playlist_NAME.title()}-{playlist_ID}-recommended-tracks-with-audio-features.csv',
                 file_name=f'latest-recommended-tracks-with-audio-features.csv',
                 mime='text/csv',
@@ -99,6 +113,8 @@ if st.button(f'Extract AUDIO Features of the {target_num_tracks} Recommended Tra
                 
                 # Save to temporary_storage as well
                 # recommended_tracks_audio_features_df.to_csv(f'output/temporary_storage/{playlist_NAME}-{playlist_ID}-recommended-tracks-with-audio-features.csv', index=False)
-                recommended_tracks_audio_features_df.to_csv(f'output/temporary_storage/latest-recommended-tracks-with-audio-features.csv', index=False)
+                Storage.saveArtifact(recommended_tracks_audio_features_df, 'latest-recommended-tracks-with-audio-features')
                 
-                st.success('The recommended tracks with their corresponding audio features have been saved successfully.')
\ No newline at end of file
+                st.success('The recommended tracks with their corresponding audio features have been saved successfully.')
+
+profiler.finish()
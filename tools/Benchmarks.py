@@ -0,0 +1,271 @@
+# Micro-benchmarks of the CPU-bound stages of the pipeline on synthetic playlists of growing size, to find the stage that stops scaling
+# first. Every stage is timed (best of --repeats runs) and its peak memory is measured in a separate run under tracemalloc, so that tracing
+# does not slow down the timed runs. The results are written as JSON and can be compared with the results of another commit.
+#
+# USAGE:
+#   python -m tools.Benchmarks --sizes 1k,10k,100k --json output/benchmarks/$(git rev-parse --short HEAD).json
+#   python -m tools.Benchmarks --sizes 1k,10k,100k,1M --compare output/benchmarks/baseline.json
+#
+# The synthetic tracks and audio features are the same as those served by tools/MockSpotifyServer.py.
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import pandas as pd
+from utilities import Playlists, Storage, FeatureTable
+from utilities import ExtractRecommendedTracks as Recommend
+from tools import MockSpotifyServer
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+# Seed tracks per recommendation round, as on page 3
+NUM_SEEDS = 5
+
+
+def parseSize(size):
+    '''
+    Parses a playlist size such as "5000", "10k" or "1M".
+    '''
+    size = size.strip().lower()
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(size[-1:], 1)
+
+    return int(float(size.rstrip('km')) * multiplier)
+
+
+def generatePlaylistData(num_tracks, catalog_size=None):
+    '''
+    Generates the items of a synthetic playlist, as returned by Spotify's API. With a `catalog_size` smaller than `num_tracks`, some tracks
+    appear more than once.
+    '''
+    catalog_size = catalog_size or num_tracks * 10
+
+    return [
+        {
+            'added_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(1_600_000_000 + position * 3600)),
+            'track': MockSpotifyServer.makeTrack(MockSpotifyServer.stableHash('benchmark', position) % catalog_size),
+        }
+        for position in range(num_tracks)
+    ]
+
+
+def generateAudioFeatures(track_ids):
+    '''
+    Generates the audio features of the given tracks, as returned by Spotify's API.
+    '''
+    return [MockSpotifyServer.makeAudioFeatures(track_id) for track_id in dict.fromkeys(track_ids)]
+
+
+# Stages. Each one takes the benchmark context (the synthetic data and the results of the previous stages) and returns its result, which
+# is stored in the context under the name of the stage.
+
+def extractTracks(context):
+    return Playlists.extractTracks(context['playlist_data'])
+
+
+def buildAudioFeatures(context):
+    # Same conversion as Tracks.getAudioFeatures
+    return FeatureTable.AudioFeatureTable.fromRecords(context['audio_features']).toDataFrame()
+
+
+def mergeDataset(context):
+    # Same merge as pages/2_MergeDataset.py
+    return FeatureTable.mergeDataset(context['extract_tracks'], context['build_audio_features'])
+
+
+def seedIndexLookup(context):
+    # Same lookup as pages/3_ExtractRecommendations.py: title-cased options, then the index of each selected name (the last ones, which is
+    # the worst case of `list.index`), then the records of the seed tracks
+    full_dataset = context['merge_dataset']
+    options = [x.title() for x in full_dataset['name'].tolist()]
+    seed_tracks = options[-NUM_SEEDS:]
+    seed_tracks_idx = [options.index(x) for x in seed_tracks]
+
+    return full_dataset.iloc[seed_tracks_idx].to_dict('records')
+
+
+def recommendationAttributes(context):
+    # The seed tracks of page 3, then every track of the dataset to show how the function scales with its input
+    Recommend.getRecommendationAttributes(context['seed_index_lookup'])
+
+    return Recommend.getRecommendationAttributes(context['merge_dataset'].to_dict('records'))
+
+
+def saveCSV(context):
+    path = os.path.join(context['directory'], 'full-dataset.csv')
+    context['merge_dataset'].to_csv(path, index=False)
+
+    return path
+
+
+def loadCSV(context):
+    return pd.read_csv(context['save_csv'])
+
+
+def saveJSON(context):
+    # NDJSON playlist file, as saved in output/playlist before the track store
+    path = os.path.join(context['directory'], 'playlist.ndjson')
+    with open(path, 'w') as f:
+        f.writelines(json.dumps(item) + '\n' for item in context['playlist_data'])
+
+    return path
+
+
+def loadJSON(context):
+    return list(Playlists.loadPlaylistItems(context['save_json']))
+
+
+def saveParquet(context):
+    return Storage.saveArtifact(context['merge_dataset'], 'full-dataset', context['directory'])
+
+
+def loadParquet(context):
+    return Storage.loadArtifact('full-dataset', directory=context['directory'])
+
+
+STAGES = [
+    ('extract_tracks', extractTracks),
+    ('build_audio_features', buildAudioFeatures),
+    ('merge_dataset', mergeDataset),
+    ('seed_index_lookup', seedIndexLookup),
+    ('recommendation_attributes', recommendationAttributes),
+    ('save_csv', saveCSV),
+    ('load_csv', loadCSV),
+    ('save_json', saveJSON),
+    ('load_json', loadJSON),
+    ('save_parquet', saveParquet),
+    ('load_parquet', loadParquet),
+]
+
+
+def measureStage(function, context, repeats):
+    '''
+    Times a stage (best and mean of `repeats` runs), then runs it once more under tracemalloc to measure its peak memory.
+
+    OUTPUT:
+        result: The result of the stage.
+        measurement (dict): 'best_seconds', 'mean_seconds' and 'peak_bytes' (allocated on top of what was allocated before the stage).
+    '''
+    timings = []
+    for _ in range(repeats):
+        gc.collect()
+        start_time = time.perf_counter()
+        result = function(context)
+        timings.append(time.perf_counter() - start_time)
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    result = function(context)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, {
+        'best_seconds': round(min(timings), 6),
+        'mean_seconds': round(sum(timings) / len(timings), 6),
+        'peak_bytes': peak - baseline,
+    }
+
+
+def runBenchmarks(sizes=DEFAULT_SIZES, repeats=3, stages=None):
+    '''
+    Runs the selected stages (all by default) for every playlist size.
+
+    OUTPUT:
+        results (list of dicts): One entry per size and stage with the size, the stage and its measurement.
+    '''
+    selected_stages = [(name, function) for name, function in STAGES if stages is None or name in stages]
+    results = []
+
+    for size in sizes:
+        print(f"Generating {size:,} synthetic tracks...", flush=True)
+        playlist_data = generatePlaylistData(size)
+        audio_features = generateAudioFeatures(item['track']['id'] for item in playlist_data)
+
+        with tempfile.TemporaryDirectory() as directory:
+            context = {'playlist_data': playlist_data, 'audio_features': audio_features, 'directory': directory}
+
+            for name, function in STAGES:
+                if (name, function) in selected_stages:
+                    context[name], measurement = measureStage(function, context, repeats)
+                    results.append({'size': size, 'stage': name, **measurement})
+                    print(f"{size:>10,} {name:<28} {measurement['best_seconds']:>10.4f} s {measurement['peak_bytes'] / 2 ** 20:>10.1f} MiB", flush=True)
+                else:
+                    # The later stages may still need its result
+                    context[name] = function(context)
+
+    return results
+
+
+def getEnvironment():
+    '''
+    Describes where the benchmarks ran, so that results from different commits or machines are not compared by mistake.
+    '''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+
+
+def compareResults(results, baseline_results):
+    '''
+    Prints the ratio of every measurement to the same size and stage in the baseline results (above 1 means slower or bigger).
+    '''
+    baseline = {(entry['size'], entry['stage']): entry for entry in baseline_results}
+
+    print(f"\n{'size':>10} {'stage':<28} {'time ratio':>10} {'memory ratio':>12}")
+    for entry in results:
+        previous = baseline.get((entry['size'], entry['stage']))
+        if previous is None:
+            continue
+
+        time_ratio = entry['best_seconds'] / previous['best_seconds'] if previous['best_seconds'] else float('nan')
+        memory_ratio = entry['peak_bytes'] / previous['peak_bytes'] if previous['peak_bytes'] else float('nan')
+        print(f"{entry['size']:>10,} {entry['stage']:<28} {time_ratio:>10.2f} {memory_ratio:>12.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the CPU-bound stages of the pipeline on synthetic playlists.')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)), help='Comma-separated playlist sizes, e.g. 1k,10k,100k,1M.')
+    parser.add_argument('--repeats', type=int, default=3, help='Number of timed runs per stage (default: 3).')
+    parser.add_argument('--stages', help=f"Comma-separated stages to measure (default: all). Available: {', '.join(name for name, _ in STAGES)}.")
+    parser.add_argument('--json', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with.')
+    arguments = parser.parse_args(argv)
+
+    sizes = [parseSize(size) for size in arguments.sizes.split(',') if size.strip()]
+    stages = set(arguments.stages.split(',')) if arguments.stages else None
+
+    results = runBenchmarks(sizes, arguments.repeats, stages)
+
+    if arguments.json:
+        os.makedirs(os.path.dirname(arguments.json) or '.', exist_ok=True)
+        with open(arguments.json, 'w') as f:
+            json.dump({'environment': getEnvironment(), 'repeats': arguments.repeats, 'results': results}, f, indent=2)
+
+    if arguments.compare:
+        with open(arguments.compare) as f:
+            compareResults(results, json.load(f)['results'])
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+# Load generator for throughput testing of the request layer. It drives the real `utilities` functions (token, pagination, audio features,
+# recommendations) against the mock Spotify server, or any other server exposing the same API, and reports the number of requests, the
+# requests per second, the p50/p99 latency and the wall time of every stage.
+#
+# USAGE:
+#   python -m tools.LoadGenerator --playlist-size 10000 --latency 0.05 --jitter 0.05 --rate-429 0.01
+#   python -m tools.LoadGenerator --base-url http://127.0.0.1:8765 --json output/load-test.json
+#
+# Without --base-url, a mock server is started in-process with the given fault-injection options.
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from utilities import SpotifyClient, SpotifyAuth, Playlists, Tracks, AudioFeaturesCache, FeatureStore, ExtractRecommendedTracks, RecommendationHarvester, FeatureTable
+from tools import MockSpotifyServer
+
+
+class TimingClient(SpotifyClient.SpotifyClient):
+    '''
+    SpotifyClient recording the latency and status of every request it sends, grouped by the current stage of the load test.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stage = None
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        start_time = time.perf_counter()
+        status = None
+        try:
+            response = super().request(method, url, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            with self.lock:
+                self.samples.setdefault(self.stage, []).append((time.perf_counter() - start_time, status))
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def runStage(client, name, function, report):
+    '''
+    Runs one stage of the load test and appends its statistics to the report.
+    '''
+    client.stage = name
+    start_time = time.perf_counter()
+    result = function()
+    wall_time = time.perf_counter() - start_time
+
+    samples = client.samples.get(name, [])
+    latencies = sorted(latency for latency, _ in samples)
+    statuses = {}
+    for _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    stage_report = {
+        'stage': name,
+        'requests': len(samples),
+        'wall_seconds': round(wall_time, 4),
+        'requests_per_second': round(len(samples) / wall_time, 2) if wall_time > 0 else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        'statuses': statuses,
+    }
+    report.append(stage_report)
+
+    print(
+        f"{name:<28} {stage_report['requests']:>7} req {stage_report['wall_seconds']:>9.3f} s "
+        f"{stage_report['requests_per_second'] or 0:>9.1f} req/s  p50 {stage_report['p50_ms'] or 0:>8.2f} ms  p99 {stage_report['p99_ms'] or 0:>8.2f} ms"
+    )
+
+    return result
+
+
+def runLoadTest(playlist_id, max_workers=8, target_count=200):
+    '''
+    Runs every stage against the server the utilities currently point at.
+
+    OUTPUT:
+        report (list of dicts): The statistics of every stage.
+    '''
+    client = SpotifyClient.setClient(TimingClient(pool_maxsize=max(SpotifyClient.DEFAULT_POOL_MAXSIZE, max_workers * 2)))
+    report = []
+
+    access_token = runStage(client, 'token', lambda: SpotifyAuth.getAppAccessToken()['access_token'], report)
+
+    runStage(client, 'playlist (sequential)', lambda: Playlists.getPublicPlaylist(access_token, playlist_id, parallel=False), report)
+    playlist_info, playlist_data = runStage(
+        client,
+        'playlist (parallel)',
+        lambda: Playlists.getPublicPlaylist(access_token, playlist_id, parallel=True, max_workers=max_workers),
+        report
+    )
+    if 'error' in playlist_info:
+        raise RuntimeError(f"Could not fetch the playlist: {playlist_info['error']}")
+
+    tracks_df = runStage(client, 'extract tracks', lambda: Playlists.extractTracks(playlist_data), report)
+    track_ids = list(dict.fromkeys(tracks_df['id']))
+
+    # A throwaway cache and feature store, so that the cold run really requests every track and the real ones are left untouched
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = AudioFeaturesCache.AudioFeaturesCache(os.path.join(cache_dir, 'audio_features.sqlite'))
+        store = FeatureStore.FeatureStore(os.path.join(cache_dir, 'feature_store'))
+        getAudioFeatures = lambda: Tracks.getAudioFeatures(access_token, track_ids, cache=cache, store=store)
+        runStage(client, 'audio features (cold)', getAudioFeatures, report)
+        audio_features_df = runStage(client, 'audio features (warm)', getAudioFeatures, report)
+
+    if target_count and len(audio_features_df):
+        full_dataset = FeatureTable.mergeDataset(tracks_df, audio_features_df)
+
+        # Memoized answers from an earlier run would hide the requests
+        ExtractRecommendedTracks.requestRecommendations.cache.invalidate()
+        runStage(
+            client,
+            'recommendations (harvest)',
+            lambda: RecommendationHarvester.harvestRecommendations(access_token, full_dataset, target_count=target_count, random_seed=0),
+            report
+        )
+
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the throughput of the request layer against a (mock) Spotify API.')
+    parser.add_argument('--base-url', help='Root URL of a running server (Web API under /v1). Defaults to an in-process mock server.')
+    parser.add_argument('--playlist-id', help='Playlist to request. Defaults to a mock playlist of --playlist-size items.')
+    parser.add_argument('--workers', type=int, default=8, help='Maximum number of concurrent page requests (default: 8).')
+    parser.add_argument('--target-count', type=int, default=200, help='Number of recommended tracks to harvest (0 to skip the stage).')
+    parser.add_argument('--json', help='Write the report to this JSON file.')
+    MockSpotifyServer.addConfigArguments(parser)
+    arguments = parser.parse_args(argv)
+
+    server = None
+    base_url = arguments.base_url
+    if base_url is None:
+        server, base_url = MockSpotifyServer.startServer(config=MockSpotifyServer.configFromArguments(arguments))
+
+    # The mock server accepts any credentials
+    os.environ.setdefault('SPOTIFY_CLIENT_ID', 'mock-client-id')
+    os.environ.setdefault('SPOTIFY_CLIENT_SECRET', 'mock-client-secret')
+    SpotifyClient.configureBaseURLs(api_base_url=f"{base_url.rstrip('/')}/v1", accounts_base_url=base_url)
+
+    playlist_id = arguments.playlist_id or f"mock-{arguments.playlist_size}"
+    print(f"Load test of {base_url} with playlist {playlist_id}")
+
+    try:
+        report = runLoadTest(playlist_id, max_workers=arguments.workers, target_count=arguments.target_count)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    if arguments.json:
+        os.makedirs(os.path.dirname(arguments.json) or '.', exist_ok=True)
+        with open(arguments.json, 'w') as f:
+            json.dump({'base_url': base_url, 'playlist_id': playlist_id, 'arguments': vars(arguments), 'stages': report}, f, indent=2)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
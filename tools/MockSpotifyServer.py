@@ -0,0 +1,383 @@
+# Local stand-in for the parts of Spotify's Web API and Accounts service used by `utilities/`. It serves synthetic, deterministic data of
+# configurable size and can inject latency, throttling (429 with Retry-After) and server errors, so that pagination, batching and caching
+# changes can be measured offline and reproducibly.
+#
+# USAGE:
+#   python -m tools.MockSpotifyServer --port 8765 --latency 0.05 --rate-429 0.02
+#
+# Then point the utilities at it:
+#   SPOTIFY_API_BASE_URL=http://127.0.0.1:8765/v1 SPOTIFY_ACCOUNTS_BASE_URL=http://127.0.0.1:8765 \
+#   SPOTIFY_CLIENT_ID=mock SPOTIFY_CLIENT_SECRET=mock streamlit run Home.py
+#
+# The number of items of a playlist is taken from the end of its ID (e.g. "mock-5000" has 5000 items), or is --playlist-size otherwise.
+
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+BASE62 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+
+PAGE_LIMIT = 100
+MAX_AUDIO_FEATURES_IDS = 100
+MAX_TRACKS_IDS = 50
+
+
+@dataclass
+class MockConfig:
+    '''
+    Size of the synthetic data and faults injected by the mock server.
+
+    INPUT:
+        playlist_size (int): Number of items of a playlist whose ID does not end with its size.
+        catalog_size (int): Number of distinct tracks the playlists and recommendations are drawn from. A smaller catalog means more tracks
+            shared between playlists.
+        latency (float): Base latency added to every response, in seconds.
+        jitter (float): Maximum random latency added on top of `latency`, in seconds.
+        rate_429 (float): Probability of answering 429 Too Many Requests.
+        retry_after (int): Value of the Retry-After header of the 429 responses, in seconds.
+        error_rate (float): Probability of answering 500 Internal Server Error.
+        missing_features_rate (float): Probability that a track has no audio features (null in /audio-features).
+    '''
+    playlist_size: int = 1000
+    catalog_size: int = 100_000
+    latency: float = 0.0
+    jitter: float = 0.0
+    rate_429: float = 0.0
+    retry_after: int = 1
+    error_rate: float = 0.0
+    missing_features_rate: float = 0.0
+
+
+def stableHash(*parts):
+    return int.from_bytes(hashlib.blake2b(':'.join(map(str, parts)).encode(), digest_size=8).digest(), 'big')
+
+
+def trackID(number):
+    '''
+    22-character base62 ID of the synthetic track with the given catalog number, like Spotify's IDs.
+    '''
+    digits = []
+    value = stableHash('track', number)
+    for _ in range(22):
+        value, digit = divmod(value, 62)
+        digits.append(BASE62[digit])
+        if value == 0:
+            value = stableHash('track', number, len(digits))
+
+    return ''.join(digits)
+
+
+def makeTrack(number):
+    rng = random.Random(number)
+    track_id = trackID(number)
+
+    return {
+        'id': track_id,
+        'name': f"Track {number}",
+        'album': {'name': f"Album {number // 10}"},
+        'artists': [{'name': f"Artist {rng.randrange(5000)}"} for _ in range(rng.randint(1, 3))],
+        'disc_number': 1,
+        'track_number': number % 10 + 1,
+        'duration_ms': rng.randint(90_000, 420_000),
+        'popularity': rng.randint(0, 100),
+        'uri': f"spotify:track:{track_id}",
+        'href': f"https://api.spotify.com/v1/tracks/{track_id}",
+    }
+
+
+@lru_cache(maxsize=4)
+def trackNumbers(catalog_size):
+    '''
+    Maps the ID of every synthetic track of the catalog back to its catalog number, for /tracks.
+    '''
+    return {trackID(number): number for number in range(catalog_size)}
+
+
+def makeAudioFeatures(track_id):
+    rng = random.Random(track_id)
+
+    return {
+        'danceability': round(rng.random(), 3),
+        'energy': round(rng.random(), 3),
+        'key': rng.randrange(12),
+        'loudness': round(rng.uniform(-30, 0), 3),
+        'mode': rng.randrange(2),
+        'speechiness': round(rng.random() * 0.5, 4),
+        'acousticness': round(rng.random(), 4),
+        'instrumentalness': round(rng.random() ** 3, 4),
+        'liveness': round(rng.random() * 0.8, 4),
+        'valence': round(rng.random(), 3),
+        'tempo': round(rng.uniform(60, 200), 3),
+        'type': 'audio_features',
+        'id': track_id,
+        'uri': f"spotify:track:{track_id}",
+        'track_href': f"https://api.spotify.com/v1/tracks/{track_id}",
+        'analysis_url': f"https://api.spotify.com/v1/audio-analysis/{track_id}",
+        'duration_ms': rng.randint(90_000, 420_000),
+        'time_signature': rng.choice([3, 4, 4, 4, 5]),
+    }
+
+
+class MockSpotifyHandler(BaseHTTPRequestHandler):
+    # Set on the server by `createServer`
+    config = MockConfig()
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    # Helpers
+
+    def sendJSON(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        extra_headers = dict(headers or {})
+
+        if 'gzip' in self.headers.get('Accept-Encoding', '') and len(body) > 1024:
+            body = gzip.compress(body, compresslevel=5)
+            extra_headers['Content-Encoding'] = 'gzip'
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in extra_headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def sendError(self, status, message, headers=None):
+        self.sendJSON(status, {'error': {'status': status, 'message': message}}, headers)
+
+    def injectFaults(self):
+        '''
+        Sleeps for the configured latency, then possibly answers with an injected 429 or 500. Returns True if a response was sent.
+        '''
+        config = self.config
+        time.sleep(config.latency + random.uniform(0, config.jitter))
+
+        draw = random.random()
+        if draw < config.rate_429:
+            self.sendError(429, 'API rate limit exceeded', {'Retry-After': str(config.retry_after)})
+            return True
+        if draw < config.rate_429 + config.error_rate:
+            self.sendError(500, 'Server error')
+            return True
+
+        return False
+
+    def baseURL(self):
+        return f"http://{self.headers.get('Host', '%s:%s' % self.server.server_address[:2])}"
+
+    # Endpoints
+
+    def do_POST(self):
+        # The body of the token request must be read even though it is not used
+        self.rfile.read(int(self.headers.get('Content-Length', 0) or 0))
+
+        if urlparse(self.path).path != '/api/token':
+            return self.sendError(404, 'Not found')
+        if self.injectFaults():
+            return
+
+        self.sendJSON(200, {'access_token': f"mock-{random.getrandbits(64):016x}", 'token_type': 'Bearer', 'expires_in': 3600})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            return self.sendError(401, 'No token provided')
+        if self.injectFaults():
+            return
+
+        match = re.fullmatch(r'/v1/playlists/([^/]+)(/tracks)?', url.path)
+        if match:
+            playlist_id, tracks = match.groups()
+            if tracks:
+                return self.sendPlaylistTracks(playlist_id, query)
+            return self.sendPlaylist(playlist_id, query)
+        if url.path == '/v1/tracks':
+            return self.sendTracks(query)
+        if url.path == '/v1/audio-features':
+            return self.sendAudioFeatures(query)
+        if url.path == '/v1/recommendations':
+            return self.sendRecommendations(query)
+
+        self.sendError(404, 'Not found')
+
+    def playlistSize(self, playlist_id):
+        match = re.search(r'(\d+)$', playlist_id)
+        return int(match.group(1)) if match else self.config.playlist_size
+
+    def playlistItems(self, playlist_id, offset, limit):
+        size = self.playlistSize(playlist_id)
+
+        return [
+            {
+                'added_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(1_600_000_000 + position * 3600)),
+                'track': makeTrack(stableHash(playlist_id, position) % self.config.catalog_size),
+            }
+            for position in range(offset, min(offset + limit, size))
+        ]
+
+    def tracksPage(self, playlist_id, offset, limit):
+        size = self.playlistSize(playlist_id)
+        base_url = f"{self.baseURL()}/v1/playlists/{playlist_id}/tracks"
+
+        return {
+            'href': f"{base_url}?offset={offset}&limit={limit}",
+            'items': self.playlistItems(playlist_id, offset, limit),
+            'limit': limit,
+            'offset': offset,
+            'total': size,
+            'next': f"{base_url}?offset={offset + limit}&limit={limit}" if offset + limit < size else None,
+            'previous': f"{base_url}?offset={max(0, offset - limit)}&limit={limit}" if offset > 0 else None,
+        }
+
+    def sendPlaylist(self, playlist_id, query):
+        snapshot_id = f"{stableHash('snapshot', playlist_id, self.playlistSize(playlist_id)):016x}"
+        etag = f'"{snapshot_id}"'
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        playlist = {
+            'id': playlist_id,
+            'name': f"Mock Playlist {playlist_id}",
+            'uri': f"spotify:playlist:{playlist_id}",
+            'description': 'Synthetic playlist served by the mock Spotify server.',
+            'owner': {'display_name': 'mock'},
+            'followers': {'total': stableHash('followers', playlist_id) % 100_000},
+            'snapshot_id': snapshot_id,
+        }
+        # With `fields`, only the header is requested (the mock does not filter the other fields)
+        if 'fields' not in query:
+            playlist['tracks'] = self.tracksPage(playlist_id, 0, PAGE_LIMIT)
+
+        self.sendJSON(200, playlist, {'ETag': etag})
+
+    def sendPlaylistTracks(self, playlist_id, query):
+        offset = int(query.get('offset', ['0'])[0])
+        limit = min(int(query.get('limit', [str(PAGE_LIMIT)])[0]), PAGE_LIMIT)
+
+        self.sendJSON(200, self.tracksPage(playlist_id, offset, limit))
+
+    def sendTracks(self, query):
+        track_ids = [track_id for track_id in query.get('ids', [''])[0].split(',') if track_id]
+        if not track_ids or len(track_ids) > MAX_TRACKS_IDS:
+            return self.sendError(400, 'invalid request')
+
+        numbers = trackNumbers(self.config.catalog_size)
+        self.sendJSON(200, {
+            'tracks': [makeTrack(numbers[track_id]) if track_id in numbers else None for track_id in track_ids]
+        })
+
+    def sendAudioFeatures(self, query):
+        track_ids = [track_id for track_id in query.get('ids', [''])[0].split(',') if track_id]
+        if not track_ids or len(track_ids) > MAX_AUDIO_FEATURES_IDS:
+            return self.sendError(400, 'invalid request')
+
+        self.sendJSON(200, {
+            'audio_features': [
+                None if stableHash('missing', track_id) % 10_000 < self.config.missing_features_rate * 10_000 else makeAudioFeatures(track_id)
+                for track_id in track_ids
+            ]
+        })
+
+    def sendRecommendations(self, query):
+        limit = min(int(query.get('limit', ['20'])[0]), 100)
+        seed_tracks = query.get('seed_tracks', [''])[0]
+        if not seed_tracks:
+            return self.sendError(400, 'invalid request')
+
+        # Deterministic per query, like a cache of Spotify's answers
+        rng = random.Random(self.path)
+        self.sendJSON(200, {
+            'seeds': [{'id': seed, 'type': 'TRACK'} for seed in seed_tracks.split(',')],
+            'tracks': [makeTrack(rng.randrange(self.config.catalog_size)) for _ in range(limit)],
+        })
+
+
+def createServer(host='127.0.0.1', port=0, config=None):
+    '''
+    Creates a threaded mock server. Port 0 picks a free port; the actual address is in `server.server_address`.
+    '''
+    handler = type('ConfiguredMockSpotifyHandler', (MockSpotifyHandler,), {'config': config or MockConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+
+    return server
+
+
+def startServer(host='127.0.0.1', port=0, config=None):
+    '''
+    Starts a mock server in a background thread.
+
+    OUTPUT:
+        server (ThreadingHTTPServer): The running server. Call `server.shutdown()` to stop it.
+        base_url (str): The root URL of the server, e.g. "http://127.0.0.1:54321".
+    '''
+    server = createServer(host, port, config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, f"http://{server.server_address[0]}:{server.server_address[1]}"
+
+
+def addConfigArguments(parser):
+    defaults = MockConfig()
+    parser.add_argument('--playlist-size', type=int, default=defaults.playlist_size, help='Items per playlist unless the ID ends with a number.')
+    parser.add_argument('--catalog-size', type=int, default=defaults.catalog_size, help='Number of distinct synthetic tracks.')
+    parser.add_argument('--latency', type=float, default=defaults.latency, help='Base latency per response, in seconds.')
+    parser.add_argument('--jitter', type=float, default=defaults.jitter, help='Maximum extra random latency, in seconds.')
+    parser.add_argument('--rate-429', type=float, default=defaults.rate_429, help='Probability of a 429 response.')
+    parser.add_argument('--retry-after', type=int, default=defaults.retry_after, help='Retry-After of the 429 responses, in seconds.')
+    parser.add_argument('--error-rate', type=float, default=defaults.error_rate, help='Probability of a 500 response.')
+    parser.add_argument('--missing-features-rate', type=float, default=defaults.missing_features_rate, help='Fraction of tracks without audio features.')
+
+
+def configFromArguments(arguments):
+    return MockConfig(
+        playlist_size=arguments.playlist_size,
+        catalog_size=arguments.catalog_size,
+        latency=arguments.latency,
+        jitter=arguments.jitter,
+        rate_429=arguments.rate_429,
+        retry_after=arguments.retry_after,
+        error_rate=arguments.error_rate,
+        missing_features_rate=arguments.missing_features_rate,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local mock of the Spotify Web API for offline testing.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    addConfigArguments(parser)
+    arguments = parser.parse_args(argv)
+
+    server = createServer(arguments.host, arguments.port, configFromArguments(arguments))
+    print(f"Mock Spotify API listening on http://{arguments.host}:{server.server_address[1]} (Web API under /v1)")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
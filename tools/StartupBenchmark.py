@@ -0,0 +1,169 @@
+# Startup-time benchmark. Every target is imported in a fresh interpreter (so nothing is already in sys.modules) and timed, both the imports
+# alone and the whole process including the interpreter start. Some targets must not load certain modules at all, e.g. importing the
+# `utilities` package or showing the login form of Home must not import pandas, and the headless batch pipeline must not import Streamlit;
+# loading them is reported as a failure. The results can be written as JSON and compared with an earlier run, and the exit status is 1 on any regression, so the benchmark
+# can guard the startup budget of the app.
+#
+# USAGE:
+#   python -m tools.StartupBenchmark --json output/benchmarks/startup-baseline.json
+#   python -m tools.StartupBenchmark --compare output/benchmarks/startup-baseline.json --budget 3
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What each page imports before it can render anything
+HOME_BEFORE_LOGIN = ['streamlit', 'streamlit_authenticator', 'yaml', 'utilities.Profiler']
+HOME_AFTER_LOGIN = HOME_BEFORE_LOGIN + ['utilities.MetricsPanel', 'utilities.SpotifyAuth', 'utilities.Playlists', 'utilities.Tracks', 'utilities.Storage']
+
+# (name, modules imported, modules that must not be loaded)
+TARGETS = [
+    ('utilities package', ['utilities'], ['pandas', 'numpy', 'requests', 'streamlit']),
+    ('batch pipeline', ['utilities.Pipeline', 'utilities.Metrics'], ['streamlit', 'sendgrid']),
+    ('home before login', HOME_BEFORE_LOGIN, ['pandas', 'sendgrid', 'tabulate']),
+    ('home after login', HOME_AFTER_LOGIN, ['sendgrid']),
+]
+
+# Code run in the fresh interpreter: imports the modules and prints the time taken and the forbidden modules that were loaded
+MEASURE_SCRIPT = '''
+import importlib, json, sys, time
+modules, forbidden = json.loads(sys.argv[1]), json.loads(sys.argv[2])
+start_time = time.perf_counter()
+for module in modules:
+    importlib.import_module(module)
+seconds = time.perf_counter() - start_time
+print(json.dumps({'import_seconds': seconds, 'loaded_forbidden': [module for module in forbidden if module in sys.modules]}))
+'''
+
+# A target regresses when it is TOLERANCE times slower than in the baseline, and at least MIN_REGRESSION_SECONDS slower
+TOLERANCE = 1.25
+MIN_REGRESSION_SECONDS = 0.02
+
+
+def measureTarget(modules, forbidden, repeats=5):
+    '''
+    Imports the modules in `repeats` fresh interpreters.
+
+    OUTPUT:
+        measurement (dict): The median 'import_seconds' and 'process_seconds', and the 'loaded_forbidden' modules, or the 'error' of the
+            imports (e.g. a dependency that is not installed).
+    '''
+    import_timings = []
+    process_timings = []
+    loaded_forbidden = set()
+
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, '-c', MEASURE_SCRIPT, json.dumps(modules), json.dumps(forbidden)],
+            cwd=REPOSITORY_DIR,
+            capture_output=True,
+            text=True,
+        )
+        process_seconds = time.perf_counter() - start_time
+
+        if process.returncode != 0:
+            return {'error': process.stderr.strip().splitlines()[-1] if process.stderr.strip() else f"exit status {process.returncode}"}
+
+        output = json.loads(process.stdout.strip().splitlines()[-1])
+        import_timings.append(output['import_seconds'])
+        process_timings.append(process_seconds)
+        loaded_forbidden.update(output['loaded_forbidden'])
+
+    return {
+        'import_seconds': round(statistics.median(import_timings), 4),
+        'process_seconds': round(statistics.median(process_timings), 4),
+        'loaded_forbidden': sorted(loaded_forbidden),
+    }
+
+
+def runBenchmark(repeats=5, targets=None):
+    '''
+    Measures the selected targets (all by default).
+
+    OUTPUT:
+        results (list of dicts): One entry per target with its name and measurement.
+    '''
+    results = []
+    for name, modules, forbidden in TARGETS:
+        if targets is not None and name not in targets:
+            continue
+
+        measurement = measureTarget(modules, forbidden, repeats)
+        results.append({'target': name, **measurement})
+
+        if 'error' in measurement:
+            print(f"{name:<20} error: {measurement['error']}", flush=True)
+        else:
+            print(f"{name:<20} {measurement['import_seconds']:>8.3f} s imports {measurement['process_seconds']:>8.3f} s process", flush=True)
+
+    return results
+
+
+def findRegressions(results, baseline_results=None, budget=None):
+    '''
+    OUTPUT:
+        regressions (list of str): A description of every target that loaded a forbidden module, exceeded the budget (seconds of imports),
+            or is slower than in the baseline results.
+    '''
+    baseline = {entry['target']: entry for entry in baseline_results or []}
+    regressions = []
+
+    for entry in results:
+        if 'error' in entry:
+            continue
+
+        if entry['loaded_forbidden']:
+            regressions.append(f"{entry['target']}: loads {', '.join(entry['loaded_forbidden'])}")
+
+        if budget is not None and entry['import_seconds'] > budget:
+            regressions.append(f"{entry['target']}: {entry['import_seconds']:.3f} s of imports, over the budget of {budget:.3f} s")
+
+        previous = baseline.get(entry['target'])
+        if previous is not None and 'import_seconds' in previous:
+            slower_by = entry['import_seconds'] - previous['import_seconds']
+            if entry['import_seconds'] > previous['import_seconds'] * TOLERANCE and slower_by > MIN_REGRESSION_SECONDS:
+                regressions.append(
+                    f"{entry['target']}: {entry['import_seconds']:.3f} s of imports, {previous['import_seconds']:.3f} s in the baseline"
+                )
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the import time of the app and its pages in fresh interpreters.')
+    parser.add_argument('--repeats', type=int, default=5, help='Number of fresh interpreters per target (default: 5).')
+    parser.add_argument('--targets', help=f"Comma-separated targets to measure (default: all). Available: {', '.join(name for name, _, _ in TARGETS)}.")
+    parser.add_argument('--json', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', help='JSON results of an earlier run. Targets much slower than in it are reported as regressions.')
+    parser.add_argument('--budget', type=float, help='Maximum seconds of imports of any target.')
+    arguments = parser.parse_args(argv)
+
+    targets = set(arguments.targets.split(',')) if arguments.targets else None
+    results = runBenchmark(arguments.repeats, targets)
+
+    if arguments.json:
+        os.makedirs(os.path.dirname(arguments.json) or '.', exist_ok=True)
+        with open(arguments.json, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'repeats': arguments.repeats, 'results': results}, f, indent=2)
+
+    baseline_results = None
+    if arguments.compare:
+        with open(arguments.compare) as f:
+            baseline_results = json.load(f)['results']
+
+    regressions = findRegressions(results, baseline_results, arguments.budget)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
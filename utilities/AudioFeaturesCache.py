@@ -0,0 +1,223 @@
+# Persistent on-disk cache of the audio features of tracks, keyed by their Spotify track ID. Audio features of a track never change, so once
+# they have been fetched they can be served from disk instead of sending another request to Spotify. Tracks for which Spotify has no audio
+# features are remembered as negative entries (stored with NULL features) so that they are not requested again on every run either.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from utilities import Metrics
+
+DEFAULT_CACHE_PATH = 'output/cache/audio_features.sqlite'
+
+# Maximum number of tracks kept in the cache before the least recently used ones are evicted
+DEFAULT_MAX_ENTRIES = 500_000
+
+# Negative entries expire after a week in case Spotify analyses the track later on
+DEFAULT_NEGATIVE_TTL = 7 * 24 * 60 * 60
+
+# SQLite limits the number of host parameters per statement
+QUERY_CHUNK_SIZE = 500
+
+
+class AudioFeaturesCache:
+    '''
+    SQLite-backed cache of audio features. It is safe to share between threads, and between processes thanks to SQLite's WAL journal.
+
+    INPUT:
+        path (str): Location of the SQLite database file.
+        max_entries (int): Maximum number of tracks kept. The least recently used ones are evicted when this is exceeded.
+        negative_ttl (float): Number of seconds a "no features" entry is trusted before the track is requested again.
+    '''
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.negative_ttl = negative_ttl
+        self.lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self.connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS audio_features (
+                    track_id TEXT PRIMARY KEY,
+                    features TEXT,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            ''')
+            connection.execute('CREATE INDEX IF NOT EXISTS audio_features_accessed_at ON audio_features (accessed_at)')
+
+    @contextmanager
+    def connect(self):
+        '''
+        Opens a connection to the database and runs the enclosed statements in one transaction, closing the connection afterwards.
+        '''
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get(self, track_ids):
+        '''
+        Looks up the given track IDs in the cache.
+
+        INPUT:
+            track_ids (list): The track IDs to look up.
+
+        OUTPUT:
+            hits (dict): Maps each cached track ID to its audio features, or to None for a negative entry.
+            misses (list): The track IDs that are not cached (or whose negative entry has expired), without duplicates and in their original order.
+        '''
+        track_ids = list(dict.fromkeys(track_ids))
+        now = time.time()
+
+        hits = {}
+        with self.lock, self.connect() as connection:
+            for start in range(0, len(track_ids), QUERY_CHUNK_SIZE):
+                chunk = track_ids[start:start + QUERY_CHUNK_SIZE]
+                rows = connection.execute(
+                    f"SELECT track_id, features, fetched_at FROM audio_features WHERE track_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+
+                for track_id, features, fetched_at in rows:
+                    if features is None:
+                        if now - fetched_at > self.negative_ttl:
+                            continue
+                        hits[track_id] = None
+                    else:
+                        hits[track_id] = json.loads(features)
+
+            connection.executemany(
+                'UPDATE audio_features SET accessed_at = ? WHERE track_id = ?',
+                [(now, track_id) for track_id in hits]
+            )
+
+        misses = [track_id for track_id in track_ids if track_id not in hits]
+        Metrics.recordCacheLookups('AudioFeaturesCache', hits=len(hits), misses=len(misses))
+
+        return hits, misses
+
+    def touch(self, track_ids):
+        '''
+        Marks the given tracks as used now without reading them, e.g. when their audio features were served from the feature store, so that
+        the least recently used eviction keeps them.
+        '''
+        track_ids = list(dict.fromkeys(track_ids))
+        now = time.time()
+
+        with self.lock, self.connect() as connection:
+            connection.executemany(
+                'UPDATE audio_features SET accessed_at = ? WHERE track_id = ?',
+                [(now, track_id) for track_id in track_ids]
+            )
+
+    def recentIDs(self, limit):
+        '''
+        OUTPUT:
+            track_ids (list): The IDs of the `limit` most recently used tracks that have audio features, most recent first.
+        '''
+        with self.lock, self.connect() as connection:
+            rows = connection.execute(
+                'SELECT track_id FROM audio_features WHERE features IS NOT NULL ORDER BY accessed_at DESC LIMIT ?',
+                (limit,)
+            ).fetchall()
+
+        return [track_id for (track_id,) in rows]
+
+    def put(self, features_by_id):
+        '''
+        Stores the audio features of the given tracks. A value of None stores a negative entry. The cache is then trimmed to `max_entries`.
+
+        INPUT:
+            features_by_id (dict): Maps track IDs to their audio features or to None.
+        '''
+        now = time.time()
+        rows = [
+            (track_id, None if features is None else json.dumps(features), now, now)
+            for track_id, features in features_by_id.items()
+        ]
+
+        with self.lock, self.connect() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO audio_features (track_id, features, fetched_at, accessed_at) VALUES (?, ?, ?, ?)',
+                rows
+            )
+
+        self.evict()
+
+    def iterFeatures(self, batch_size=10_000):
+        '''
+        Yields the audio features of every cached track (negative entries are skipped), reading the table in batches.
+        '''
+        with self.connect() as connection:
+            cursor = connection.execute('SELECT features FROM audio_features WHERE features IS NOT NULL')
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for (features,) in rows:
+                    yield json.loads(features)
+
+    def evict(self, max_entries=None):
+        '''
+        Removes the least recently used entries until at most `max_entries` tracks remain, and drops expired negative entries.
+
+        OUTPUT:
+            removed (int): Number of entries removed.
+        '''
+        if max_entries is None:
+            max_entries = self.max_entries
+
+        with self.lock, self.connect() as connection:
+            removed = connection.execute(
+                'DELETE FROM audio_features WHERE features IS NULL AND fetched_at < ?',
+                (time.time() - self.negative_ttl,)
+            ).rowcount
+
+            excess = connection.execute('SELECT COUNT(*) FROM audio_features').fetchone()[0] - max_entries
+            if excess > 0:
+                removed += connection.execute(
+                    'DELETE FROM audio_features WHERE track_id IN (SELECT track_id FROM audio_features ORDER BY accessed_at LIMIT ?)',
+                    (excess,)
+                ).rowcount
+
+        return removed
+
+    def size(self):
+        '''
+        OUTPUT:
+            size (int): Number of tracks currently cached, including negative entries.
+        '''
+        with self.lock, self.connect() as connection:
+            return connection.execute('SELECT COUNT(*) FROM audio_features').fetchone()[0]
+
+    def clear(self):
+        with self.lock, self.connect() as connection:
+            connection.execute('DELETE FROM audio_features')
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def getCache():
+    '''
+    Returns the process-wide AudioFeaturesCache stored at the default location, creating it on first use.
+    '''
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AudioFeaturesCache()
+
+    return _cache
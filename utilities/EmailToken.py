@@ -1,9 +1,11 @@
 # FUNCTION: To send the Spotify Access Token to the user's email address during REQUEST NEW TOKEN events. It uses SendGrid services.
 import os
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import *
 
 def emailSpotifyAccessToken():
+    # SendGrid is only imported when an email is actually sent
+    from sendgrid import SendGridAPIClient
+    from sendgrid.helpers.mail import Mail
+
     # Create the HTML content of the email
     html_content = f"""
         <h1>Spotify Access Token</h1>
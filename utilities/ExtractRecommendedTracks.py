@@ -2,20 +2,50 @@
 # 1. Predetermine THREE songs from the FULL DATASET that you want to use as seed tracks. They shall be chosen such that they are the most representative of the playlist.
 # 2. Use the latest two songs from the FULL DATASET as additional seed tracks.
 
-import requests
-import tqdm
+import copy
+import math
+import numpy as np
 import pandas as pd
+from utilities import SpotifyClient, FeatureTable, Memo
+
+# Recommendation responses are memoized for an hour, keyed by the canonical query (see canonicalRecommendationQuery)
+RECOMMENDATIONS_TTL = 60 * 60
+RECOMMENDATIONS_MAX_ENTRIES = 1024
+
+# Number of decimals the attribute ranges are rounded to in the requests
+RANGE_DECIMALS = 3
+
+# Audio features whose min/max over the seed tracks bound the recommendations
+RECOMMENDATION_ATTRIBUTES = ('danceability', 'energy', 'valence')
 
 def getRecommendationAttributes(seedTrackInfos):
     '''
     Gets the 'min' and 'max' values for the DANCEABILITY, ENERGY, and VALENCE of the seed tracks to be used for generating the recommendations:
     
     INPUT:
-        trackInfos (list of dicts): List of track informations for the seed tracks as dictionaries
+        trackInfos (list of dicts, pd.DataFrame or FeatureTable.AudioFeatureTable): The track informations for the seed tracks. Tables and
+            DataFrames are reduced column by column without building a dict per track.
         
     OUTPUT:
         recommendationAttributes (dict): Dictionary containing the 'min' and 'max' values for the DANCEABILITY, ENERGY, and VALENCE from the entire list of the seed tracks.
     '''
+    if isinstance(seedTrackInfos, FeatureTable.AudioFeatureTable):
+        return {
+            attribute: {
+                'min': FeatureTable.toFloat(np.nanmin(seedTrackInfos.column(attribute))),
+                'max': FeatureTable.toFloat(np.nanmax(seedTrackInfos.column(attribute))),
+            }
+            for attribute in RECOMMENDATION_ATTRIBUTES
+        }
+    if isinstance(seedTrackInfos, pd.DataFrame):
+        return {
+            attribute: {
+                'min': FeatureTable.toFloat(seedTrackInfos[attribute].min()),
+                'max': FeatureTable.toFloat(seedTrackInfos[attribute].max()),
+            }
+            for attribute in RECOMMENDATION_ATTRIBUTES
+        }
+
     danceability = [track['danceability'] for track in seedTrackInfos]
     energy = [track['energy'] for track in seedTrackInfos]
     valence = [track['valence'] for track in seedTrackInfos]
@@ -37,31 +67,92 @@ def getRecommendationAttributes(seedTrackInfos):
     
     return recommendationAttributes
 
+
+def getSeedIDs(seedTrackInfos):
+    '''
+    Returns the track IDs of the seed tracks, given in any of the forms accepted by `getRecommendationAttributes`.
+    '''
+    if isinstance(seedTrackInfos, FeatureTable.AudioFeatureTable):
+        return list(seedTrackInfos.ids)
+    if isinstance(seedTrackInfos, pd.DataFrame):
+        return seedTrackInfos['id'].tolist()
+
+    return [track['id'] for track in seedTrackInfos]
+
+def canonicalRecommendationQuery(seedTrackInfos, num_tracks):
+    '''
+    Builds the canonical form of a recommendation query: the sorted seed IDs, the attribute ranges rounded outwards (the minimums down and the
+    maximums up, so the seed tracks stay within them) to RANGE_DECIMALS decimals, and the number of tracks. Two queries with the same canonical
+    form send the exact same request to Spotify.
+
+    OUTPUT:
+        query (tuple): (seed_ids, attribute_ranges, num_tracks), where attribute_ranges is a tuple of (attribute, min, max).
+    '''
+    recommendationAttributes = getRecommendationAttributes(seedTrackInfos)
+    scale = 10 ** RANGE_DECIMALS
+
+    seed_ids = tuple(sorted(getSeedIDs(seedTrackInfos)))
+    # Rounding to a few more decimals first drops the float32 noise of compact features (0.123 stored as 0.12300000339...), which would
+    # otherwise widen the range by a whole step
+    attribute_ranges = tuple(
+        (
+            attribute,
+            math.floor(round(bounds['min'] * scale, 3)) / scale,
+            math.ceil(round(bounds['max'] * scale, 3)) / scale,
+        )
+        for attribute, bounds in sorted(recommendationAttributes.items())
+    )
+
+    return seed_ids, attribute_ranges, int(num_tracks)
+
+
+@Memo.memoize(
+    ttl=RECOMMENDATIONS_TTL,
+    max_entries=RECOMMENDATIONS_MAX_ENTRIES,
+    key=lambda access_token, query: query,
+)
+def requestRecommendations(access_token, query):
+    '''
+    Sends a canonical recommendation query to Spotify. The responses are memoized (TTL + LRU) by query, so repeated and accidental reruns
+    of a page do not send the same request again.
+
+    OUTPUT:
+        recommended_tracks (list): List of recommended tracks.
+    '''
+    seed_ids, attribute_ranges, num_tracks = query
+
+    base_url = SpotifyClient.apiURL(f"/recommendations?limit={num_tracks}&seed_tracks={'%2C'.join(seed_ids)}")
+    for attribute, minimum, maximum in attribute_ranges:
+        base_url += f"&min_{attribute}={minimum}&max_{attribute}={maximum}"
+
+    # Request for the 50 recommended songs
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+    }
+    
+    # Throttled requests are retried, so that concurrent callers (e.g. the recommendation harvester) share the rate limit
+    response = SpotifyClient.getClient().getWithRetry(base_url, limiter=SpotifyClient.getRateLimiter(), headers=headers).json()
+    
+    # Response is expected to container 'seeds' and 'tracks' keys which in turn are composed of lists. We only get the 'tracks' and store it as a dataframe.
+    return response['tracks']
+
+
 def generateRecommendations(access_token, seedTrackInfos, num_tracks=50):
     '''
     Generates list of 50 recommended tracks based on the provided 5 seed tracks.
     
     INPUT:
         access_token (str): The access token for this app to access Spotify's API.
-        seedTrackInfos (list of dicts): List of track informations for the seed tracks as dictionaries
+        seedTrackInfos (list of dicts, pd.DataFrame or FeatureTable.AudioFeatureTable): The track informations for the seed tracks.
         
     OUTPUT:
         recommended_tracks (list): List of recommended tracks.
     '''
     
     # Aside from the seedTrackInfos, we also use the danceability, energy, and valence of the seed tracks as the basis for the recommendations.
-    recommendationAttributes = getRecommendationAttributes(seedTrackInfos)
-    
-    base_url = f"https://api.spotify.com/v1/recommendations?limit={num_tracks}&seed_tracks={'%2C'.join([track['id'] for track in seedTrackInfos])}&min_danceability={recommendationAttributes['danceability']['min']}&max_danceability={recommendationAttributes['danceability']['max']}&min_energy={recommendationAttributes['energy']['min']}&max_energy={recommendationAttributes['energy']['max']}&min_valence={recommendationAttributes['valence']['min']}&max_valence={recommendationAttributes['valence']['max']}"
-    
-    # Request for the 50 recommended songs
-    headers = {
-        'Authorization': f'Bearer {access_token}',
-    }
-    
-    response = requests.get(base_url, headers=headers).json()
-    
-    # Response is expected to container 'seeds' and 'tracks' keys which in turn are composed of lists. We only get the 'tracks' and store it as a dataframe.
-    recommended_tracks = response['tracks']
+    query = canonicalRecommendationQuery(seedTrackInfos, num_tracks)
+
+    # The memoized tracks are shared between callers, so each caller gets its own deep copy of them (including the nested album and artists)
+    recommended_tracks = copy.deepcopy(requestRecommendations(access_token, query))
     
-    return recommended_tracks
\ No newline at end of file
+    return recommended_tracks
@@ -0,0 +1,307 @@
+# Persistent store of the audio features of the tracks seen so far, shared by all the processes of the app (Streamlit workers,
+# batch pipelines...). The numeric features are kept in one raw float32 file of (tracks x FeatureTable.NUMERIC_FIELDS) values that each
+# process memory-maps read-only: the operating system keeps a single copy of its pages for all of them, and nothing is parsed on a cold
+# start. Row i of the matrix belongs to the i-th line of a text file of track IDs, from which every process builds its ID -> row index.
+#
+# Appends write the matrix rows first and the IDs last, so a row only becomes visible once its ID line is complete. A writer that crashed
+# in between leaves rows without IDs, which the next append truncates. Appends are serialized between processes with a lock file.
+#
+# The store is bounded: once it holds more than `max_rows` tracks, it is compacted into a new generation of the two files holding only the
+# tracks to keep (see Tracks.getAudioFeatureTable, which keeps the ones most recently used according to the audio-features cache). The
+# 'current' file names the generation in use, and readers switch to a new generation on their next refresh.
+#
+# USAGE:
+#   store = FeatureStore.getStore()
+#   store.append(Tracks.getAudioFeatureTable(access_token, track_ids))
+#   table = store.table(track_ids)      # only the requested rows are copied
+#   recommender = LocalRecommender.LocalRecommender(store.table())
+
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+from utilities import FeatureTable
+
+try:
+    import fcntl
+except ImportError:
+    # Without fcntl (Windows), appends are only serialized between the threads of a process
+    fcntl = None
+
+DEFAULT_STORE_DIR = 'output/cache/feature_store'
+
+MATRIX_FILE = 'features.f32'
+IDS_FILE = 'ids.txt'
+LOCK_FILE = 'append.lock'
+GENERATION_FILE = 'current'
+
+# Maximum number of tracks kept before the store is compacted, the same as the default size of the audio-features cache
+DEFAULT_MAX_ROWS = 500_000
+
+# The matrix file is little-endian whatever the machine, so that it can be copied between hosts
+STORE_DTYPE = np.dtype('<f4')
+ROW_BYTES = len(FeatureTable.NUMERIC_FIELDS) * STORE_DTYPE.itemsize
+
+
+def generationFiles(generation):
+    '''
+    Returns the names of the matrix and ID files of a generation of the store. Generation 0 keeps the names of the stores created before
+    compaction existed.
+    '''
+    if generation == 0:
+        return MATRIX_FILE, IDS_FILE
+
+    stem, extension = os.path.splitext(MATRIX_FILE)
+    ids_stem, ids_extension = os.path.splitext(IDS_FILE)
+
+    return f"{stem}.{generation}{extension}", f"{ids_stem}.{generation}{ids_extension}"
+
+
+class FeatureStore:
+    '''
+    Memory-mapped matrix of audio features with an ID -> row index. Rows are never modified once written, and are only removed by `compact`,
+    which writes a new generation of the files, so readers only need to `refresh` to see the rows appended or removed by other processes.
+
+    INPUT:
+        directory (str): Directory of the store files. It is created if needed.
+        max_rows (int): Number of tracks above which the store should be compacted (see `isFull`).
+    '''
+
+    def __init__(self, directory=DEFAULT_STORE_DIR, max_rows=DEFAULT_MAX_ROWS):
+        self.directory = directory
+        self.max_rows = max_rows
+        self.generation_path = os.path.join(directory, GENERATION_FILE)
+        self.lock_path = os.path.join(directory, LOCK_FILE)
+        self.lock = threading.RLock()
+
+        os.makedirs(directory, exist_ok=True)
+
+        self.generation = None
+        self.refresh()
+
+    def readGeneration(self):
+        try:
+            with open(self.generation_path) as generation_file:
+                return int(generation_file.read())
+        except FileNotFoundError:
+            return 0
+
+    def openGeneration(self, generation):
+        '''
+        Forgets the rows read so far and points the store at the files of the given generation, creating them if needed.
+        '''
+        self.generation = generation
+        matrix_file, ids_file = generationFiles(generation)
+        self.matrix_path = os.path.join(self.directory, matrix_file)
+        self.ids_path = os.path.join(self.directory, ids_file)
+
+        self.ids = []
+        self.row_by_id = {}
+        self.matrix = np.empty((0, len(FeatureTable.NUMERIC_FIELDS)), dtype=STORE_DTYPE)
+
+        # Size of the complete ID lines read so far
+        self.ids_offset = 0
+
+        if generation == 0:
+            for path in (self.matrix_path, self.ids_path):
+                if not os.path.exists(path):
+                    open(path, 'ab').close()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, track_id):
+        return track_id in self.row_by_id
+
+    def isFull(self):
+        return len(self.ids) > self.max_rows
+
+    def refresh(self):
+        '''
+        Picks up the rows appended since the last refresh (by this or another process) and maps the matrix again if it has grown. If the
+        store was compacted in the meantime, the new generation is read from the start.
+
+        OUTPUT:
+            num_tracks (int): Number of tracks in the store.
+        '''
+        with self.lock:
+            while True:
+                generation = self.readGeneration()
+                if generation != self.generation:
+                    self.openGeneration(generation)
+
+                try:
+                    with open(self.ids_path, 'rb') as ids_file:
+                        ids_file.seek(self.ids_offset)
+                        new_data = ids_file.read()
+                    break
+                except FileNotFoundError:
+                    # The generation was compacted away between reading its number and opening its files
+                    self.generation = None
+
+            # A line without its newline is still being written
+            complete_size = new_data.rfind(b'\n') + 1
+            if complete_size == 0:
+                return len(self.ids)
+
+            for track_id in new_data[:complete_size].decode('ascii').splitlines():
+                self.row_by_id[track_id] = len(self.ids)
+                self.ids.append(FeatureTable.internString(track_id))
+            self.ids_offset += complete_size
+
+            self.matrix = np.memmap(self.matrix_path, dtype=STORE_DTYPE, mode='r', shape=(len(self.ids), len(FeatureTable.NUMERIC_FIELDS)))
+
+            return len(self.ids)
+
+    def rowsOf(self, track_ids):
+        '''
+        Returns the row of each given track ID, or -1 for the IDs that are not in the store.
+        '''
+        return np.fromiter((self.row_by_id.get(track_id, -1) for track_id in track_ids), dtype=np.int64)
+
+    def table(self, track_ids=None):
+        '''
+        Returns the stored audio features as a FeatureTable.AudioFeatureTable, e.g. for `LocalRecommender` or
+        `ExtractRecommendedTracks.getRecommendationAttributes`.
+
+        INPUT:
+            track_ids (list): The tracks to return, in this order. Tracks that are not in the store are left out. By default, the whole store
+                is returned without copying the matrix.
+
+        OUTPUT:
+            audio_features (FeatureTable.AudioFeatureTable): The audio features of the tracks.
+        '''
+        self.refresh()
+
+        if track_ids is None:
+            return FeatureTable.AudioFeatureTable(self.ids, self.matrix)
+
+        rows = self.rowsOf(track_ids)
+        rows = rows[rows >= 0]
+
+        return FeatureTable.AudioFeatureTable([self.ids[row] for row in rows], self.matrix[rows])
+
+    @contextmanager
+    def appendLock(self):
+        '''
+        Holds the lock of the store files, shared between the threads of this process and, where fcntl exists, between processes.
+        '''
+        with self.lock, open(self.lock_path, 'ab') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def append(self, audio_features):
+        '''
+        Adds the audio features of the tracks that are not in the store yet. Tracks already stored are left unchanged, since the audio
+        features of a track never change.
+
+        INPUT:
+            audio_features (FeatureTable.AudioFeatureTable or iterable of dicts): The audio features to add, as a table or as returned by
+                Spotify's API.
+
+        OUTPUT:
+            num_added (int): Number of tracks added.
+        '''
+        if not isinstance(audio_features, FeatureTable.AudioFeatureTable):
+            audio_features = FeatureTable.AudioFeatureTable.fromRecords(audio_features)
+
+        with self.appendLock():
+            self.refresh()
+
+            new_rows = {}
+            for row, track_id in enumerate(audio_features.ids):
+                if track_id not in self.row_by_id and track_id not in new_rows:
+                    new_rows[track_id] = row
+            if not new_rows:
+                return 0
+
+            with open(self.matrix_path, 'ab') as matrix_file:
+                # Drop the rows of an append that crashed before writing their IDs
+                matrix_file.truncate(len(self.ids) * ROW_BYTES)
+                matrix_file.write(audio_features.matrix[list(new_rows.values())].astype(STORE_DTYPE).tobytes())
+
+            with open(self.ids_path, 'ab') as ids_file:
+                ids_file.truncate(self.ids_offset)
+                ids_file.write(''.join(f"{track_id}\n" for track_id in new_rows).encode('ascii'))
+
+            self.refresh()
+
+        return len(new_rows)
+
+    def compact(self, keep_ids):
+        '''
+        Rewrites the store with only the given tracks, as a new generation of its files. The files of the previous generation are deleted;
+        readers that still map them keep a valid view until they refresh.
+
+        INPUT:
+            keep_ids (iterable): The track IDs to keep. IDs that are not in the store are ignored.
+
+        OUTPUT:
+            num_removed (int): Number of tracks removed.
+        '''
+        with self.appendLock():
+            self.refresh()
+
+            rows = np.sort(self.rowsOf(dict.fromkeys(keep_ids)))
+            rows = rows[rows >= 0]
+            num_removed = len(self.ids) - len(rows)
+            if num_removed == 0:
+                return 0
+
+            previous_paths = (self.matrix_path, self.ids_path)
+            generation = self.generation + 1
+            matrix_file, ids_file = generationFiles(generation)
+
+            with open(os.path.join(self.directory, matrix_file), 'wb') as new_matrix_file:
+                new_matrix_file.write(np.ascontiguousarray(self.matrix[rows], dtype=STORE_DTYPE).tobytes())
+            with open(os.path.join(self.directory, ids_file), 'wb') as new_ids_file:
+                new_ids_file.write(''.join(f"{self.ids[row]}\n" for row in rows).encode('ascii'))
+
+            # Switch the readers to the new generation atomically
+            temporary_path = f"{self.generation_path}.tmp"
+            with open(temporary_path, 'w') as generation_file:
+                generation_file.write(str(generation))
+            os.replace(temporary_path, self.generation_path)
+
+            for path in previous_paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Files still mapped by another process cannot be removed on Windows; the next compaction does not see them anymore
+                    pass
+
+            self.refresh()
+
+        return num_removed
+
+    def importAudioFeaturesCache(self, cache):
+        '''
+        Adds every track of an AudioFeaturesCache, e.g. to fill a new store with the tracks fetched before it existed.
+
+        OUTPUT:
+            num_added (int): Number of tracks added.
+        '''
+        return self.append(cache.iterFeatures())
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def getStore():
+    '''
+    Returns the process-wide FeatureStore stored at the default location, opening it on first use.
+    '''
+    global _store
+
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = FeatureStore()
+
+    return _store
@@ -0,0 +1,217 @@
+# Compact in-memory representation of audio features and track metadata. Spotify returns the audio features of a track as a JSON object of
+# 18 keys; kept as a Python dict, it costs well over a kilobyte per track. Here the numeric features of many tracks are packed into a single
+# float32 matrix (13 x 4 bytes per track, also readable as a NumPy structured array), next to the list of track IDs. The string fields of
+# Spotify's object ('type', 'uri', 'track_href', 'analysis_url') are derived from the ID and are only rebuilt when converting back to a
+# DataFrame. Repeated metadata strings (album and artist names) are interned so that every occurrence shares one string object.
+
+import sys
+import numpy as np
+import pandas as pd
+
+# Columns of Spotify's audio-features objects, in the order of the API
+AUDIO_FEATURES_COLUMNS = [
+    'danceability', 'energy', 'key', 'loudness', 'mode', 'speechiness', 'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo',
+    'type', 'id', 'uri', 'track_href', 'analysis_url', 'duration_ms', 'time_signature',
+]
+
+# Columns derived from the track ID
+STRING_COLUMNS = ('type', 'id', 'uri', 'track_href', 'analysis_url')
+
+# Numeric features stored in the float32 matrix, and those converted back to integers in DataFrames
+NUMERIC_FIELDS = [column for column in AUDIO_FEATURES_COLUMNS if column not in STRING_COLUMNS]
+INTEGER_FIELDS = ('key', 'mode', 'duration_ms', 'time_signature')
+
+AUDIO_FEATURE_DTYPE = np.dtype([(field, np.float32) for field in NUMERIC_FIELDS])
+FIELD_INDEX = {field: index for index, field in enumerate(NUMERIC_FIELDS)}
+
+# Rows are accumulated in chunks of this size when building a table from a stream of audio features
+BUILD_CHUNK_SIZE = 10_000
+
+
+def internString(value):
+    '''
+    Returns the interned copy of a string, so that equal strings (e.g. the same artist in many tracks) share a single object.
+    '''
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def toFloat(value):
+    '''
+    Converts a float32 value to a Python float without its float32 rounding noise, e.g. 0.123 instead of 0.12300000339746475.
+    '''
+    return float(str(value)) if np.isfinite(value) else None
+
+
+def deriveStringColumn(column, track_id):
+    if column == 'type':
+        return 'audio_features'
+    if column == 'uri':
+        return f"spotify:track:{track_id}"
+    if column == 'track_href':
+        return f"https://api.spotify.com/v1/tracks/{track_id}"
+    if column == 'analysis_url':
+        return f"https://api.spotify.com/v1/audio-analysis/{track_id}"
+
+    return track_id
+
+
+class AudioFeatureTable:
+    '''
+    Audio features of many tracks, as a (tracks x NUMERIC_FIELDS) float32 matrix and the list of track IDs. Missing values are NaN.
+
+    INPUT:
+        ids (list): The track IDs, one per row.
+        matrix (np.array): The numeric features, with the columns in the order of NUMERIC_FIELDS.
+    '''
+
+    def __init__(self, ids, matrix):
+        self.ids = [internString(track_id) for track_id in ids]
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32).reshape(len(self.ids), len(NUMERIC_FIELDS))
+        self.row_by_id = None
+
+        # IDs whose audio features could not be fetched, when the table comes from Tracks.getAudioFeatureTable
+        self.failed_ids = []
+
+    @classmethod
+    def fromRecords(cls, audio_features):
+        '''
+        Builds a table from audio-features objects as returned by Spotify's API (an iterable of dicts, possibly a generator). None entries,
+        for tracks without audio features, are skipped.
+        '''
+        ids = []
+        chunks = []
+        rows = []
+        for features in audio_features:
+            if features is None:
+                continue
+
+            ids.append(features['id'])
+            rows.append(tuple(np.nan if features.get(field) is None else features[field] for field in NUMERIC_FIELDS))
+            if len(rows) == BUILD_CHUNK_SIZE:
+                chunks.append(np.array(rows, dtype=np.float32))
+                rows = []
+
+        if rows or not chunks:
+            chunks.append(np.array(rows, dtype=np.float32).reshape(len(rows), len(NUMERIC_FIELDS)))
+
+        return cls(ids, np.concatenate(chunks) if len(chunks) > 1 else chunks[0])
+
+    @classmethod
+    def fromDataFrame(cls, audio_features_df):
+        '''
+        Builds a table from a DataFrame with an 'id' column and (some of) the numeric audio-feature columns. Missing columns are NaN.
+        '''
+        matrix = audio_features_df.reindex(columns=NUMERIC_FIELDS).to_numpy(dtype=np.float32, na_value=np.nan)
+
+        return cls(audio_features_df['id'].tolist(), matrix)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def records(self):
+        '''
+        The features as a NumPy structured array with one float32 field per feature. This is a view of the matrix, not a copy.
+        '''
+        return self.matrix.view(AUDIO_FEATURE_DTYPE).reshape(len(self.ids))
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes
+
+    def column(self, field):
+        '''
+        Returns the values of one feature for every track (a view of the matrix).
+        '''
+        return self.matrix[:, FIELD_INDEX[field]]
+
+    def rowByID(self):
+        if self.row_by_id is None:
+            self.row_by_id = {track_id: row for row, track_id in enumerate(self.ids)}
+
+        return self.row_by_id
+
+    def rowsOf(self, track_ids):
+        '''
+        Returns the row of each given track ID, or -1 for the IDs that are not in the table.
+        '''
+        row_by_id = self.rowByID()
+
+        return np.fromiter((row_by_id.get(track_id, -1) for track_id in track_ids), dtype=np.int64)
+
+    def take(self, rows):
+        '''
+        Returns a new table with the given rows only, in the given order.
+        '''
+        rows = np.asarray(rows, dtype=np.int64)
+
+        return AudioFeatureTable([self.ids[row] for row in rows], self.matrix[rows])
+
+    def toRecord(self, row):
+        '''
+        Returns the audio features of one row as a dict like Spotify's audio-features object.
+        '''
+        track_id = self.ids[row]
+        record = {}
+        for column in AUDIO_FEATURES_COLUMNS:
+            if column in STRING_COLUMNS:
+                record[column] = deriveStringColumn(column, track_id)
+            else:
+                value = toFloat(self.matrix[row, FIELD_INDEX[column]])
+                record[column] = int(value) if value is not None and column in INTEGER_FIELDS else value
+
+        return record
+
+    def toDataFrame(self, include_strings=True, copy=False):
+        '''
+        Converts the table into a DataFrame with the columns of Spotify's audio-features objects. Unless `copy` is set, the non-integer
+        feature columns share the memory of the matrix instead of copying it.
+
+        INPUT:
+            include_strings (bool): If False, only the 'id' and the numeric columns are included.
+            copy (bool): If True, the DataFrame gets its own copy of the features and can be modified without changing the table.
+        '''
+        audio_features_df = pd.DataFrame(self.matrix, columns=NUMERIC_FIELDS, copy=copy)
+
+        for field in INTEGER_FIELDS:
+            values = audio_features_df[field]
+            if not values.isna().any():
+                audio_features_df[field] = values.round().astype(np.int64)
+
+        for column in STRING_COLUMNS:
+            if column != 'id' and not include_strings:
+                continue
+            values = self.ids if column == 'id' else [deriveStringColumn(column, track_id) for track_id in self.ids]
+            audio_features_df.insert(min(AUDIO_FEATURES_COLUMNS.index(column), len(audio_features_df.columns)), column, values)
+
+        return audio_features_df
+
+
+def mergeDataset(tracks, audio_features):
+    '''
+    Joins a track list with the audio features of its tracks into the FULL DATASET, like
+    `tracks_df.merge(audio_features_df, on='id', suffixes=('_track', '_audio'))` but through the row index of the feature table instead of a
+    hash join of two DataFrames. The tracks without audio features are dropped, and the order of the track list is kept.
+
+    INPUT:
+        tracks (pd.DataFrame): The track list, with an 'id' column.
+        audio_features (AudioFeatureTable or pd.DataFrame): The audio features of the tracks.
+
+    OUTPUT:
+        full_dataset (pd.DataFrame): The track list columns followed by the audio-feature columns. Columns found in both get the '_track'
+            and '_audio' suffixes.
+    '''
+    if not isinstance(audio_features, AudioFeatureTable):
+        audio_features = AudioFeatureTable.fromDataFrame(audio_features)
+
+    rows = audio_features.rowsOf(tracks['id'])
+    found = rows >= 0
+
+    tracks_part = tracks[found].reset_index(drop=True)
+    features_part = audio_features.take(rows[found]).toDataFrame().drop(columns='id')
+
+    common_columns = set(tracks_part.columns) & set(features_part.columns)
+    tracks_part = tracks_part.rename(columns={column: f"{column}_track" for column in common_columns})
+    features_part = features_part.rename(columns={column: f"{column}_audio" for column in common_columns})
+
+    return pd.concat([tracks_part, features_part], axis=1)
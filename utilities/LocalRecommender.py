@@ -0,0 +1,210 @@
+# Offline alternative to Spotify's /v1/recommendations endpoint. The tracks nearest to the seed tracks are found with vectorized distance
+# computations over all the audio features available locally (e.g. in the feature store). There is no request to Spotify, no limit of 5
+# seeds, and no cap of 50 tracks per call.
+#
+# The features are read in place from the matrix of the table (memory-mapped for the feature store) and normalized a chunk of rows at a time,
+# so a process only holds the per-feature minimums and ranges plus one distance per track, rather than its own copy of the whole matrix.
+
+import numpy as np
+from utilities import AudioFeaturesCache, ExtractRecommendedTracks, FeatureStore, FeatureTable, Memo, Tracks
+
+# Audio features used to measure how similar two tracks are
+FEATURE_COLUMNS = ['danceability', 'energy', 'valence', 'acousticness', 'instrumentalness', 'liveness', 'speechiness', 'tempo', 'loudness']
+
+# The matrix built from the audio-features cache is re-used for ten minutes
+CACHE_MATRIX_TTL = 10 * 60
+
+# Number of tracks normalized and compared at a time (about 2 MB of features per chunk)
+CHUNK_ROWS = 65536
+
+
+class LocalRecommender:
+    '''
+    Nearest-neighbour search over the audio features of a set of tracks.
+
+    INPUT:
+        audio_features (FeatureTable.AudioFeatureTable or iterable of dicts): Audio features of the candidate tracks, as a compact table or
+            as returned by Spotify's API. Tracks with a missing feature are skipped.
+        feature_columns (list): The audio features used to compare the tracks.
+    '''
+
+    def __init__(self, audio_features, feature_columns=FEATURE_COLUMNS):
+        self.feature_columns = list(feature_columns)
+        self.column_indices = [FeatureTable.FIELD_INDEX[column] for column in self.feature_columns]
+
+        if not isinstance(audio_features, FeatureTable.AudioFeatureTable):
+            audio_features = FeatureTable.AudioFeatureTable.fromRecords(audio_features)
+
+        # The candidate tracks are only kept as a compact table; the dicts of the recommended tracks are built on demand
+        self.tracks = audio_features
+        self.row_by_id = audio_features.rowByID()
+
+        # Min-max normalization so that every feature weighs the same regardless of its unit (e.g. tempo in BPM vs. energy in [0, 1]). Only
+        # the tracks with every feature count.
+        num_features = len(self.feature_columns)
+        minimums = np.full(num_features, np.inf, dtype=np.float32)
+        maximums = np.full(num_features, -np.inf, dtype=np.float32)
+        self.num_complete = 0
+        for start in range(0, len(audio_features), CHUNK_ROWS):
+            raw_chunk = self.rawChunk(start, start + CHUNK_ROWS)
+            raw_chunk = raw_chunk[~np.isnan(raw_chunk).any(axis=1)]
+            if len(raw_chunk):
+                minimums = np.minimum(minimums, raw_chunk.min(axis=0))
+                maximums = np.maximum(maximums, raw_chunk.max(axis=0))
+                self.num_complete += len(raw_chunk)
+
+        if self.num_complete:
+            self.minimums = minimums
+            self.ranges = maximums - minimums
+        else:
+            self.minimums = np.zeros(num_features, dtype=np.float32)
+            self.ranges = np.ones(num_features, dtype=np.float32)
+        self.ranges[self.ranges == 0] = 1
+
+    def __len__(self):
+        return self.num_complete
+
+    def rawChunk(self, start, stop):
+        '''
+        Copies the feature columns of the rows between `start` and `stop` out of the (possibly memory-mapped) matrix of the table.
+        '''
+        return np.asarray(self.tracks.matrix[start:stop][:, self.column_indices], dtype=np.float32)
+
+    def normalize(self, column, value):
+        index = self.feature_columns.index(column)
+
+        return (value - self.minimums[index]) / self.ranges[index]
+
+    def recommend(self, seed_ids, num_tracks=50, weights=None, attribute_ranges=None, mode='centroid', exclude_ids=()):
+        '''
+        Finds the tracks nearest to the seed tracks.
+
+        INPUT:
+            seed_ids (list): The IDs of the seed tracks. Seeds without local audio features are ignored.
+            num_tracks (int): Number of recommended tracks to return.
+            weights (dict): Optional non-negative weight per feature column (1 by default). A weight of 0 ignores the feature.
+            attribute_ranges (dict): Optional {feature: {'min': ..., 'max': ...}} filters on the raw feature values, as returned by
+                `ExtractRecommendedTracks.getRecommendationAttributes`.
+            mode (str): 'centroid' ranks the tracks by their distance to the average of the seeds; 'nearest' ranks them by their distance
+                to the closest seed.
+            exclude_ids (iterable): Track IDs that must not be recommended. The seeds are always excluded.
+
+        OUTPUT:
+            recommended_tracks (list of dicts): The audio features of the recommended tracks, nearest first, each with an added 'distance'.
+        '''
+        if mode not in ('centroid', 'nearest'):
+            raise ValueError(f"Unknown mode: {mode}")
+
+        # Weighting a squared Euclidean distance is the same as scaling each axis by the square root of its weight
+        scale = np.ones(len(self.feature_columns), dtype=np.float32)
+        for column, weight in (weights or {}).items():
+            if column not in self.feature_columns:
+                raise ValueError(f"Unknown feature column: {column}")
+            if not weight >= 0:
+                raise ValueError(f"The weight of {column} must be a non-negative number, got {weight}")
+            scale[self.feature_columns.index(column)] = np.sqrt(weight)
+
+        seed_rows = np.array([self.row_by_id[track_id] for track_id in seed_ids if track_id in self.row_by_id], dtype=np.int64)
+        seeds = (self.tracks.matrix[seed_rows][:, self.column_indices] - self.minimums) / self.ranges * scale
+        complete_seeds = ~np.isnan(seeds).any(axis=1)
+        seed_rows, seeds = seed_rows[complete_seeds], seeds[complete_seeds]
+        if not len(seed_rows):
+            raise ValueError('None of the seed tracks has local audio features.')
+
+        centroid = seeds.mean(axis=0)
+        squared_seed_norms = (seeds ** 2).sum(axis=1)
+
+        range_filters = [
+            (self.feature_columns.index(column), self.normalize(column, bounds['min']) - 1e-6, self.normalize(column, bounds['max']) + 1e-6)
+            for column, bounds in (attribute_ranges or {}).items()
+        ]
+
+        # Tracks with a missing feature, outside the attribute ranges, seeds or excluded get an infinite distance
+        distances = np.empty(len(self.tracks), dtype=np.float32)
+        for start in range(0, len(self.tracks), CHUNK_ROWS):
+            chunk = (self.rawChunk(start, start + CHUNK_ROWS) - self.minimums) / self.ranges
+
+            allowed = ~np.isnan(chunk).any(axis=1)
+            for index, minimum, maximum in range_filters:
+                allowed &= (chunk[:, index] >= minimum) & (chunk[:, index] <= maximum)
+
+            candidates = chunk * scale
+            if mode == 'centroid':
+                chunk_distances = ((candidates - centroid) ** 2).sum(axis=1)
+            else:
+                # ||x - s||^2 = ||x||^2 - 2 x.s + ||s||^2 for every candidate x and seed s at once
+                chunk_distances = (
+                    (candidates ** 2).sum(axis=1)[:, None]
+                    - 2 * candidates @ seeds.T
+                    + squared_seed_norms[None, :]
+                ).min(axis=1)
+
+            chunk_distances[~allowed] = np.inf
+            distances[start:start + len(chunk)] = chunk_distances
+
+        excluded_rows = [self.row_by_id[track_id] for track_id in exclude_ids if track_id in self.row_by_id]
+        distances[seed_rows] = np.inf
+        distances[excluded_rows] = np.inf
+
+        allowed_rows = np.flatnonzero(np.isfinite(distances))
+        num_tracks = min(num_tracks, len(allowed_rows))
+        if num_tracks <= 0:
+            return []
+
+        # Partial sort: only the top `num_tracks` distances are ordered
+        allowed_distances = distances[allowed_rows]
+        top = np.argpartition(allowed_distances, num_tracks - 1)[:num_tracks]
+        top = top[np.argsort(allowed_distances[top])]
+
+        return [
+            {**self.tracks.toRecord(row), 'distance': float(distance)}
+            for row, distance in zip(allowed_rows[top], allowed_distances[top])
+        ]
+
+
+@Memo.memoize(ttl=CACHE_MATRIX_TTL, max_entries=1, key=lambda: 'audio-features-cache')
+def getCacheRecommender():
+    '''
+    Returns a LocalRecommender over every track of the feature store, rebuilt at most every ten minutes. The store is read from its
+    memory-mapped matrix; an empty store is first filled from the audio-features cache.
+    '''
+    store = FeatureStore.getStore()
+    if not store.refresh():
+        store.importAudioFeaturesCache(AudioFeaturesCache.getCache())
+
+    return LocalRecommender(store.table())
+
+
+def generateRecommendations(seedTrackInfos, num_tracks=50, recommender=None, weights=None, mode='centroid', exclude_ids=(), access_token=None,
+                            track_store=None):
+    '''
+    Local counterpart of `ExtractRecommendedTracks.generateRecommendations`: the same seed tracks and the same min/max ranges of danceability,
+    energy and valence are used, but the recommended tracks are taken from the local audio features.
+
+    INPUT:
+        seedTrackInfos (list of dicts): List of track informations for the seed tracks as dictionaries
+        num_tracks (int): Number of recommended tracks. Not limited to 50.
+        recommender (LocalRecommender): The recommender to use. Defaults to the one built from the audio-features cache.
+        access_token (str): The access token for this app to access Spotify's API, used to fetch the tracks missing from the track store. If
+            None, recommended tracks missing from the track store are left out.
+        track_store (TrackStore.TrackStore): The track store holding the metadata of the tracks. Defaults to the process-wide store.
+
+    OUTPUT:
+        recommended_tracks (list): List of recommended tracks, nearest first, with the same fields as the tracks returned by Spotify's
+            recommendations (name, artists, album, ID, URI...).
+    '''
+    if recommender is None:
+        recommender = getCacheRecommender()
+
+    nearest_tracks = recommender.recommend(
+        [track['id'] for track in seedTrackInfos],
+        num_tracks=num_tracks,
+        weights=weights,
+        attribute_ranges=ExtractRecommendedTracks.getRecommendationAttributes(seedTrackInfos),
+        mode=mode,
+        exclude_ids=exclude_ids,
+    )
+
+    records_by_id = Tracks.getTrackRecords(access_token, [track['id'] for track in nearest_tracks], track_store)
+
+    return [Tracks.toTrackObject(records_by_id[track['id']]) for track in nearest_tracks if track['id'] in records_by_id]
@@ -0,0 +1,150 @@
+# In-memory memoization of the results of the utilities functions. Streamlit re-executes a page from top to bottom on every widget interaction,
+# and keeps the imported modules alive between reruns and between the sessions served by the same process. A cache held at module level is
+# therefore shared by every rerun and every session, so repeated reruns do not repeat the same requests to Spotify.
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import wraps
+from utilities import Metrics
+
+# Sentinel for missing entries, since None is a valid cached value
+MISSING = object()
+
+
+class TTLCache:
+    '''
+    Thread-safe least-recently-used cache whose entries expire after a fixed time-to-live.
+
+    INPUT:
+        ttl (float): Number of seconds an entry stays valid.
+        max_entries (int): Maximum number of entries kept. The least recently used ones are evicted when this is exceeded.
+        max_bytes (int): Optional bound on the total size of the cached values, as measured by `sizeof`.
+        sizeof (callable): Function returning the size of a cached value in bytes. Only used when `max_bytes` is given.
+        name (str): Optional name under which the hits and misses are recorded in the metrics.
+    '''
+
+    def __init__(self, ttl, max_entries=128, max_bytes=None, sizeof=None, name=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key, MISSING)
+
+            if entry is MISSING or entry[1] < time.monotonic():
+                if entry is not MISSING:
+                    self.discard(key)
+                self.misses += 1
+                if self.name:
+                    Metrics.recordCacheLookups(self.name, misses=1)
+                return default
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            if self.name:
+                Metrics.recordCacheLookups(self.name, hits=1)
+
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value) if self.max_bytes is not None and self.sizeof is not None else 0
+
+        with self.lock:
+            if key in self.entries:
+                self.discard(key)
+
+            self.entries[key] = (value, time.monotonic() + self.ttl, size)
+            self.total_bytes += size
+
+            while self.entries and (len(self.entries) > self.max_entries or (self.max_bytes is not None and self.total_bytes > self.max_bytes)):
+                self.discard(next(iter(self.entries)))
+
+    def discard(self, key):
+        # Must be called with the lock held
+        _, _, size = self.entries.pop(key)
+        self.total_bytes -= size
+
+    def invalidate(self, key=MISSING):
+        '''
+        Removes the given entry, or every entry if no key is given.
+        '''
+        with self.lock:
+            if key is MISSING:
+                self.entries.clear()
+                self.total_bytes = 0
+            elif key in self.entries:
+                self.discard(key)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def memoize(ttl, max_entries=128, key=None, should_cache=None, max_bytes=None, sizeof=None):
+    '''
+    Decorator caching the results of a function in a TTLCache shared by every caller of the process.
+
+    INPUT:
+        ttl, max_entries, max_bytes, sizeof: See TTLCache.
+        key (callable): Function receiving the same arguments as the decorated function and returning the (hashable) cache key. This allows
+            leaving out arguments that do not change the result, such as the access token. Defaults to the positional and keyword arguments.
+        should_cache (callable): Function receiving a result and returning False if it must not be cached (e.g. an error response).
+
+    The cache is exposed as the `cache` attribute of the decorated function. Its hits and misses are recorded in the metrics under the name of
+    the function, e.g. "Tracks.getCachedAudioFeatures".
+
+    Concurrent misses on the same key are single-flight: the first caller runs the function, and the others wait for its result (or its
+    exception) instead of sending the same requests again.
+    '''
+    def decorator(function):
+        cache = TTLCache(ttl, max_entries, max_bytes, sizeof, name=f"{function.__module__.split('.')[-1]}.{function.__name__}")
+
+        # Future of the call in flight for each key that missed
+        in_flight = {}
+        in_flight_lock = threading.Lock()
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs) if key is not None else (args, tuple(sorted(kwargs.items())))
+
+            result = cache.get(cache_key, MISSING)
+            if result is not MISSING:
+                return result
+
+            with in_flight_lock:
+                future = in_flight.get(cache_key)
+                is_loader = future is None
+                if is_loader:
+                    future = in_flight[cache_key] = Future()
+
+            if not is_loader:
+                return future.result()
+
+            try:
+                result = function(*args, **kwargs)
+                if should_cache is None or should_cache(result):
+                    cache.put(cache_key, result)
+                future.set_result(result)
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with in_flight_lock:
+                    del in_flight[cache_key]
+
+            return result
+
+        wrapper.cache = cache
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,234 @@
+# Request-level metrics of the process: every request sent to Spotify (by endpoint, method and status), its latency, the bytes received,
+# the retries and the time spent waiting for the rate limiter, as well as the hit ratios of the caches. They are kept in memory, shared by
+# every thread and Streamlit session of the process, and can be exported in the Prometheus text format to a file or over HTTP.
+
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+METRICS_FILE = 'output/cache/metrics.prom'
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# IDs in the request paths are replaced by a placeholder so that the endpoints have a bounded number of label values
+ENDPOINT_ID_PATTERN = re.compile(r'/(playlists|tracks|albums|artists|audio-analysis|users)/[^/]+')
+
+# Names, types and descriptions of the exported metrics
+REQUESTS_TOTAL = 'spotify_requests_total'
+REQUEST_DURATION = 'spotify_request_duration_seconds'
+RESPONSE_BYTES = 'spotify_response_bytes_total'
+RETRIES_TOTAL = 'spotify_retries_total'
+RATE_LIMITER_WAIT = 'spotify_rate_limiter_wait_seconds_total'
+CACHE_LOOKUPS_TOTAL = 'cache_lookups_total'
+
+DESCRIPTIONS = {
+    REQUESTS_TOTAL: ('counter', 'Requests sent to Spotify, by endpoint, method and HTTP status (0 if no response was received).'),
+    REQUEST_DURATION: ('histogram', 'Latency of the requests sent to Spotify, by endpoint and method.'),
+    RESPONSE_BYTES: ('counter', 'Bytes received from Spotify (compressed size when gzip is used), by endpoint.'),
+    RETRIES_TOTAL: ('counter', 'Requests retried, by endpoint and reason (401, 429, 5xx or connection).'),
+    RATE_LIMITER_WAIT: ('counter', 'Time spent waiting for the client-side rate limiter.'),
+    CACHE_LOOKUPS_TOTAL: ('counter', 'Cache lookups, by cache and result (hit or miss).'),
+}
+
+
+def endpointLabel(url):
+    '''
+    Reduces a request URL to its endpoint, e.g. "https://api.spotify.com/v1/playlists/37i9.../tracks?offset=100" -> "/v1/playlists/{id}/tracks".
+    '''
+    return ENDPOINT_ID_PATTERN.sub(lambda match: f"/{match.group(1)}/{{id}}", urlparse(url).path)
+
+
+def labelKey(labels):
+    return tuple(sorted(labels.items()))
+
+
+class MetricsRegistry:
+    '''
+    Thread-safe store of labelled counters and histograms.
+    '''
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def increment(self, name, value=1, **labels):
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            key = labelKey(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(labelKey(labels))
+            if histogram is None:
+                histogram = series[labelKey(labels)] = {'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][index] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self):
+        '''
+        Returns a copy of every counter and histogram, as {name: {label tuple: value}}.
+        '''
+        with self.lock:
+            counters = {name: dict(series) for name, series in self.counters.items()}
+            histograms = {
+                name: {key: {**histogram, 'counts': list(histogram['counts'])} for key, histogram in series.items()}
+                for name, series in self.histograms.items()
+            }
+
+        return counters, histograms
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def renderPrometheus(self):
+        '''
+        Renders every metric in the Prometheus text exposition format.
+        '''
+        counters, histograms = self.snapshot()
+        lines = []
+
+        for name in sorted(set(counters) | set(histograms)):
+            metric_type, description = DESCRIPTIONS.get(name, ('histogram' if name in histograms else 'counter', ''))
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+            for key, value in sorted(counters.get(name, {}).items()):
+                lines.append(f"{name}{formatLabels(key)} {value}")
+
+            for key, histogram in sorted(histograms.get(name, {}).items()):
+                cumulative = 0
+                for bound, count in zip(histogram['buckets'], histogram['counts']):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{formatLabels(key + (('le', repr(float(bound))),))} {cumulative}")
+                lines.append(f"{name}_bucket{formatLabels(key + (('le', '+Inf'),))} {histogram['count']}")
+                lines.append(f"{name}_sum{formatLabels(key)} {histogram['sum']}")
+                lines.append(f"{name}_count{formatLabels(key)} {histogram['count']}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def formatLabels(key):
+    if not key:
+        return ''
+
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in key)
+
+    return '{' + ','.join(f'{label}="{value}"' for (label, _), value in zip(key, escaped)) + '}'
+
+
+def histogramQuantile(histogram, quantile):
+    '''
+    Estimates a quantile from a histogram by linear interpolation within the bucket containing it, like Prometheus' `histogram_quantile`.
+    Returns None for an empty histogram, and the largest bucket bound if the quantile falls above it.
+    '''
+    if not histogram['count']:
+        return None
+
+    rank = quantile * histogram['count']
+    cumulative = 0
+    lower_bound = 0.0
+    for bound, count in zip(histogram['buckets'], histogram['counts']):
+        if count and cumulative + count >= rank:
+            return lower_bound + (bound - lower_bound) * (rank - cumulative) / count
+        cumulative += count
+        lower_bound = bound
+
+    return histogram['buckets'][-1]
+
+
+REGISTRY = MetricsRegistry()
+
+
+def increment(name, value=1, **labels):
+    REGISTRY.increment(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+
+def recordRequest(method, url, status, seconds, num_bytes):
+    '''
+    Records one request sent to Spotify. `status` is 0 if no response was received (connection error or timeout).
+    '''
+    endpoint = endpointLabel(url)
+
+    REGISTRY.increment(REQUESTS_TOTAL, endpoint=endpoint, method=method, status=str(status))
+    REGISTRY.observe(REQUEST_DURATION, seconds, endpoint=endpoint, method=method)
+    if num_bytes:
+        REGISTRY.increment(RESPONSE_BYTES, num_bytes, endpoint=endpoint)
+
+
+def recordCacheLookups(cache, hits=0, misses=0):
+    if hits:
+        REGISTRY.increment(CACHE_LOOKUPS_TOTAL, hits, cache=cache, result='hit')
+    if misses:
+        REGISTRY.increment(CACHE_LOOKUPS_TOTAL, misses, cache=cache, result='miss')
+
+
+def renderPrometheus():
+    return REGISTRY.renderPrometheus()
+
+
+def writePrometheusFile(path=METRICS_FILE):
+    '''
+    Writes the metrics to a file in the Prometheus text format (e.g. for the node exporter's textfile collector). The file is replaced
+    atomically so a scraper never reads a partially written file.
+    '''
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    with open(f"{path}.part", 'w') as f:
+        f.write(renderPrometheus())
+    os.replace(f"{path}.part", path)
+
+    return path
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/metrics':
+            self.send_error(404)
+            return
+
+        body = renderPrometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def startMetricsServer(port, host='0.0.0.0'):
+    '''
+    Serves the metrics at http://{host}:{port}/metrics from a background thread. Only one server is started per process, so this can be called
+    on every Streamlit rerun.
+    '''
+    global _server
+
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+
+    return _server
@@ -0,0 +1,102 @@
+# Sidebar panel showing the request-level metrics of the process (see Metrics.py) on every page of the Streamlit app.
+
+import os
+import pandas as pd
+import streamlit as st
+from utilities import Metrics
+
+# When set, the metrics are also served in the Prometheus text format at http://0.0.0.0:{port}/metrics
+METRICS_PORT_VARIABLE = 'SPOTIFY_METRICS_PORT'
+
+
+def getEndpointSummary():
+    '''
+    Summarizes the requests per endpoint: number of requests, errors, throttled (429) responses, retries, p50/p95 latency and MB received.
+    '''
+    counters, histograms = Metrics.REGISTRY.snapshot()
+    rows = {}
+
+    for key, value in counters.get(Metrics.REQUESTS_TOTAL, {}).items():
+        labels = dict(key)
+        row = rows.setdefault(labels['endpoint'], {'Endpoint': labels['endpoint'], 'Requests': 0, 'Errors': 0, '429': 0, 'Retries': 0})
+        row['Requests'] += value
+        status = int(labels['status'])
+        if status == 0 or status >= 400:
+            row['Errors'] += value
+        if status == 429:
+            row['429'] += value
+
+    for key, value in counters.get(Metrics.RETRIES_TOTAL, {}).items():
+        endpoint = dict(key)['endpoint']
+        if endpoint in rows:
+            rows[endpoint]['Retries'] += value
+
+    latencies = {}
+    for key, histogram in histograms.get(Metrics.REQUEST_DURATION, {}).items():
+        # Merge the histograms of the different methods of the same endpoint
+        endpoint = dict(key)['endpoint']
+        merged = latencies.setdefault(endpoint, {'buckets': histogram['buckets'], 'counts': [0] * len(histogram['buckets']), 'sum': 0.0, 'count': 0})
+        merged['counts'] = [a + b for a, b in zip(merged['counts'], histogram['counts'])]
+        merged['sum'] += histogram['sum']
+        merged['count'] += histogram['count']
+
+    received_bytes = {dict(key)['endpoint']: value for key, value in counters.get(Metrics.RESPONSE_BYTES, {}).items()}
+
+    for endpoint, row in rows.items():
+        histogram = latencies.get(endpoint)
+        p50 = Metrics.histogramQuantile(histogram, 0.50) if histogram else None
+        p95 = Metrics.histogramQuantile(histogram, 0.95) if histogram else None
+        row['p50 (ms)'] = round(p50 * 1000, 1) if p50 is not None else None
+        row['p95 (ms)'] = round(p95 * 1000, 1) if p95 is not None else None
+        row['MB'] = round(received_bytes.get(endpoint, 0) / 2 ** 20, 2)
+
+    return pd.DataFrame(sorted(rows.values(), key=lambda row: -row['Requests']))
+
+
+def getCacheSummary():
+    '''
+    Summarizes the lookups per cache: hits, misses and hit ratio.
+    '''
+    counters, _ = Metrics.REGISTRY.snapshot()
+    rows = {}
+
+    for key, value in counters.get(Metrics.CACHE_LOOKUPS_TOTAL, {}).items():
+        labels = dict(key)
+        row = rows.setdefault(labels['cache'], {'Cache': labels['cache'], 'Hits': 0, 'Misses': 0})
+        row['Hits' if labels['result'] == 'hit' else 'Misses'] += value
+
+    for row in rows.values():
+        row['Hit Ratio'] = round(row['Hits'] / (row['Hits'] + row['Misses']), 3) if row['Hits'] + row['Misses'] else None
+
+    return pd.DataFrame(sorted(rows.values(), key=lambda row: row['Cache']))
+
+
+def renderMetricsPanel():
+    '''
+    Renders the metrics in a collapsed sidebar expander, and starts the Prometheus endpoint if SPOTIFY_METRICS_PORT is set.
+    '''
+    if os.getenv(METRICS_PORT_VARIABLE):
+        Metrics.startMetricsServer(int(os.getenv(METRICS_PORT_VARIABLE)))
+
+    with st.sidebar.expander('📈 API Metrics (this server process)'):
+        endpoint_summary = getEndpointSummary()
+        if endpoint_summary.empty:
+            st.write('No request has been sent to Spotify yet.')
+        else:
+            st.dataframe(endpoint_summary, hide_index=True)
+
+        counters, _ = Metrics.REGISTRY.snapshot()
+        rate_limiter_wait = sum(counters.get(Metrics.RATE_LIMITER_WAIT, {}).values())
+        st.write(f'Time spent waiting for the rate limiter: **{rate_limiter_wait:.1f}s**')
+
+        cache_summary = getCacheSummary()
+        if not cache_summary.empty:
+            st.dataframe(cache_summary, hide_index=True)
+
+        st.download_button(
+            label='Download Metrics (Prometheus)',
+            data=Metrics.renderPrometheus(),
+            file_name='metrics.prom',
+            mime='text/plain',
+            key='metrics_download_button'
+        )
@@ -0,0 +1,96 @@
+# Headless version of the whole Streamlit flow for one playlist: fetch (Home) -> extract the track list (Home) -> audio features (Home)
+# -> merge into the full dataset (MergeDataset) -> recommendations (ExtractRecommendations) -> audio features of the recommended tracks
+# (ExtractAudioFeatures). The track list and the audio features are kept once per track in the track and feature stores; the other
+# artifacts are written with the typed storage layer and recorded in the playlist catalog. A playlist saved before is synchronised
+# incrementally (see PlaylistSync.py).
+
+import os
+import time
+from utilities import SpotifyAuth, Playlists, PlaylistSync, Tracks, Storage, PlaylistCatalog, RecommendationHarvester
+
+RECOMMENDED_TRACKS = 'recommended-tracks'
+RECOMMENDED_TRACKS_AUDIO_FEATURES = 'recommended-tracks-with-audio-features'
+
+
+def flattenTracks(tracks_df):
+    '''
+    Replaces the nested objects of Spotify's track objects by plain values so they can be stored as typed columns: the album by its name, the
+    artists by the list of their names. The other nested objects (e.g. 'external_urls') are dropped.
+    '''
+    tracks_df = tracks_df.copy()
+
+    if 'album' in tracks_df.columns:
+        tracks_df['album'] = tracks_df['album'].map(lambda album: album.get('name') if isinstance(album, dict) else album)
+    if 'artists' in tracks_df.columns:
+        tracks_df['artists'] = tracks_df['artists'].map(lambda artists: [artist['name'] for artist in artists] if isinstance(artists, list) else artists)
+
+    nested_columns = [column for column in tracks_df.columns if tracks_df[column].map(lambda value: isinstance(value, dict)).any()]
+
+    return tracks_df.drop(columns=nested_columns)
+
+
+def runPlaylistPipeline(playlist_id, target_count=RecommendationHarvester.DEFAULT_TARGET_COUNT, force=False, recommend=True):
+    '''
+    Runs every stage of the pipeline for one playlist.
+
+    INPUT:
+        playlist_id (str): The ID of the playlist.
+        target_count (int): Number of unique recommended tracks to harvest. No recommendation is requested if `recommend` is False.
+        force (bool): If True, the playlist is downloaded again even if its snapshot ID has not changed.
+        recommend (bool): If False, the pipeline stops after the full dataset.
+
+    OUTPUT:
+        summary (dict): The playlist ID and name, the number of tracks, audio features and recommended tracks, the IDs whose audio features
+            could not be fetched, whether the playlist changed, the time taken, and the error message if a stage failed.
+    '''
+    start_time = time.perf_counter()
+    summary = {'playlist_id': playlist_id}
+
+    try:
+        os.makedirs(Storage.TEMPORARY_STORAGE_DIR, exist_ok=True)
+        catalog = PlaylistCatalog.getCatalog()
+
+        # Synchronise the saved copy of the playlist: a grown playlist only gets its new items requested, a changed one is downloaded again,
+        # and the full dataset is saved in both cases
+        sync = PlaylistSync.syncPlaylist(SpotifyAuth.getAccessToken(), playlist_id, catalog=catalog, force=force)
+        playlist_info = sync['playlist_info']
+        if sync['mode'] == 'error':
+            summary['error'] = playlist_info.get('error', {}).get('message', str(playlist_info))
+            return summary
+
+        # An unchanged playlist is read from its saved copy, and its full dataset is saved again from the track and feature stores
+        if sync['mode'] == 'unchanged':
+            tracks_df, _ = Playlists.loadSavedPlaylist(catalog.get(playlist_id))
+            PlaylistSync.saveDataset(SpotifyAuth.getAccessToken(), playlist_info, tracks_df, catalog, sync)
+
+        name = playlist_info['name']
+        full_dataset = sync['full_dataset']
+        summary.update(
+            name=name,
+            num_tracks=sync['num_items'],
+            changed=sync['mode'] != 'unchanged',
+            num_audio_features=sync['num_audio_features'],
+            failed_ids=sync['failed_ids'],
+        )
+
+        if recommend and len(full_dataset):
+            # Recommended tracks and their audio features
+            recommended_tracks_df = RecommendationHarvester.harvestRecommendations(
+                SpotifyAuth.getAccessToken(),
+                full_dataset,
+                target_count=target_count
+            )
+            summary['num_recommended_tracks'] = len(recommended_tracks_df)
+
+            if len(recommended_tracks_df):
+                recommended_features_df = Tracks.getAudioFeatures(SpotifyAuth.getAccessToken(), recommended_tracks_df['id'].tolist())
+
+                for kind, df in ((RECOMMENDED_TRACKS, flattenTracks(recommended_tracks_df)), (RECOMMENDED_TRACKS_AUDIO_FEATURES, recommended_features_df)):
+                    catalog.addArtifact(playlist_id, kind, Storage.saveArtifact(df, Storage.artifactName(name, playlist_id, kind)))
+    except Exception as e:
+        print(f"Pipeline Error ({playlist_id}): {e}")
+        summary['error'] = str(e)
+    finally:
+        summary['seconds'] = round(time.perf_counter() - start_time, 3)
+
+    return summary
@@ -0,0 +1,190 @@
+# Index of the playlists saved under `output/playlist`. Every time a playlist is saved, its name, ID, snapshot ID, number of tracks and the
+# paths of its artifacts are recorded in a small SQLite table, so that the pages can list the stored playlists with one indexed query instead
+# of listing the directory and parsing the file names (which breaks on playlist names containing '--').
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_CATALOG_PATH = 'output/cache/playlist_catalog.sqlite'
+
+
+class PlaylistCatalog:
+    '''
+    SQLite-backed catalog of the stored playlists.
+
+    INPUT:
+        path (str): Location of the SQLite database file.
+    '''
+
+    def __init__(self, path=DEFAULT_CATALOG_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self.connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS playlists (
+                    playlist_id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    snapshot_id TEXT,
+                    num_tracks INTEGER,
+                    playlist_path TEXT,
+                    artifacts TEXT NOT NULL DEFAULT '{}',
+                    saved_at REAL NOT NULL,
+                    info TEXT,
+                    etag TEXT
+                )
+            ''')
+            connection.execute('CREATE INDEX IF NOT EXISTS playlists_saved_at ON playlists (saved_at)')
+
+            # Catalogs created by older versions lack the columns added since
+            existing_columns = {row['name'] for row in connection.execute('PRAGMA table_info(playlists)')}
+            for column in ('info', 'etag'):
+                if column not in existing_columns:
+                    connection.execute(f'ALTER TABLE playlists ADD COLUMN {column} TEXT')
+
+    @contextmanager
+    def connect(self):
+        '''
+        Opens a connection to the database and runs the enclosed statements in one transaction, closing the connection afterwards.
+        '''
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def register(self, playlist_info, num_tracks, playlist_path, etag=None):
+        '''
+        Records (or updates) a saved playlist. The artifacts already recorded for the playlist are kept.
+
+        INPUT:
+            playlist_info (dict): The playlist information as returned by `Playlists.getPlaylistInfo`.
+            num_tracks (int): Number of items saved for the playlist.
+            playlist_path (str): Path of the playlist items saved as a JSON file by older versions, or None when the items are in the track
+                store.
+            etag (str): The ETag of the playlist header response, used for conditional requests when the playlist is refreshed.
+        '''
+        with self.lock, self.connect() as connection:
+            connection.execute(
+                '''
+                INSERT INTO playlists (playlist_id, name, snapshot_id, num_tracks, playlist_path, saved_at, info, etag) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (playlist_id) DO UPDATE SET
+                    name = excluded.name,
+                    snapshot_id = excluded.snapshot_id,
+                    num_tracks = excluded.num_tracks,
+                    playlist_path = excluded.playlist_path,
+                    saved_at = excluded.saved_at,
+                    info = excluded.info,
+                    etag = COALESCE(excluded.etag, playlists.etag)
+                ''',
+                (
+                    playlist_info['id'], playlist_info['name'], playlist_info.get('snapshot_id'), num_tracks, playlist_path, time.time(),
+                    json.dumps(playlist_info), etag
+                )
+            )
+
+    def setETag(self, playlist_id, etag):
+        with self.lock, self.connect() as connection:
+            connection.execute('UPDATE playlists SET etag = ? WHERE playlist_id = ?', (etag, playlist_id))
+
+    def addArtifact(self, playlist_id, kind, path):
+        '''
+        Records the path of an artifact of a playlist (e.g. its track list or audio features in `output/temporary_storage`).
+        '''
+        with self.lock, self.connect() as connection:
+            row = connection.execute('SELECT artifacts FROM playlists WHERE playlist_id = ?', (playlist_id,)).fetchone()
+            if row is None:
+                return
+
+            artifacts = json.loads(row['artifacts'])
+            artifacts[kind] = path
+            connection.execute('UPDATE playlists SET artifacts = ? WHERE playlist_id = ?', (json.dumps(artifacts), playlist_id))
+
+    def get(self, playlist_id):
+        '''
+        OUTPUT:
+            entry (dict): The catalog entry of the playlist, or None if it is not in the catalog.
+        '''
+        with self.connect() as connection:
+            row = connection.execute('SELECT * FROM playlists WHERE playlist_id = ?', (playlist_id,)).fetchone()
+
+        return toEntry(row) if row is not None else None
+
+    def listPlaylists(self):
+        '''
+        OUTPUT:
+            entries (list of dicts): Every playlist in the catalog, the most recently saved first.
+        '''
+        with self.connect() as connection:
+            rows = connection.execute('SELECT * FROM playlists ORDER BY saved_at DESC').fetchall()
+
+        return [toEntry(row) for row in rows]
+
+    def remove(self, playlist_id):
+        with self.lock, self.connect() as connection:
+            connection.execute('DELETE FROM playlists WHERE playlist_id = ?', (playlist_id,))
+
+    def importDirectory(self, directory='output/playlist'):
+        '''
+        Adds the playlists saved before the catalog existed, by parsing the "{Name}--{ID}.json" file names once. The ID is taken after the
+        last '--' so that names containing '--' are parsed correctly. Playlists already in the catalog are left untouched.
+
+        OUTPUT:
+            num_imported (int): Number of playlists added to the catalog.
+        '''
+        if not os.path.isdir(directory):
+            return 0
+
+        num_imported = 0
+        for filename in os.listdir(directory):
+            stem, extension = os.path.splitext(filename)
+            if extension not in ('.json', '.ndjson') or '--' not in stem:
+                continue
+
+            name, playlist_id = stem.rsplit('--', 1)
+            if self.get(playlist_id) is not None:
+                continue
+
+            self.register({'id': playlist_id, 'name': name}, None, os.path.join(directory, filename))
+            num_imported += 1
+
+        return num_imported
+
+
+def toEntry(row):
+    entry = dict(row)
+    entry['artifacts'] = json.loads(entry['artifacts'])
+    entry['info'] = json.loads(entry['info']) if entry['info'] else None
+
+    return entry
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def getCatalog():
+    '''
+    Returns the process-wide PlaylistCatalog stored at the default location, creating it on first use. Playlists saved before the catalog
+    existed are imported the first time it is created.
+    '''
+    global _catalog
+
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                catalog = PlaylistCatalog()
+                catalog.importDirectory()
+                _catalog = catalog
+
+    return _catalog
@@ -0,0 +1,186 @@
+# Incremental synchronisation of a saved playlist. Most playlists only grow at the end, so instead of downloading a changed playlist again,
+# only the items after the saved ones are requested and appended to the saved copy in the track store, and only the tracks without stored
+# audio features get them requested. The saved items are first checked to still be a prefix of the playlist, requesting only the fields that
+# identify the items. If they are not (tracks were removed, inserted or reordered), the playlist is downloaded again, and the added and
+# removed tracks are found by comparing the track IDs.
+
+from utilities import Playlists, Tracks, Storage, PlaylistCatalog, TrackStore, FeatureTable
+
+
+def trackIDs(items):
+    return [track_id for track_id, _ in items if track_id is not None]
+
+
+def syncPlaylist(access_token, playlist_id, catalog=None, max_workers=8, force=False):
+    '''
+    Brings the saved copy of a playlist, its track list, audio features and full dataset up to date with the fewest possible requests.
+
+    INPUT:
+        access_token (str): The access token for this app to access Spotify's API.
+        playlist_id (str): The ID of the playlist.
+        catalog (PlaylistCatalog): The catalog of the saved playlists. Defaults to the process-wide catalog.
+        max_workers (int): Maximum number of concurrent page requests.
+        force (bool): If True, the playlist is downloaded again even if it has not changed.
+
+    OUTPUT:
+        result (dict): Contains
+            'mode' - 'unchanged' if the playlist did not change, 'append' if only the new items were requested, 'full' if the playlist had to
+                be downloaded again, or 'error',
+            'playlist_info' - the playlist information (or the error response from Spotify's API),
+            'num_items' - the number of items of the playlist,
+            'added' - the IDs of the tracks added since the last sync,
+            'removed' - the IDs of the tracks removed since the last sync,
+            'full_dataset' - the merged track list and audio features (None if unchanged or on error),
+            'num_audio_features' - the number of tracks of the full dataset with audio features,
+            'failed_ids' - the IDs of the tracks whose audio features could not be fetched.
+    '''
+    if catalog is None:
+        catalog = PlaylistCatalog.getCatalog()
+
+    catalog_entry = catalog.get(playlist_id)
+    result = {
+        'mode': 'unchanged', 'playlist_info': None, 'num_items': 0, 'added': [], 'removed': [], 'full_dataset': None, 'num_audio_features': 0,
+        'failed_ids': [],
+    }
+
+    # Without a saved copy there is nothing to synchronise incrementally
+    if catalog_entry is None or not Playlists.isSavedSnapshot(catalog_entry, catalog_entry['snapshot_id']):
+        return fullSync(access_token, playlist_id, catalog, None, result)
+    if force:
+        return fullSync(access_token, playlist_id, catalog, Playlists.loadSavedItemKeys(catalog_entry), result)
+
+    playlist_header, etag = Playlists.getPlaylistHeader(access_token, playlist_id, catalog_entry['etag'])
+    # Entries saved without their playlist information need the header even if the playlist was not modified
+    if playlist_header is None and catalog_entry['info'] is None:
+        playlist_header, etag = Playlists.getPlaylistHeader(access_token, playlist_id)
+    if playlist_header is not None and 'error' in playlist_header:
+        result.update(mode='error', playlist_info=playlist_header)
+        return result
+    if playlist_header is None or playlist_header['snapshot_id'] == catalog_entry['snapshot_id']:
+        catalog.setETag(playlist_id, etag)
+        result.update(playlist_info=playlist_header or catalog_entry['info'], num_items=catalog_entry['num_tracks'])
+        return result
+
+    store = TrackStore.getStore()
+    saved_items = Playlists.loadSavedItemKeys(catalog_entry, store)
+
+    # The header already holds the playlist information, so only the first page of items is requested
+    playlist_info = playlist_header
+    first_page = Playlists.getFirstItemsPage(access_token, playlist_id)
+    if 'error' in first_page:
+        result.update(mode='error', playlist_info=first_page)
+        return result
+
+    new_items = getAppendedItems(access_token, playlist_id, first_page, saved_items, max_workers)
+    if new_items is None:
+        return fullSync(access_token, playlist_id, catalog, saved_items, result)
+
+    # Append the new items to the saved copy of the playlist, marking it as saved for the new snapshot in the same transaction
+    Playlists.storePlaylistItems(store, playlist_id, new_items, len(saved_items), playlist_info['snapshot_id'])
+
+    num_items = len(saved_items) + len(new_items)
+    catalog.register(playlist_info, num_items, None, etag)
+
+    tracks_df = Playlists.loadStoredTracks(playlist_id, store)
+    new_tracks_df = Playlists.extractTracks(new_items)
+
+    result.update(
+        mode='append',
+        playlist_info=playlist_info,
+        num_items=num_items,
+        added=list(dict.fromkeys(new_tracks_df['id'])) if len(new_tracks_df) else [],
+    )
+    saveDataset(access_token, playlist_info, tracks_df, catalog, result)
+
+    return result
+
+
+def getAppendedItems(access_token, playlist_id, first_page, saved_items, max_workers=8):
+    '''
+    Requests the items added at the end of the playlist since it was saved, checking that the saved items are still a prefix of the playlist:
+    every saved item must be at its saved position (only the fields identifying the items are requested for those beyond the first page), and
+    the playlist must consist of exactly the saved items followed by the new ones.
+
+    OUTPUT:
+        new_items (list): The items after the saved ones, or None if the saved items are no longer a prefix of the playlist.
+    '''
+    first_items = first_page['items']
+    total = first_page['total']
+    num_saved = len(saved_items)
+
+    if total < num_saved:
+        return None
+
+    num_compared = min(len(first_items), num_saved)
+    if [Playlists.itemKey(item) for item in first_items[:num_compared]] != saved_items[:num_compared]:
+        return None
+
+    # Compare the rest of the saved items with the keys of the items at their positions. A removal and an insertion in the middle of the
+    # playlist keep its length, so checking only the length or the last saved item would not notice them.
+    position = num_compared
+    saved_pages = Playlists.iterPlaylistRange(
+        access_token, playlist_id, num_compared, num_saved, max_workers=max_workers, fields=Playlists.ITEM_KEY_FIELDS
+    )
+    for items in saved_pages:
+        if [Playlists.itemKey(item) for item in items] != saved_items[position:position + len(items)]:
+            return None
+        position += len(items)
+    if position != num_saved:
+        return None
+
+    new_items = list(first_items[num_saved:])
+    for items in Playlists.iterPlaylistRange(access_token, playlist_id, max(num_saved, len(first_items)), total, max_workers=max_workers):
+        new_items.extend(items)
+
+    # Items missing from the range read (e.g. the playlist changed while it was read) mean the saved copy cannot be trusted either
+    if num_saved + len(new_items) != total:
+        return None
+
+    return new_items
+
+
+def fullSync(access_token, playlist_id, catalog, saved_items, result):
+    '''
+    Downloads the whole playlist again and finds the added and removed tracks by comparing them with the saved items, if any.
+    '''
+    playlist_info, tracks_df, num_items, _ = Playlists.refreshPlaylist(access_token, playlist_id, catalog=catalog, force=True)
+    if tracks_df is None:
+        result.update(mode='error', playlist_info=playlist_info)
+        return result
+
+    current_ids = set(tracks_df['id'])
+    saved_ids = set(trackIDs(saved_items or []))
+
+    result.update(
+        mode='full',
+        playlist_info=playlist_info,
+        num_items=num_items,
+        added=[track_id for track_id in dict.fromkeys(tracks_df['id']) if track_id not in saved_ids],
+        removed=sorted(saved_ids - current_ids),
+    )
+    saveDataset(access_token, playlist_info, tracks_df, catalog, result)
+
+    return result
+
+
+def saveDataset(access_token, playlist_info, tracks_df, catalog, result=None):
+    '''
+    Saves the full dataset of a synchronised playlist. Its track list is in the track store, and its audio features are read from the
+    feature store, so only the tracks without stored audio features are requested. If a sync result is given, the full dataset, the number
+    of audio features and the IDs whose audio features could not be fetched are stored in it.
+
+    OUTPUT:
+        full_dataset (pd.DataFrame): The track list merged with the audio features.
+    '''
+    name, playlist_id = playlist_info['name'], playlist_info['id']
+
+    audio_features = Tracks.getAudioFeatureTable(access_token, list(dict.fromkeys(tracks_df['id'])))
+    full_dataset = FeatureTable.mergeDataset(tracks_df, audio_features)
+
+    full_dataset_path = Storage.saveArtifact(full_dataset, Storage.artifactName(name, playlist_id, Storage.FULL_DATASET))
+    catalog.addArtifact(playlist_id, Storage.FULL_DATASET, full_dataset_path)
+
+    if result is not None:
+        result.update(full_dataset=full_dataset, num_audio_features=len(audio_features), failed_ids=list(audio_features.failed_ids))
+
+    return full_dataset
@@ -1,85 +1,579 @@
-import requests
-from tqdm import tqdm
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 import pandas as pd
+from utilities import SpotifyClient, Memo, PlaylistCatalog, TrackStore, FeatureTable
 
+# Maximum number of items Spotify returns per page of playlist tracks
+PAGE_LIMIT = 100
 
-def getPublicPlaylist(access_token, playlist_id):
+# Fields of the playlist object needed for the playlist information, requested without any of its tracks
+PLAYLIST_HEADER_FIELDS = 'id,name,uri,description,owner(display_name),followers(total),snapshot_id'
+
+# Fields of a page of playlist items needed to identify the items (see `itemKey`), a small fraction of the full track objects
+ITEM_KEY_FIELDS = 'items(added_at,track(id))'
+
+# Playlists are memoized for a minute, after which their header is checked again. Their tracks are only downloaded again when they change.
+PLAYLIST_INFO_TTL = 60
+PLAYLIST_TRACKS_MAX_BYTES = 512 * 1024 * 1024
+
+# Details to extract about each track
+TRACK_DETAILS = ['id', 'name', 'disc_number', 'track_number',
+                 'duration_ms', 'popularity', 'uri', 'href']
+
+# Columns of the track lists, and metadata kept per track in the track store
+TRACK_COLUMNS = ['Album', 'Artists'] + TRACK_DETAILS
+
+# Number of items of a playlist saved as a JSON file by older versions that are moved into the track store at a time
+IMPORT_CHUNK_SIZE = 1000
+
+
+def getPlaylistInfo(access_token, playlist_id):
     '''
-    Extracts the public information about the playlist itself given its ID. This also includes the items or tracks inside the playlist itself.
+    Extracts the public information about the playlist itself given its ID, together with the first page of its items.
 
     INPUT:
         access_token (str): The access token for this app to access Spotify's API.
         playlist_id (str): The ID of the playlist to be extracted.
 
     OUTPUT:
-        response (json): The JSON response from Spotify's API.
+        playlist_info (dict): Name, ID, URI, description, owner, followers and snapshot ID of the playlist. If the request failed, this is the
+            error response from Spotify's API instead (containing an 'error' key).
+        first_page (dict): The first paging object of the playlist items, or None if the request failed.
     '''
-
-    base_url = f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks"
     headers = {
         'Authorization': f'Bearer {access_token}',
     }
 
     # Get info about the playlist itself
-    playlist_info_full = requests.get(f"https://api.spotify.com/v1/playlists/{playlist_id}", headers=headers).json()
-    print(playlist_info_full)
+    playlist_info_full = getPlaylistResponse(SpotifyClient.apiURL(f"/playlists/{playlist_id}"), headers).json()
+
+    if 'error' in playlist_info_full:
+        return playlist_info_full, None
+
+    return toPlaylistInfo(playlist_info_full), playlist_info_full['tracks']
 
-    # Get only name and ID of the playlist
-    playlist_info = {
+
+def getPlaylistResponse(url, headers):
+    '''
+    Requests a playlist object through the shared rate limiter, retrying on throttling and transient failures. Client errors such as an
+    unknown playlist ID are returned as they are, so that Spotify's error message can be displayed; a request still throttled or failing
+    after all the retries raises an HTTPError.
+
+    OUTPUT:
+        response (requests.Response): The response, with a 2xx, 304 or client-error status.
+    '''
+    response = SpotifyClient.getClient().getWithRetry(url, limiter=SpotifyClient.getRateLimiter(), headers=headers)
+    if response.status_code == 429 or response.status_code >= 500:
+        response.raise_for_status()
+
+    return response
+
+
+def toPlaylistInfo(playlist_info_full):
+    '''
+    Keeps only the name, ID and the other details of the playlist object that are displayed and stored.
+    '''
+    return {
         'name': playlist_info_full['name'],
         'id': playlist_info_full['id'],
         'uri': playlist_info_full['uri'],
         'description': playlist_info_full['description'],
         'owner': playlist_info_full['owner']['display_name'],
         'followers': playlist_info_full['followers']['total'],
+        'snapshot_id': playlist_info_full.get('snapshot_id'),
+    }
+
+
+def getPlaylistHeader(access_token, playlist_id, etag=None):
+    '''
+    Requests only the header of the playlist (its details and snapshot ID, without any track). If the ETag of a previous response is given,
+    the request is conditional: Spotify answers "304 Not Modified" without a body when the playlist has not changed since.
+
+    INPUT:
+        access_token (str): The access token for this app to access Spotify's API.
+        playlist_id (str): The ID of the playlist.
+        etag (str): The ETag of the previous response, if any.
+
+    OUTPUT:
+        playlist_info (dict): The playlist information, None if the playlist was not modified, or the error response from Spotify's API.
+        etag (str): The ETag of the response (the given one if the playlist was not modified).
+    '''
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+    }
+    if etag:
+        headers['If-None-Match'] = etag
+
+    response = getPlaylistResponse(SpotifyClient.apiURL(f"/playlists/{playlist_id}?fields={PLAYLIST_HEADER_FIELDS}"), headers)
+
+    if response.status_code == 304:
+        return None, etag
+
+    playlist_info_full = response.json()
+    if 'error' in playlist_info_full:
+        return playlist_info_full, None
+
+    return toPlaylistInfo(playlist_info_full), response.headers.get('ETag')
+
+
+def getFirstItemsPage(access_token, playlist_id):
+    '''
+    Requests only the first page of the items of a playlist, e.g. once its header showed that it has changed.
+
+    OUTPUT:
+        first_page (dict): The first paging object of the playlist items, or the error response from Spotify's API (containing an 'error' key).
+    '''
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+    }
+
+    return getPlaylistResponse(SpotifyClient.apiURL(f"/playlists/{playlist_id}/tracks?offset=0&limit={PAGE_LIMIT}"), headers).json()
+
+
+def itemKey(item):
+    '''
+    Identifies a playlist item by its track ID and the time it was added, so that the same track added twice counts as two items.
+    '''
+    if not item:
+        return (None, None)
+
+    return ((item.get('track') or {}).get('id'), item.get('added_at'))
+
+
+def trackRecord(track):
+    '''
+    Extracts the metadata of a track kept in the track store, i.e. its values for the TRACK_COLUMNS of the track lists.
+    '''
+    record = {
+        'Album': (track.get('album') or {}).get('name'),
+        'Artists': [artist['name'] for artist in track.get('artists') or []],
     }
+    for detail in TRACK_DETAILS:
+        record[detail] = track.get(detail)
+
+    return record
+
+
+def storePlaylistItems(store, playlist_id, items, start_position=0, snapshot_id=None, download_id=None):
+    '''
+    Saves consecutive items of a playlist in the track store: their track IDs and 'added_at' in the playlist, and the metadata of their tracks.
+    If `snapshot_id` is given, the playlist is also marked as completely stored up to these items. If `download_id` is given, the items are
+    staged for that download instead (see `TrackStore.beginPlaylist`).
+    '''
+    tracks = {}
+    for item in items:
+        track = item.get('track') if item else None
+        if track and track.get('id') is not None:
+            tracks[track['id']] = trackRecord(track)
+
+    store.addItems(playlist_id, start_position, [itemKey(item) for item in items], tracks, snapshot_id, download_id)
+
+
+def loadStoredTracks(playlist_id, store=None, dtype_backend=None):
+    '''
+    Builds the track list of a playlist from the track store, with the same columns as `extractTracks`.
+    '''
+    if store is None:
+        store = TrackStore.getStore()
+
+    columns = {column: [] for column in TRACK_COLUMNS}
+    for record in store.iterPlaylistTracks(playlist_id):
+        columns['Album'].append(FeatureTable.internString(record['Album']))
+        columns['Artists'].append([FeatureTable.internString(artist) for artist in record['Artists']])
+        for detail in TRACK_DETAILS:
+            columns[detail].append(record[detail])
+
+    return applyDtypeBackend(pd.DataFrame(columns), dtype_backend)
+
+
+def isStored(catalog_entry, store=None):
+    '''
+    Checks if the track store holds the complete playlist of a catalog entry, at the snapshot ID of the entry.
+    '''
+    if store is None:
+        store = TrackStore.getStore()
+
+    stored_playlist = store.getPlaylist(catalog_entry['playlist_id'])
+
+    return stored_playlist is not None and stored_playlist['snapshot_id'] == catalog_entry['snapshot_id']
+
+
+def importSavedFile(catalog_entry, store):
+    '''
+    Moves a playlist saved as a JSON file in `output/playlist` (by versions before the track store) into the track store.
+    '''
+    playlist_id = catalog_entry['playlist_id']
+    items = loadPlaylistItems(catalog_entry['playlist_path'])
+
+    download_id = store.beginPlaylist(playlist_id)
+    try:
+        num_items = 0
+        while chunk := list(islice(items, IMPORT_CHUNK_SIZE)):
+            storePlaylistItems(store, playlist_id, chunk, num_items, download_id=download_id)
+            num_items += len(chunk)
+    except BaseException:
+        store.abortPlaylist(download_id)
+        raise
+    store.finishPlaylist(playlist_id, catalog_entry['snapshot_id'], num_items, download_id)
+
+
+def getSavedPlaylistStore(catalog_entry, store=None):
+    '''
+    Returns the track store holding the saved copy of a playlist, moving it there first if it was saved as a JSON file.
+    '''
+    if store is None:
+        store = TrackStore.getStore()
+
+    if not isStored(catalog_entry, store):
+        importSavedFile(catalog_entry, store)
+
+    return store
+
+
+def loadSavedPlaylist(catalog_entry, store=None):
+    '''
+    Reads the tracks of a saved playlist from the track store, without any request to Spotify.
+
+    OUTPUT:
+        tracks_df (pd.DataFrame): The tracks included in the playlist.
+        num_items (int): Number of items of the playlist.
+    '''
+    store = getSavedPlaylistStore(catalog_entry, store)
+
+    return loadStoredTracks(catalog_entry['playlist_id'], store), store.getPlaylist(catalog_entry['playlist_id'])['num_items']
+
+
+def loadSavedItemKeys(catalog_entry, store=None):
+    '''
+    OUTPUT:
+        item_keys (list of tuples): (track ID, added_at) of every saved item of a playlist (see `itemKey`), in order.
+    '''
+    return getSavedPlaylistStore(catalog_entry, store).getItemKeys(catalog_entry['playlist_id'])
+
+
+def isSavedSnapshot(catalog_entry, snapshot_id):
+    '''
+    Checks if the saved copy of a playlist is complete and matches the given snapshot ID. The copy is either in the track store or, for
+    playlists saved by older versions, in a JSON file.
+    '''
+    return (
+        catalog_entry is not None
+        and snapshot_id is not None
+        and catalog_entry['snapshot_id'] == snapshot_id
+        and (
+            isStored(catalog_entry)
+            or (catalog_entry['playlist_path'] is not None and os.path.exists(catalog_entry['playlist_path']))
+        )
+    )
+
+
+def refreshPlaylist(access_token, playlist_id, catalog=None, force=False):
+    '''
+    Refreshes the saved copy of a playlist only if it has changed. The header of the playlist is requested first (conditionally, using the
+    stored ETag), and its snapshot ID is compared with the stored one. If they match, the tracks are read from the saved copy; otherwise the
+    whole playlist is downloaded again and saved in the track store.
+
+    INPUT:
+        access_token (str): The access token for this app to access Spotify's API.
+        playlist_id (str): The ID of the playlist.
+        catalog (PlaylistCatalog): The catalog of the saved playlists. Defaults to the process-wide catalog.
+        force (bool): If True, the playlist is downloaded again even if it has not changed.
+
+    OUTPUT:
+        playlist_info (dict): The playlist information, or the error response from Spotify's API.
+        tracks_df (pd.DataFrame): The tracks included in the playlist, or None if the request failed.
+        num_items (int): Number of items of the playlist.
+        changed (bool): True if the playlist was downloaded again.
+    '''
+    if catalog is None:
+        catalog = PlaylistCatalog.getCatalog()
+
+    catalog_entry = catalog.get(playlist_id)
+    etag = catalog_entry['etag'] if catalog_entry is not None and not force else None
+
+    playlist_info, etag = getPlaylistHeader(access_token, playlist_id, etag)
+
+    # 304 Not Modified: the saved copy is still up to date
+    if playlist_info is None and catalog_entry['info'] is not None and isSavedSnapshot(catalog_entry, catalog_entry['snapshot_id']):
+        tracks_df, num_items = loadSavedPlaylist(catalog_entry)
+        return catalog_entry['info'], tracks_df, num_items, False
+
+    if playlist_info is None:
+        playlist_info, etag = getPlaylistHeader(access_token, playlist_id)
+    if 'error' in playlist_info:
+        return playlist_info, None, 0, False
+
+    if not force and isSavedSnapshot(catalog_entry, playlist_info['snapshot_id']):
+        catalog.setETag(playlist_id, etag)
+        tracks_df, num_items = loadSavedPlaylist(catalog_entry)
+        return playlist_info, tracks_df, num_items, False
+
+    # The header already holds the playlist information, so only the items are requested
+    first_page = getFirstItemsPage(access_token, playlist_id)
+    if 'error' in first_page:
+        return first_page, None, 0, False
+
+    tracks_df, num_items = streamPlaylistToStore(access_token, playlist_info, first_page)
+    catalog.register(playlist_info, num_items, None, etag)
+
+    return playlist_info, tracks_df, num_items, True
+
+
+def getPublicPlaylist(access_token, playlist_id, parallel=False, max_workers=8):
+    '''
+    Extracts the public information about the playlist itself given its ID. This also includes the items or tracks inside the playlist itself.
+
+    INPUT:
+        access_token (str): The access token for this app to access Spotify's API.
+        playlist_id (str): The ID of the playlist to be extracted.
+        parallel (bool): If True, the pages of tracks are fetched concurrently by offset instead of following the 'next' links one by one.
+        max_workers (int): Maximum number of pages requested at the same time when `parallel` is True.
+
+    OUTPUT:
+        response (json): The JSON response from Spotify's API.
+    '''
+
+    playlist_info, first_page = getPlaylistInfo(access_token, playlist_id)
+    if first_page is None:
+        return playlist_info, playlist_info
 
     # Get the playlist data = data about the tracks inside the playlist
     playlist_data = []
-    while base_url:
-        response = requests.get(base_url, headers=headers).json()
-        playlist_data.extend(response['items'])
-        base_url = response['next']
+    for items in iterPlaylistPages(access_token, playlist_id, first_page, parallel, max_workers):
+        playlist_data.extend(items)
 
     return playlist_info, playlist_data
 
 
-def extractTracks(playlist_data):
+def fetchPlaylistPage(client, playlist_id, headers, offset, limit=PAGE_LIMIT, fields=None, limiter=None):
+    '''
+    Requests a single page of tracks of the playlist starting at the given offset, retrying on HTTP 429 and transient errors. If `fields` is
+    given, only these fields of the items are requested (e.g. ITEM_KEY_FIELDS).
+
+    OUTPUT:
+        items (list): The playlist items in that page.
+    '''
+    base_url = SpotifyClient.apiURL(f"/playlists/{playlist_id}/tracks?offset={offset}&limit={limit}")
+    if fields:
+        base_url += f"&fields={fields}"
+    response = client.getWithRetry(base_url, limiter=limiter, headers=headers)
+    response.raise_for_status()
+
+    return response.json()['items']
+
+
+def iterPlaylistPages(access_token, playlist_id, first_page, parallel=False, max_workers=8):
     '''
-    Given a JSON data about playlist, this will extract the tracks included in the playlist.
+    Yields the items of a playlist page by page, as they arrive, starting with the given first page. Only a bounded number of pages is held
+    in memory at any time, so the caller can process or store each page before the next ones are downloaded.
+
+    INPUT:
+        access_token (str): The access token for this app to access Spotify's API.
+        playlist_id (str): The ID of the playlist.
+        first_page (dict): The first paging object of the playlist items (e.g. as returned by `getPlaylistInfo`).
+        parallel (bool): If True, every page offset is computed up front from the 'total' of the first page, and the remaining pages are
+            requested concurrently. Otherwise the 'next' links are followed one by one.
+        max_workers (int): Maximum number of concurrent page requests when `parallel` is True.
+
+    OUTPUT:
+        items (generator of lists): The items of each page, in the original order of the playlist.
+    '''
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+    }
+    client = SpotifyClient.getClient()
+    limiter = SpotifyClient.getRateLimiter()
+
+    yield first_page['items']
+
+    if not parallel:
+        base_url = first_page['next']
+        while base_url:
+            response = client.getWithRetry(base_url, limiter=limiter, headers=headers)
+            response.raise_for_status()
+            page = response.json()
+            yield page['items']
+            base_url = page['next']
+        return
+
+    # The offsets of the remaining pages are known once we have the total number of items
+    yield from iterPlaylistRange(
+        access_token,
+        playlist_id,
+        len(first_page['items']),
+        first_page['total'],
+        first_page.get('limit') or PAGE_LIMIT,
+        max_workers
+    )
+
+
+def iterPlaylistRange(access_token, playlist_id, start, stop, page_size=PAGE_LIMIT, max_workers=8, fields=None):
+    '''
+    Yields the items of the playlist between the offsets `start` (included) and `stop` (excluded), page by page and in order. The pages are
+    requested concurrently, with at most `max_workers` pages in flight. If `fields` is given, only these fields of the items are requested.
+
+    OUTPUT:
+        items (generator of lists): The items of each page, in the original order of the playlist.
+    '''
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+    }
+    client = SpotifyClient.getClient()
+    limiter = SpotifyClient.getRateLimiter()
+
+    offsets = iter(range(start, stop, page_size))
+
+    # Keep at most `max_workers` pages in flight, and yield them in the order of their offsets regardless of which request finishes first
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque(
+            executor.submit(fetchPlaylistPage, client, playlist_id, headers, offset, page_size, fields, limiter)
+            for offset in islice(offsets, max_workers)
+        )
+        while pending:
+            items = pending.popleft().result()
+            for offset in islice(offsets, 1):
+                pending.append(executor.submit(fetchPlaylistPage, client, playlist_id, headers, offset, page_size, fields, limiter))
+            yield items[:stop - start]
+            start += len(items)
+
+
+def streamPlaylistToStore(access_token, playlist_info, first_page, store=None, chunk_size=1000, parallel=True, max_workers=8, dtype_backend=None):
+    '''
+    Saves the items of a playlist in the track store as the pages arrive, and extracts the tracks in chunks of `chunk_size` items. The raw
+    JSON of the whole playlist is therefore never held in memory at once, and tracks already stored for other playlists are not duplicated.
+
+    INPUT:
+        access_token (str): The access token for this app to access Spotify's API.
+        playlist_info (dict): The playlist information (e.g. as returned by `getPlaylistInfo`). Its snapshot ID is stored once all the items
+            have been saved.
+        first_page (dict): The first paging object of the playlist items (e.g. as returned by `getPlaylistInfo`).
+        store (TrackStore): The track store to save to. Defaults to the process-wide store.
+        chunk_size (int): Number of items passed to `extractTracks` at a time.
+
+    OUTPUT:
+        tracks_df (pd.DataFrame): The tracks included in the playlist, as returned by `extractTracks`.
+        num_items (int): Number of items saved.
+    '''
+    if store is None:
+        store = TrackStore.getStore()
+
+    playlist_id = playlist_info['id']
+    tracks_chunks = []
+    buffer = []
+    num_items = 0
+
+    # The items are staged under this download and only replace the stored copy once they are all saved, so a concurrent download of the
+    # same playlist cannot leave a mix of both
+    download_id = store.beginPlaylist(playlist_id)
+    try:
+        for items in iterPlaylistPages(access_token, playlist_id, first_page, parallel, max_workers):
+            storePlaylistItems(store, playlist_id, items, num_items, download_id=download_id)
+            num_items += len(items)
+
+            buffer.extend(items)
+            if len(buffer) >= chunk_size:
+                tracks_chunks.append(extractTracks(buffer))
+                buffer = []
+    except BaseException:
+        store.abortPlaylist(download_id)
+        raise
+    store.finishPlaylist(playlist_id, playlist_info.get('snapshot_id'), num_items, download_id)
+
+    if buffer or not tracks_chunks:
+        tracks_chunks.append(extractTracks(buffer))
+
+    # The dtypes are applied once on the whole track list so that the categories are shared by all the chunks
+    tracks_df = applyDtypeBackend(pd.concat(tracks_chunks, ignore_index=True), dtype_backend)
+
+    return tracks_df, num_items
+
+
+def loadPlaylistItems(filename):
+    '''
+    Yields the items of a playlist saved in `output/playlist` by versions before the track store, one by one. Both NDJSON files (one item
+    per line) and the older files containing a single JSON list are supported.
+    '''
+    if filename.endswith('.ndjson'):
+        with open(filename) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(filename) as f:
+            yield from json.load(f)
+
+
+def extractTracks(playlist_data, dtype_backend=None):
+    '''
+    Given a JSON data about playlist, this will extract the tracks included in the playlist. The values are collected column by column and the
+    DataFrame is built once from these columns. Items without a track (e.g. removed tracks) or without a Spotify ID (e.g. local files) are skipped.
 
     INPUT:
         playlist_data (np.array): List of tracks included in the playlis.
+        dtype_backend (str): Optional dtypes for the 'Album' and 'Artists' columns:
+            None - plain Python objects (strings and lists of strings),
+            'category' - 'Album' is categorical ('Artists' keeps its lists since lists cannot be categories),
+            'pyarrow' - 'Album' is an Arrow string and 'Artists' an Arrow list of strings.
 
     OUTPUT:
         tracks_df (pd.DataFrame): A pandas DataFrame containing the tracks included in the playlist and their corresponding information.
     '''
 
-    # Details to extract about each track
-    trackDetails = ['id', 'name', 'disc_number', 'track_number',
-                    'duration_ms', 'popularity', 'uri', 'href']
+    # One list per column of the resulting DataFrame
+    columns = {column: [] for column in TRACK_COLUMNS}
+    album_column = columns['Album']
+    artists_column = columns['Artists']
+    detail_columns = [columns[detail] for detail in TRACK_DETAILS]
 
-    # The tracks in the playlist
-    playlistTracks = []
+    for item in playlist_data:
+        trackRawData = item.get('track') if item else None
+        if not trackRawData or trackRawData.get('id') is None:
+            continue
 
-    for item in tqdm(playlist_data):
-        trackRawData = item['track']
+        # Album and artist names repeat across tracks and playlists, so a single interned copy of each is kept
+        album_column.append(FeatureTable.internString((trackRawData.get('album') or {}).get('name')))
+        artists_column.append([FeatureTable.internString(artist['name']) for artist in trackRawData.get('artists') or []])
 
-        trackInformation = {}
+        for detail, column in zip(TRACK_DETAILS, detail_columns):
+            column.append(trackRawData.get(detail))
 
-        # Extract album name
-        trackInformation['Album'] = trackRawData['album']['name']
+    tracks_df = pd.DataFrame(columns)
 
-        # Extract the artists
-        trackInformation['Artists'] = [artist['name']
-                                       for artist in trackRawData['artists']]
+    return applyDtypeBackend(tracks_df, dtype_backend)
 
-        # Extract the other details about the track itself
-        for detail in trackDetails:
-            trackInformation[detail] = trackRawData[detail]
 
-        playlistTracks.append(trackInformation)
+def applyDtypeBackend(tracks_df, dtype_backend=None):
+    '''
+    Converts the 'Album' and 'Artists' columns of a track list to the dtypes described in `extractTracks`.
+    '''
+    if dtype_backend == 'category':
+        tracks_df['Album'] = tracks_df['Album'].astype('category')
+    elif dtype_backend == 'pyarrow':
+        import pyarrow as pa
 
-    tracks_df = pd.DataFrame(playlistTracks)
+        tracks_df['Album'] = tracks_df['Album'].astype(pd.ArrowDtype(pa.string()))
+        tracks_df['Artists'] = pd.array(list(tracks_df['Artists']), dtype=pd.ArrowDtype(pa.list_(pa.string())))
+    elif dtype_backend is not None:
+        raise ValueError(f"Unknown dtype_backend: {dtype_backend}")
 
     return tracks_df
+
+
+@Memo.memoize(
+    ttl=PLAYLIST_INFO_TTL,
+    max_entries=32,
+    key=lambda access_token, playlist_id: playlist_id,
+    should_cache=lambda result: result[1] is not None,
+    max_bytes=PLAYLIST_TRACKS_MAX_BYTES,
+    sizeof=lambda result: int(result[1].memory_usage(deep=True).sum()),
+)
+def getCachedPlaylist(access_token, playlist_id):
+    '''
+    Memoized `refreshPlaylist`, shared across Streamlit reruns and sessions: the header of the playlist is checked at most once a minute, and
+    the playlist is only downloaded again once its snapshot ID has changed. Error responses are not cached. The returned DataFrame is shared
+    between sessions and must not be modified in place.
+    '''
+    return refreshPlaylist(access_token, playlist_id)
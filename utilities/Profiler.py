@@ -0,0 +1,277 @@
+# Opt-in profiler of the Streamlit reruns. Every page re-executes from top to bottom on each widget interaction, so the time of a rerun is
+# split into named stages (reading a dataset, rendering a table, building a CSV for a download button, calling Spotify...). The stages of
+# every rerun are kept in a rolling history per page, shared by the sessions of the process, and a stage taking much longer than its median
+# is flagged as a regression. Optionally, the stages are also run under cProfile and the statistics of the slowest reruns are dumped.
+#
+# Profiling is off unless the SPOTIFY_PROFILE environment variable is set:
+#   SPOTIFY_PROFILE=1         time the stages and show them in the sidebar
+#   SPOTIFY_PROFILE=cprofile  also dump cProfile statistics of the slowest reruns of each page to output/cache/profiles
+#
+# USAGE (in a page):
+#   profiler = Profiler.startRerun('3_ExtractRecommendations')
+#   with Profiler.stage('read full dataset'):
+#       full_dataset = Storage.loadArtifact(...)
+#   ...
+#   profiler.finish()
+#
+# A rerun interrupted by `st.stop()` never reaches `finish()`; it is recorded when the same session starts its next rerun of the page.
+
+import cProfile
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+import streamlit as st
+
+PROFILING_VARIABLE = 'SPOTIFY_PROFILE'
+
+PROFILES_DIR = 'output/cache/profiles'
+
+# Number of reruns kept in the history of each page
+HISTORY_SIZE = 50
+
+# A stage is flagged when it takes REGRESSION_FACTOR times its median over at least MIN_SAMPLES earlier reruns, and at least
+# REGRESSION_MIN_SECONDS more than it
+REGRESSION_FACTOR = 2.0
+REGRESSION_MIN_SECONDS = 0.05
+MIN_SAMPLES = 5
+
+# Number of cProfile dumps kept per page (the slowest reruns)
+SLOWEST_PROFILES = 5
+
+# Name under which the total time of a rerun is stored among its stages
+TOTAL = 'total'
+
+_history = {}
+_slowest_profiles = {}
+_history_lock = threading.Lock()
+_current = threading.local()
+
+
+def getProfilingMode():
+    '''
+    Returns None if profiling is off, 'cprofile' if the stages are also run under cProfile, or 'timings' otherwise.
+    '''
+    mode = os.getenv(PROFILING_VARIABLE, '').strip().lower()
+    if mode in ('', '0', 'false', 'off'):
+        return None
+
+    return 'cprofile' if mode == 'cprofile' else 'timings'
+
+
+def getHistory(page):
+    '''
+    Returns a copy of the recorded reruns of a page, oldest first. Each rerun is a dict with its 'timestamp' and the seconds of each stage
+    (and of the whole rerun under 'total').
+    '''
+    with _history_lock:
+        return list(_history.get(page, ()))
+
+
+def getMedians(page):
+    '''
+    Returns the median seconds of every stage of a page over its recorded reruns, with the number of samples: {stage: (median, samples)}.
+    '''
+    samples = {}
+    for rerun in getHistory(page):
+        for name, seconds in rerun['stages'].items():
+            samples.setdefault(name, []).append(seconds)
+
+    return {name: (statistics.median(values), len(values)) for name, values in samples.items()}
+
+
+def isRegression(seconds, median, num_samples):
+    return (
+        num_samples >= MIN_SAMPLES
+        and seconds > median * REGRESSION_FACTOR
+        and seconds - median > REGRESSION_MIN_SECONDS
+    )
+
+
+class RerunProfiler:
+    '''
+    Collects the stages of one rerun of a page. When profiling is off, `stage` does nothing.
+
+    INPUT:
+        page (str): Name of the page, e.g. 'Home' or '3_ExtractRecommendations'.
+        mode (str): None, 'timings' or 'cprofile' (see `getProfilingMode`).
+    '''
+
+    def __init__(self, page, mode=None):
+        self.page = page
+        self.mode = mode
+        self.enabled = mode is not None
+        self.started_at = time.perf_counter()
+        self.ended_at = self.started_at
+        self.stages = {}
+        self.depth = 0
+        self.finished = False
+        self.profile = cProfile.Profile() if mode == 'cprofile' else None
+        self.medians = getMedians(page) if self.enabled else {}
+        self.placeholder = None
+
+    @contextmanager
+    def stage(self, name):
+        '''
+        Times the enclosed block as the stage `name`. Nested stages are timed as well, and a stage entered twice in a rerun is summed.
+        '''
+        if not self.enabled or self.finished:
+            yield
+            return
+
+        if self.profile is not None and self.depth == 0:
+            self.profile.enable()
+        self.depth += 1
+        start_time = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.ended_at = time.perf_counter()
+            self.depth -= 1
+            if self.profile is not None and self.depth == 0:
+                self.profile.disable()
+
+            self.stages[name] = self.stages.get(name, 0.0) + self.ended_at - start_time
+            self.render()
+
+    def total(self):
+        return self.ended_at - self.started_at
+
+    def getRegressions(self):
+        '''
+        Returns the stages of this rerun (and 'total') flagged as regressions, as {stage: (seconds, median)}.
+        '''
+        regressions = {}
+        for name, seconds in {**self.stages, TOTAL: self.total()}.items():
+            median, num_samples = self.medians.get(name, (None, 0))
+            if median is not None and isRegression(seconds, median, num_samples):
+                regressions[name] = (seconds, median)
+
+        return regressions
+
+    def render(self):
+        '''
+        Shows the stages of the rerun so far in the sidebar. The same placeholder is updated after every stage, so the report is up to date
+        even if the page stops early.
+        '''
+        if self.placeholder is None:
+            self.placeholder = st.sidebar.empty()
+
+        regressions = self.getRegressions()
+        rows = [
+            {
+                'Stage': name,
+                'ms': round(seconds * 1000, 1),
+                'Median ms': round(self.medians[name][0] * 1000, 1) if name in self.medians else None,
+                'Regression': '⚠️' if name in regressions else '',
+            }
+            for name, seconds in {**self.stages, TOTAL: self.total()}.items()
+        ]
+
+        with self.placeholder.container():
+            with st.expander(f'⏱️ Rerun Profile ({self.total() * 1000:.0f} ms)', expanded=bool(regressions)):
+                st.dataframe(rows, hide_index=True)
+                st.caption(f'Medians over the last {len(getHistory(self.page))} reruns of this page in this server process.')
+
+    def finish(self):
+        '''
+        Records the rerun in the history of the page, and dumps its cProfile statistics if it is one of the slowest reruns. Called at the end
+        of the page, or when the next rerun of the same session starts.
+        '''
+        if not self.enabled or self.finished:
+            return
+        self.finished = True
+
+        # A rerun stopped before its first stage (e.g. on the login form) says nothing about the stages
+        if not self.stages:
+            return
+
+        with _history_lock:
+            history = _history.setdefault(self.page, deque(maxlen=HISTORY_SIZE))
+            history.append({'timestamp': time.time(), 'stages': {**self.stages, TOTAL: self.total()}})
+
+        if self.profile is not None:
+            self.dumpIfSlowest()
+
+    def dumpIfSlowest(self):
+        total = self.total()
+
+        with _history_lock:
+            slowest = _slowest_profiles.setdefault(self.page, [])
+            if len(slowest) >= SLOWEST_PROFILES and total <= slowest[0][0]:
+                return
+
+            os.makedirs(PROFILES_DIR, exist_ok=True)
+            path = os.path.join(PROFILES_DIR, f"{self.page}-{time.strftime('%Y%m%d-%H%M%S')}-{total * 1000:.0f}ms.pstats")
+            self.profile.dump_stats(path)
+
+            slowest.append((total, path))
+            slowest.sort()
+            while len(slowest) > SLOWEST_PROFILES:
+                _, evicted_path = slowest.pop(0)
+                if os.path.exists(evicted_path):
+                    os.remove(evicted_path)
+
+
+def startRerun(page):
+    '''
+    Starts profiling a rerun of the page and makes it the current profiler of the script thread. The previous rerun of the same session is
+    recorded first if it stopped before calling `finish()`.
+
+    OUTPUT:
+        profiler (RerunProfiler): The profiler of this rerun. It does nothing if profiling is off.
+    '''
+    mode = getProfilingMode()
+    profiler = RerunProfiler(page, mode)
+
+    if mode is not None:
+        session_key = f'_rerun_profiler_{page}'
+        previous_profiler = st.session_state.get(session_key)
+        if previous_profiler is not None:
+            previous_profiler.finish()
+            # The medians must include the previous rerun
+            profiler.medians = getMedians(page)
+        st.session_state[session_key] = profiler
+
+    _current.profiler = profiler
+
+    return profiler
+
+
+def getCurrentProfiler():
+    return getattr(_current, 'profiler', None)
+
+
+@contextmanager
+def stage(name):
+    '''
+    Times the enclosed block as a stage of the current rerun. Does nothing outside of a profiled rerun (e.g. in the batch pipeline).
+    '''
+    profiler = getCurrentProfiler()
+    if profiler is None or not profiler.enabled:
+        yield
+        return
+
+    with profiler.stage(name):
+        yield
+
+
+def profiled(name=None):
+    '''
+    Decorator timing every call of a function as a stage of the current rerun, named after the function by default.
+    '''
+    def decorator(function):
+        stage_name = name or function.__name__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
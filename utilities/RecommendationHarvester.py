@@ -0,0 +1,136 @@
+# Automated harvesting of recommended tracks. Instead of running the recommendation page round after round by hand, many rounds of 5 seed
+# tracks taken from the playlist are sent to Spotify's recommendations concurrently. The recommended tracks are de-duplicated on the fly
+# (against each other and against the tracks already in the playlist), and the harvest stops as soon as the target number of unique
+# tracks is reached.
+
+import math
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import pandas as pd
+from utilities import ExtractRecommendedTracks, SeedSelection
+
+# Number of unique recommended tracks to collect per playlist, as in the manual labelling workflow
+DEFAULT_TARGET_COUNT = 200
+
+# Number of random samples in a row that may repeat an earlier seed set before the seed rounds are considered exhausted
+MAX_REPEATED_SAMPLES = 100
+
+
+def generateSeedRounds(full_dataset, seeds_per_round=SeedSelection.MAX_SEEDS, random_seed=None):
+    '''
+    Yields seed rounds with distinct sets of seed tracks. The first round uses the most representative tracks of the playlist (see
+    `SeedSelection`); the following rounds use random samples of the playlist so that the recommendations cover more of it. The sequence
+    ends once every set of seed tracks has been used (e.g. after the first round for a playlist of at most 5 tracks), since a repeated set
+    would only get the same recommendations again.
+
+    INPUT:
+        full_dataset (pd.DataFrame): The FULL DATASET of the playlist, with at least the 'id', 'danceability', 'energy' and 'valence' columns.
+        seeds_per_round (int): Number of seed tracks per round (at most 5).
+        random_seed (int): Seed of the random generator, for reproducible harvests.
+
+    OUTPUT:
+        seedTrackInfos (generator of lists of dicts): The seed tracks of each round.
+    '''
+    records = full_dataset.to_dict('records')
+    seeds_per_round = min(seeds_per_round, len(records))
+    rng = np.random.default_rng(random_seed)
+
+    first_round = [records[index] for index in SeedSelection.selectSeedIndices(full_dataset, seeds_per_round)]
+    used_seed_sets = {frozenset(record['id'] for record in first_round)}
+    yield first_round
+
+    num_seed_sets = math.comb(full_dataset['id'].nunique(), seeds_per_round)
+    repeated_samples = 0
+    while len(used_seed_sets) < num_seed_sets and repeated_samples < MAX_REPEATED_SAMPLES:
+        seed_round = [records[index] for index in rng.choice(len(records), size=seeds_per_round, replace=False)]
+
+        seed_set = frozenset(record['id'] for record in seed_round)
+        if len(seed_set) < seeds_per_round or seed_set in used_seed_sets:
+            repeated_samples += 1
+            continue
+
+        repeated_samples = 0
+        used_seed_sets.add(seed_set)
+        yield seed_round
+
+
+def harvestRecommendations(access_token, full_dataset, target_count=DEFAULT_TARGET_COUNT, tracks_per_request=50, max_workers=4, max_rounds=50,
+                           exclude_ids=(), random_seed=None, progress_callback=None):
+    '''
+    Runs rounds of recommendation requests concurrently until `target_count` unique recommended tracks are collected.
+
+    INPUT:
+        access_token (str): The access token for this app to access Spotify's API.
+        full_dataset (pd.DataFrame): The FULL DATASET of the playlist.
+        target_count (int): Number of unique recommended tracks to collect.
+        tracks_per_request (int): Number of tracks requested per round (at most 100).
+        max_workers (int): Maximum number of recommendation requests in flight.
+        max_rounds (int): Maximum number of rounds. No round is started either once the seed rounds are exhausted, or once a round
+            brought no new track (Spotify keeps recommending the same tracks).
+        exclude_ids (iterable): Additional track IDs that must not be collected (e.g. tracks already labelled).
+        random_seed (int): Seed of the random generator used to pick the seed tracks.
+        progress_callback (callable): Optional function called with (number of unique tracks, number of finished rounds) after each round.
+
+    OUTPUT:
+        recommended_tracks_df (pd.DataFrame): The unique recommended tracks (at most `target_count`), in the order they were collected, with
+            the 'round' they came from.
+    '''
+    seen_ids = set(full_dataset['id']) | set(exclude_ids)
+    recommended_tracks = []
+    seed_rounds = generateSeedRounds(full_dataset, random_seed=random_seed)
+
+    submitted_rounds = 0
+    finished_rounds = 0
+    exhausted = False
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+
+        def submitRound():
+            nonlocal submitted_rounds, exhausted
+            seed_round = next(seed_rounds, None)
+            if seed_round is None:
+                exhausted = True
+                return
+
+            future = executor.submit(ExtractRecommendedTracks.generateRecommendations, access_token, seed_round, tracks_per_request)
+            pending[future] = submitted_rounds
+            submitted_rounds += 1
+
+        for _ in range(min(max_workers, max_rounds)):
+            submitRound()
+
+        while pending and len(recommended_tracks) < target_count:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                round_number = pending.pop(future)
+                finished_rounds += 1
+
+                try:
+                    tracks = future.result()
+                except Exception as e:
+                    print(f"Recommendation Round {round_number} Error: {e}")
+                    tracks = None
+
+                # Keep only the tracks that are neither in the playlist nor already collected
+                num_collected = len(recommended_tracks)
+                for track in tracks or []:
+                    if track['id'] not in seen_ids and len(recommended_tracks) < target_count:
+                        seen_ids.add(track['id'])
+                        recommended_tracks.append({**track, 'round': round_number})
+
+                # A round without any new track means further rounds are unlikely to bring any either
+                if tracks is not None and len(recommended_tracks) == num_collected:
+                    exhausted = True
+
+                if progress_callback is not None:
+                    progress_callback(len(recommended_tracks), finished_rounds)
+
+                if len(recommended_tracks) < target_count and submitted_rounds < max_rounds and not exhausted:
+                    submitRound()
+
+        # The target has been reached: the rounds still waiting to start are not needed anymore
+        for future in pending:
+            future.cancel()
+
+    return pd.DataFrame(recommended_tracks)
@@ -0,0 +1,115 @@
+# Automatic selection of representative seed tracks. Spotify's recommendations accept at most 5 seed tracks, so the seeds should cover the
+# different "regions" of the playlist in the audio-feature space. The tracks are clustered with a vectorized k-medoids (initialized by
+# farthest-point sampling from the medoid of the whole playlist), and the medoid of each cluster is used as a seed track.
+
+import numpy as np
+from utilities.LocalRecommender import FEATURE_COLUMNS
+
+# Maximum number of seed tracks accepted by Spotify's /v1/recommendations endpoint
+MAX_SEEDS = 5
+
+
+def normalizeFeatures(features_df, feature_columns):
+    '''
+    Min-max normalizes the feature columns into a float32 matrix so that every feature weighs the same. Missing values are set to the middle.
+    '''
+    matrix = features_df[feature_columns].to_numpy(dtype=np.float32, na_value=np.nan)
+    minimums = np.nanmin(matrix, axis=0)
+    ranges = np.nanmax(matrix, axis=0) - minimums
+    ranges[ranges == 0] = 1
+
+    matrix = (matrix - minimums) / ranges
+
+    return np.nan_to_num(matrix, nan=0.5)
+
+
+def squaredDistances(matrix, points):
+    '''
+    Squared Euclidean distances between every row of `matrix` and every row of `points`, as an (n_rows, n_points) array.
+    '''
+    return (
+        (matrix ** 2).sum(axis=1)[:, None]
+        - 2 * matrix @ points.T
+        + (points ** 2).sum(axis=1)[None, :]
+    ).clip(min=0)
+
+
+def medoid(matrix, rows):
+    '''
+    Returns the row minimizing the sum of squared distances to the given rows. For squared Euclidean distances, this is the row nearest to
+    their mean, which avoids computing every pairwise distance.
+    '''
+    centroid = matrix[rows].mean(axis=0)
+
+    return rows[np.argmin(((matrix[rows] - centroid) ** 2).sum(axis=1))]
+
+
+def selectSeedIndices(features_df, num_seeds=MAX_SEEDS, feature_columns=None, method='kmedoids', max_iterations=20):
+    '''
+    Selects the rows of the dataset that best cover its audio-feature space.
+
+    INPUT:
+        features_df (pd.DataFrame): The dataset, e.g. the FULL DATASET of a playlist, containing the audio-feature columns.
+        num_seeds (int): Number of seed tracks to select.
+        feature_columns (list): The feature columns to use. Defaults to the columns of `LocalRecommender.FEATURE_COLUMNS` present in the dataset.
+        method (str): 'farthest' for the medoid of the playlist followed by farthest-point sampling, or 'kmedoids' to refine these seeds with
+            k-medoids iterations.
+        max_iterations (int): Maximum number of k-medoids iterations.
+
+    OUTPUT:
+        seed_indices (list): Positional indices of the selected rows, the seed of the largest cluster first.
+    '''
+    if feature_columns is None:
+        feature_columns = [column for column in FEATURE_COLUMNS if column in features_df.columns]
+    if not feature_columns:
+        raise ValueError('The dataset does not contain any audio-feature column.')
+
+    matrix = normalizeFeatures(features_df, feature_columns)
+    num_seeds = min(num_seeds, len(matrix))
+    if num_seeds == 0:
+        return []
+
+    # Farthest-point sampling, starting from the medoid of the whole playlist
+    seeds = [medoid(matrix, np.arange(len(matrix)))]
+    nearest_seed_distance = squaredDistances(matrix, matrix[seeds]).ravel()
+    while len(seeds) < num_seeds:
+        # Every remaining track is identical to a seed (e.g. duplicates), so there is nothing left to cover
+        if nearest_seed_distance.max() == 0:
+            break
+        seeds.append(int(np.argmax(nearest_seed_distance)))
+        nearest_seed_distance = np.minimum(nearest_seed_distance, squaredDistances(matrix, matrix[seeds[-1:]]).ravel())
+
+    seeds = np.asarray(seeds)
+    num_seeds = len(seeds)
+    labels = squaredDistances(matrix, matrix[seeds]).argmin(axis=1)
+
+    if method == 'kmedoids':
+        for _ in range(max_iterations):
+            new_seeds = np.array([
+                medoid(matrix, np.flatnonzero(labels == cluster)) if (labels == cluster).any() else seeds[cluster]
+                for cluster in range(num_seeds)
+            ])
+            if np.array_equal(new_seeds, seeds):
+                break
+
+            seeds = new_seeds
+            labels = squaredDistances(matrix, matrix[seeds]).argmin(axis=1)
+    elif method != 'farthest':
+        raise ValueError(f"Unknown method: {method}")
+
+    # The seed representing the most tracks comes first
+    cluster_sizes = np.bincount(labels, minlength=num_seeds)
+
+    return [int(seeds[cluster]) for cluster in np.argsort(-cluster_sizes, kind='stable')]
+
+
+def selectSeedTracks(features_df, num_seeds=MAX_SEEDS, feature_columns=None, method='kmedoids'):
+    '''
+    Selects the IDs of the seed tracks that best cover the audio-feature space of the dataset. Can be called from batch jobs without any UI.
+
+    OUTPUT:
+        seed_ids (list): The IDs of the selected tracks, the most representative first.
+    '''
+    seed_indices = selectSeedIndices(features_df, num_seeds, feature_columns, method)
+
+    return features_df['id'].iloc[seed_indices].tolist()
@@ -1,6 +1,8 @@
-import requests
 import os
-import streamlit as st
+import threading
+import time
+from collections import deque
+from utilities import SpotifyClient
 # import toml
 # Load the TOML file
 # config = toml.load('config.toml')
@@ -19,10 +21,10 @@ def getAppAccessToken():
 
     # We use the "Client Credentials Flow" from Spotify's Authorization Guide
     body_params = {'grant_type': 'client_credentials'}
-    url = 'https://accounts.spotify.com/api/token'
+    url = SpotifyClient.accountsURL('/api/token')
 
     # Make a POST request to the Spotify Accounts service with the body parameters
-    auth_response = requests.post(
+    auth_response = SpotifyClient.getClient().post(
         url,
         data=body_params,
         # auth=(os.getenv('SPOTIFY_CLIENT_ID'),
@@ -31,65 +33,172 @@ def getAppAccessToken():
         #     config['spotify']['SPOTIFY_CLIENT_ID'],
         #     config['spotify']['SPOTIFY_CLIENT_SECRET']
         # )
-        auth=(
-            st.secrets['SPOTIFY_CLIENT_ID'],
-            st.secrets['SPOTIFY_CLIENT_SECRET']
-        )
+        auth=getClientCredentials()
     ).json()
 
     return auth_response
 
+
+def getClientCredentials():
+    '''
+    Returns the (client ID, client secret) of the app. The SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET environment variables are used when they
+    are set (e.g. for the headless batch pipeline), otherwise the Streamlit secrets.
+    '''
+    if os.getenv('SPOTIFY_CLIENT_ID') and os.getenv('SPOTIFY_CLIENT_SECRET'):
+        return os.getenv('SPOTIFY_CLIENT_ID'), os.getenv('SPOTIFY_CLIENT_SECRET')
+
+    # Streamlit is only imported when its secrets are needed, so that the headless batch pipeline does not load it
+    import streamlit as st
+
+    return st.secrets['SPOTIFY_CLIENT_ID'], st.secrets['SPOTIFY_CLIENT_SECRET']
+
+
+# Refresh the token this many seconds before it actually expires, so requests already in flight never carry an expired token
+DEFAULT_REFRESH_MARGIN = 120
+
+# Number of replaced tokens remembered, so that requests still carrying one of them when they get a 401 are retried with the current token
+REPLACED_TOKENS_KEPT = 4
+
+
+class TokenManager:
+    '''
+    Keeps the app's access token together with its expiry time, and refreshes it shortly before it expires. Only one thread performs the
+    refresh at a time; the other threads waiting on it re-use the token it obtained (single-flight refresh).
+
+    INPUT:
+        fetch_token (callable): Function returning the raw token response of Spotify's Accounts service (with 'access_token' and 'expires_in').
+        refresh_margin (float): Number of seconds before the expiry at which the token is considered stale.
+    '''
+
+    def __init__(self, fetch_token=getAppAccessToken, refresh_margin=DEFAULT_REFRESH_MARGIN):
+        self.fetch_token = fetch_token
+        self.refresh_margin = refresh_margin
+        self.access_token = None
+        self.expires_at = 0.0
+        self.replaced_tokens = deque(maxlen=REPLACED_TOKENS_KEPT)
+        self.lock = threading.Lock()
+
+    def isFresh(self, access_token=None):
+        '''
+        Checks locally (without any request) whether the managed token, or the given token if it is the managed one, is still usable.
+        '''
+        if access_token is not None and access_token != self.access_token:
+            return False
+
+        return self.access_token is not None and time.time() < self.expires_at - self.refresh_margin
+
+    def expiresIn(self):
+        '''
+        OUTPUT:
+            seconds (float): Number of seconds until the managed token expires, or 0 if there is none.
+        '''
+        return max(0.0, self.expires_at - time.time()) if self.access_token is not None else 0.0
+
+    def getToken(self):
+        '''
+        Returns a usable access token, requesting a new one from Spotify only if the current one is missing or about to expire.
+        '''
+        if self.isFresh():
+            return self.access_token
+
+        with self.lock:
+            # Another thread may have refreshed the token while we were waiting for the lock
+            if self.isFresh():
+                return self.access_token
+
+            auth_response = self.fetch_token()
+            if 'access_token' not in auth_response:
+                raise RuntimeError(f"Could not get an access token from Spotify: {auth_response}")
+
+            if self.access_token is not None:
+                self.replaced_tokens.append(self.access_token)
+            self.access_token = auth_response['access_token']
+            self.expires_at = time.time() + auth_response.get('expires_in', 3600)
+
+            print(f"New Spotify Access Token obtained. Expires in {auth_response.get('expires_in', 3600)} seconds.")
+
+            return self.access_token
+
+    def invalidate(self, access_token=None):
+        '''
+        Forces the next `getToken` to request a new token, e.g. after the API unexpectedly answered with 401. If `access_token` is given, the
+        managed token is only dropped if it is still that one, so concurrent 401s do not trigger several refreshes.
+        '''
+        with self.lock:
+            if access_token is None or access_token == self.access_token:
+                if self.access_token is not None:
+                    self.replaced_tokens.append(self.access_token)
+                self.access_token = None
+                self.expires_at = 0.0
+
+    def replaceRejected(self, access_token):
+        '''
+        Handles a 401 answered to a request sent with the given token: the token is dropped if it is still the managed one, and a new one is
+        requested (once, however many requests were rejected at the same time).
+
+        OUTPUT:
+            access_token (str): The token to retry the request with, or None if the rejected token was not issued by this manager.
+        '''
+        with self.lock:
+            if access_token != self.access_token and access_token not in self.replaced_tokens:
+                return None
+
+        self.invalidate(access_token)
+
+        return self.getToken()
+
+
+_token_manager = None
+_token_manager_lock = threading.Lock()
+
+
+def getTokenManager():
+    '''
+    Returns the process-wide TokenManager shared by all Streamlit sessions and threads.
+    '''
+    global _token_manager
+
+    if _token_manager is None:
+        with _token_manager_lock:
+            if _token_manager is None:
+                _token_manager = TokenManager()
+
+    return _token_manager
+
+
+def getAccessToken():
+    '''
+    Returns a valid access token for the app from the shared TokenManager.
+    '''
+    return getTokenManager().getToken()
+
+
 def validateToken(access_token):
     '''
-    Checks if the current access token is still valid by sending a simple request to Spotify's API. If it is not valid, request for a new one, and save it to the environment variables.
+    Checks if the current access token is still valid using the expiry tracked by the TokenManager, without sending any request to Spotify's API.
+    If it is not valid (expired, about to expire, or not issued by the TokenManager), the managed token is returned instead, refreshing it if needed.
     
     INPUT
         access_token (str) - The current access token to be validated
         
     OUTPUT
         spotify_access_token (str) - The new access token if the current one is invalid
-        response (dict) - The response from the API
+        response (dict) - Information about the validity of the token
         success (bool) - True if authentication is successful, False otherwise
     '''
 
+    token_manager = getTokenManager()
+
     try:
-        url = f"https://api.spotify.com/v1/playlists/37i9dQZF1DXcBWIGoYBM5M"
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-        }
-
-        response = requests.get(url, headers=headers).json()
-
-        # Check if response is error or not
-        if 'error' in response:
-
-            # If the response is an error, then the token is invalid. Request for a new token and replace the environment variable
-            spotify_access_token = getAppAccessToken()['access_token']
-                    
-            # Save the new access token to the .env file
-            # with open('.env', 'r') as f:
-            #     lines = f.readlines()
-
-            #     # Modify the line that contains the variable
-            #     new_lines = []
-            #     for line in lines:
-            #         if line.startswith('SPOTIFY_ACCESS_TOKEN='):
-            #             line = f'SPOTIFY_ACCESS_TOKEN={spotify_access_token}\n'
-            #         new_lines.append(line)
-
-            #     # Check if a .env file exists. If not, create one first. Otherwise, just overwrite the existing one.
-            #     if os.path.exists('.env'):
-            #         with open('.env', 'w') as f:
-            #             f.writelines(new_lines)
-            #     else:
-            #         with open('.env', 'x') as f:
-            #             f.writelines(new_lines)
-
-            print(f"New Spotify Access Token:\n{spotify_access_token}")
-
-            return spotify_access_token, response, True
-        else:
-            return None, response, True
+        if token_manager.isFresh(access_token):
+            return None, {'expires_in': int(token_manager.expiresIn())}, True
+
+        spotify_access_token = token_manager.getToken()
+
+        return spotify_access_token, {
+            'error': {'message': 'The access token is expired or was not issued for this app.'},
+            'expires_in': int(token_manager.expiresIn()),
+        }, True
     except Exception as e:
         print(f"Exception:\n{e}")
         return None, f"Exception:\n{e}", False
@@ -0,0 +1,349 @@
+# Shared HTTP client for every request sent to Spotify's Web API and Accounts service. It keeps a pool of keep-alive connections so that
+# consecutive requests (e.g. the pages of a large playlist or the batches of audio features) re-use the same TCP+TLS connection instead of
+# opening a new one each time. It also negotiates gzip-compressed responses and always applies a timeout so a stuck socket cannot block a worker.
+
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from utilities import Metrics
+
+# Base URLs of Spotify's Web API and Accounts service. They can be pointed at another server (e.g. tools/MockSpotifyServer.py) through the
+# SPOTIFY_API_BASE_URL and SPOTIFY_ACCOUNTS_BASE_URL environment variables, or with `configureBaseURLs`.
+API_BASE_URL = os.getenv('SPOTIFY_API_BASE_URL', 'https://api.spotify.com/v1').rstrip('/')
+ACCOUNTS_BASE_URL = os.getenv('SPOTIFY_ACCOUNTS_BASE_URL', 'https://accounts.spotify.com').rstrip('/')
+
+# (connect timeout, read timeout) in seconds
+DEFAULT_TIMEOUT = (3.05, 30)
+
+# Number of distinct hosts to keep pools for, and number of keep-alive connections kept per host
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 32
+
+# Retry policy for throttled (429) and transient (5xx / connection) failures
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_CAP = 30.0
+
+# Default client-side request budget shared by all threads of the process. Spotify counts the requests of an app over a rolling 30-second
+# window and does not publish the number allowed, which depends on the app's quota mode (development or extended), so the default stays
+# well below the point where apps in development mode start getting 429s. Apps with a higher quota can raise it through the
+# SPOTIFY_RATE_LIMIT (requests per second) and SPOTIFY_RATE_BURST environment variables, or with `configureClient`.
+DEFAULT_RATE = float(os.getenv('SPOTIFY_RATE_LIMIT', 5.0))
+DEFAULT_BURST = int(os.getenv('SPOTIFY_RATE_BURST', 10))
+
+
+class TokenBucket:
+    '''
+    Thread-safe token-bucket rate limiter. Tokens are refilled continuously at `rate` per second up to `capacity`, and every request consumes one.
+
+    INPUT:
+        rate (float): Number of requests allowed per second on average.
+        capacity (int): Maximum burst of requests allowed at once.
+    '''
+
+    def __init__(self, rate=DEFAULT_RATE, capacity=DEFAULT_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Blocks until a token is available, then consumes it. The time spent waiting is recorded in the metrics.
+        '''
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    if waited:
+                        Metrics.increment(Metrics.RATE_LIMITER_WAIT, waited)
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds):
+        '''
+        Stops handing out tokens for the given number of seconds, e.g. after the API answered with a `Retry-After` header.
+        '''
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+def getRetryDelay(response, attempt, backoff_base=DEFAULT_BACKOFF_BASE, backoff_cap=DEFAULT_BACKOFF_CAP):
+    '''
+    Computes how long to wait before retrying. The `Retry-After` header is honoured when present (plus a small jitter so that waiting workers do
+    not retry in lockstep); otherwise exponential backoff with full jitter is used.
+
+    INPUT:
+        response (requests.Response or None): The failed response, or None if the request raised a connection error.
+        attempt (int): Zero-based number of the attempt that failed.
+
+    OUTPUT:
+        delay (float): Number of seconds to wait.
+    '''
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+
+    if retry_after is not None:
+        try:
+            return float(retry_after) + random.uniform(0, backoff_base)
+        except ValueError:
+            pass
+
+    return random.uniform(0, min(backoff_cap, backoff_base * (2 ** attempt)))
+
+
+class SpotifyClient:
+    '''
+    Thin wrapper around a `requests.Session` with connection pooling, gzip negotiation and default timeouts.
+
+    INPUT:
+        timeout (float or tuple): Timeout applied to every request unless overridden per call. Either a single value or a (connect, read) tuple.
+        pool_connections (int): Number of per-host connection pools to cache.
+        pool_maxsize (int): Maximum number of keep-alive connections kept per host. Should be at least the number of worker threads that share the client.
+    '''
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE):
+        self.timeout = timeout
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+        )
+
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+        })
+
+    def request(self, method, url, **kwargs):
+        '''
+        Sends a request through the pooled session, applying the default timeout when none is given. The endpoint, status, latency and size
+        of every request are recorded in the metrics. A request rejected with 401 because its access token was revoked or expired early is
+        sent once more with a new token from the TokenManager (see `renewAuthorization`).
+
+        OUTPUT:
+            response (requests.Response): The raw response. Gzip-encoded bodies are decompressed transparently by `requests`.
+        '''
+        kwargs.setdefault('timeout', self.timeout)
+
+        response = self.sendOnce(method, url, **kwargs)
+        if response.status_code == 401:
+            headers = renewAuthorization(kwargs.get('headers'))
+            if headers is not None:
+                Metrics.increment(Metrics.RETRIES_TOTAL, endpoint=Metrics.endpointLabel(url), reason='401')
+                response = self.sendOnce(method, url, **{**kwargs, 'headers': headers})
+
+        return response
+
+    def sendOnce(self, method, url, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except requests.RequestException:
+            Metrics.recordRequest(method, url, 0, time.perf_counter() - start_time, 0)
+            raise
+
+        # Size on the wire (compressed) when the server sends it, otherwise the size of the body
+        num_bytes = response.headers.get('Content-Length')
+        num_bytes = int(num_bytes) if num_bytes and num_bytes.isdigit() else len(response.content)
+        Metrics.recordRequest(method, url, response.status_code, time.perf_counter() - start_time, num_bytes)
+
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def getWithRetry(self, url, limiter=None, max_retries=DEFAULT_MAX_RETRIES, **kwargs):
+        '''
+        Sends a GET request, waiting for the rate limiter before every attempt and retrying on HTTP 429, 5xx and connection errors.
+
+        INPUT:
+            url (str): The URL to request.
+            limiter (TokenBucket): Optional rate limiter shared between the threads issuing requests. It is paused for `Retry-After` seconds when throttled.
+            max_retries (int): Maximum number of retries after the first attempt.
+
+        OUTPUT:
+            response (requests.Response): The last response received. Its status may still be 429 or 5xx if all the retries were used up.
+        '''
+        for attempt in range(max_retries + 1):
+            if limiter is not None:
+                limiter.acquire()
+
+            try:
+                response = self.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == max_retries:
+                    raise
+                Metrics.increment(Metrics.RETRIES_TOTAL, endpoint=Metrics.endpointLabel(url), reason='connection')
+                time.sleep(getRetryDelay(None, attempt))
+                continue
+
+            if response.status_code != 429 and response.status_code < 500:
+                return response
+            if attempt == max_retries:
+                return response
+
+            Metrics.increment(Metrics.RETRIES_TOTAL, endpoint=Metrics.endpointLabel(url), reason='429' if response.status_code == 429 else '5xx')
+            delay = getRetryDelay(response, attempt)
+            if response.status_code == 429 and limiter is not None:
+                limiter.pause(delay)
+            time.sleep(delay)
+
+        return response
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+def renewAuthorization(headers):
+    '''
+    Replaces the bearer token of the headers of a request rejected with 401 by a new token of the app, if the rejected token was issued by
+    SpotifyAuth's TokenManager.
+
+    OUTPUT:
+        headers (dict): The headers to send the request again with, or None if it must not be retried.
+    '''
+    authorization = (headers or {}).get('Authorization', '')
+    if not authorization.startswith('Bearer '):
+        return None
+
+    # Imported here since SpotifyAuth itself uses this module
+    from utilities import SpotifyAuth
+
+    access_token = SpotifyAuth.getTokenManager().replaceRejected(authorization[len('Bearer '):])
+    if access_token is None:
+        return None
+
+    return {**headers, 'Authorization': f'Bearer {access_token}'}
+
+
+def apiURL(path):
+    '''
+    Builds the URL of an endpoint of the Web API, e.g. apiURL('/audio-features?ids=...').
+    '''
+    return f"{API_BASE_URL}{path}"
+
+
+def accountsURL(path):
+    '''
+    Builds the URL of an endpoint of the Accounts service, e.g. accountsURL('/api/token').
+    '''
+    return f"{ACCOUNTS_BASE_URL}{path}"
+
+
+def configureBaseURLs(api_base_url=None, accounts_base_url=None):
+    '''
+    Points every utilities module at other base URLs for the Web API and/or the Accounts service.
+    '''
+    global API_BASE_URL, ACCOUNTS_BASE_URL
+
+    if api_base_url is not None:
+        API_BASE_URL = api_base_url.rstrip('/')
+    if accounts_base_url is not None:
+        ACCOUNTS_BASE_URL = accounts_base_url.rstrip('/')
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def getClient():
+    '''
+    Returns the process-wide SpotifyClient, creating it with the default settings on first use. The underlying session is thread-safe for
+    concurrent GET/POST requests, so all utilities modules and Streamlit sessions share it.
+    '''
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SpotifyClient()
+
+    return _client
+
+
+_limiter = None
+
+
+def getRateLimiter():
+    '''
+    Returns the process-wide TokenBucket used to keep concurrent batches under Spotify's rate limit.
+    '''
+    global _limiter
+
+    if _limiter is None:
+        with _client_lock:
+            if _limiter is None:
+                _limiter = TokenBucket()
+
+    return _limiter
+
+
+def configureClient(timeout=DEFAULT_TIMEOUT, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE, rate=None, burst=None):
+    '''
+    Replaces the process-wide SpotifyClient with one using the given timeout and pool sizes. The previous client's connections are closed.
+    If `rate` or `burst` is given, the process-wide rate limiter is replaced as well (the other one keeping its current value).
+
+    OUTPUT:
+        client (SpotifyClient): The newly configured shared client.
+    '''
+    global _client, _limiter
+
+    with _client_lock:
+        previous_client = _client
+        _client = SpotifyClient(
+            timeout=timeout,
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+        )
+
+        if rate is not None or burst is not None:
+            _limiter = TokenBucket(
+                rate=rate if rate is not None else (_limiter.rate if _limiter is not None else DEFAULT_RATE),
+                capacity=burst if burst is not None else (_limiter.capacity if _limiter is not None else DEFAULT_BURST),
+            )
+
+    if previous_client is not None:
+        previous_client.close()
+
+    return _client
+
+
+def setClient(client):
+    '''
+    Replaces the process-wide SpotifyClient with the given one (e.g. an instrumented subclass used by tools/LoadGenerator.py). The previous
+    client's connections are closed.
+    '''
+    global _client
+
+    with _client_lock:
+        previous_client = _client
+        _client = client
+
+    if previous_client is not None and previous_client is not client:
+        previous_client.close()
+
+    return client
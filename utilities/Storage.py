@@ -0,0 +1,139 @@
+# Storage layer for the DataFrames saved under `output/temporary_storage` (track lists, audio features, full datasets and recommended tracks).
+# They are stored as typed Parquet files so that dtypes survive a round trip (e.g. 'Artists' stays a list of strings), files are smaller,
+# and a page can read only the columns it needs. CSV is only produced for the download buttons.
+
+import ast
+import os
+import pandas as pd
+
+TEMPORARY_STORAGE_DIR = 'output/temporary_storage'
+
+# Kinds of artifacts saved per playlist
+TRACK_LIST = 'track-list'
+AUDIO_FEATURES = 'audio-features'
+FULL_DATASET = 'full-dataset'
+
+
+def artifactName(playlist_name, playlist_id, kind):
+    '''
+    Builds the name of an artifact of a playlist, e.g. "{playlist_name}-{playlist_id}-track-list".
+    '''
+    return f"{playlist_name}-{playlist_id}-{kind}"
+
+
+def artifactPath(artifact_name, directory=TEMPORARY_STORAGE_DIR, extension='parquet'):
+    return os.path.join(directory, f"{artifact_name}.{extension}")
+
+
+def artifactExists(artifact_name, directory=TEMPORARY_STORAGE_DIR):
+    '''
+    Checks if an artifact has been saved, either as Parquet or as a CSV file from before the storage layer existed.
+    '''
+    return os.path.exists(artifactPath(artifact_name, directory)) or os.path.exists(artifactPath(artifact_name, directory, 'csv'))
+
+
+def saveArtifact(df, artifact_name, directory=TEMPORARY_STORAGE_DIR):
+    '''
+    Saves a DataFrame as a typed Parquet file. The file is written to a temporary path first so readers never see a partially written file.
+
+    INPUT:
+        df (pd.DataFrame): The DataFrame to save.
+        artifact_name (str): Name of the artifact, e.g. as built by `artifactName`.
+        directory (str): Folder to save the artifact in.
+
+    OUTPUT:
+        path (str): Path of the saved Parquet file.
+    '''
+    os.makedirs(directory, exist_ok=True)
+
+    path = artifactPath(artifact_name, directory)
+    df.to_parquet(f"{path}.part", index=False, engine='pyarrow')
+    os.replace(f"{path}.part", path)
+
+    return path
+
+
+def loadArtifact(artifact_name, columns=None, directory=TEMPORARY_STORAGE_DIR):
+    '''
+    Loads an artifact, reading only the requested columns. CSV files saved before the storage layer existed are still read, in which case the
+    'Artists' column is parsed back into lists.
+
+    INPUT:
+        artifact_name (str): Name of the artifact, e.g. as built by `artifactName`.
+        columns (list): The columns to read. Reads every column if None.
+        directory (str): Folder the artifact is saved in.
+
+    OUTPUT:
+        df (pd.DataFrame): The saved DataFrame.
+
+    Raises FileNotFoundError if the artifact was never saved.
+    '''
+    path = artifactPath(artifact_name, directory)
+    if os.path.exists(path):
+        return loadArtifactFile(path, columns)
+
+    csv_path = artifactPath(artifact_name, directory, 'csv')
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"No artifact named {artifact_name} in {directory}")
+
+    return loadArtifactFile(csv_path, columns)
+
+
+def loadArtifactFile(path, columns=None):
+    '''
+    Loads the artifact saved at the given path, as Parquet or, for a '.csv' path, as a CSV file from before the storage layer existed.
+    '''
+    if not path.endswith('.csv'):
+        return pd.read_parquet(path, columns=columns, engine='pyarrow')
+
+    df = pd.read_csv(path, usecols=columns)
+    if 'Artists' in df.columns:
+        df['Artists'] = df['Artists'].map(lambda artists: ast.literal_eval(artists) if isinstance(artists, str) else artists)
+
+    return df
+
+
+def findArtifact(catalog_entry, kind, directory=TEMPORARY_STORAGE_DIR):
+    '''
+    Finds the file of an artifact of a playlist. The path recorded in the catalog entry is used when it exists. Otherwise the directory is
+    searched for a file of that kind and playlist ID, whatever the spelling of the playlist name (e.g. title-cased by older versions).
+
+    OUTPUT:
+        path (str): The path of the artifact, or None if it was never saved.
+    '''
+    path = catalog_entry['artifacts'].get(kind)
+    if path is not None and os.path.exists(path):
+        return path
+
+    if not os.path.isdir(directory):
+        return None
+
+    # Parquet files are preferred over the CSV files of older versions
+    filenames = sorted(os.listdir(directory))
+    for extension in ('parquet', 'csv'):
+        suffix = f"-{catalog_entry['playlist_id']}-{kind}.{extension}"
+        for filename in filenames:
+            if filename.endswith(suffix):
+                return os.path.join(directory, filename)
+
+    return None
+
+
+def loadCatalogArtifact(catalog_entry, kind, columns=None, directory=TEMPORARY_STORAGE_DIR):
+    '''
+    Loads an artifact of a playlist found with `findArtifact`, reading only the requested columns.
+
+    Raises FileNotFoundError if the artifact was never saved.
+    '''
+    path = findArtifact(catalog_entry, kind, directory) if catalog_entry is not None else None
+    if path is None:
+        raise FileNotFoundError(f"No {kind} artifact for this playlist in {directory}")
+
+    return loadArtifactFile(path, columns)
+
+
+def toCSVBytes(df):
+    '''
+    Exports a DataFrame as UTF-8 encoded CSV for the download buttons.
+    '''
+    return df.to_csv(index=False).encode('utf-8')
@@ -0,0 +1,298 @@
+# Normalized store of the saved playlists. The metadata of a track (album, artists, name, popularity...) is kept once per track ID, however
+# many playlists contain it, and a playlist is only its ordered list of items: the track ID and the per-item fields such as 'added_at'. The
+# audio features of the tracks are kept once per track ID as well, in the feature store (see FeatureStore.py). Disk use therefore grows with
+# the number of unique tracks rather than with the number of playlist memberships.
+#
+# A playlist is only marked as stored (with its snapshot ID and number of items) once all its items have been written, so a download that
+# stopped half-way is never mistaken for a saved copy. The items of a download are staged under its own download ID and swapped in for the
+# stored items in a single transaction, so concurrent downloads of the same playlist (e.g. from two Streamlit sessions) cannot interleave:
+# the last one to finish wins, and readers keep seeing the previous complete copy until then.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+DEFAULT_STORE_PATH = 'output/cache/track_store.sqlite'
+
+# Number of track IDs looked up per query, below SQLite's limit on the number of parameters of a statement
+LOOKUP_BATCH_SIZE = 500
+
+# Staged items of a download that neither finished nor was aborted (e.g. its process was killed) are removed after a day
+STALE_DOWNLOAD_SECONDS = 24 * 60 * 60
+
+
+class TrackStore:
+    '''
+    SQLite-backed store of tracks and playlist items. It is safe to share between threads, and between processes thanks to SQLite's WAL
+    journal.
+
+    INPUT:
+        path (str): Location of the SQLite database file.
+    '''
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self.connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS tracks (
+                    track_id TEXT PRIMARY KEY,
+                    metadata TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS playlist_items (
+                    playlist_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    track_id TEXT,
+                    added_at TEXT,
+                    PRIMARY KEY (playlist_id, position)
+                ) WITHOUT ROWID
+            ''')
+            connection.execute('CREATE INDEX IF NOT EXISTS playlist_items_track_id ON playlist_items (track_id)')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS downloads (
+                    download_id TEXT PRIMARY KEY,
+                    playlist_id TEXT NOT NULL,
+                    started_at REAL NOT NULL
+                )
+            ''')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS staged_items (
+                    download_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    track_id TEXT,
+                    added_at TEXT,
+                    PRIMARY KEY (download_id, position)
+                ) WITHOUT ROWID
+            ''')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS playlists (
+                    playlist_id TEXT PRIMARY KEY,
+                    snapshot_id TEXT,
+                    num_items INTEGER NOT NULL,
+                    stored_at REAL NOT NULL
+                )
+            ''')
+
+    @contextmanager
+    def connect(self):
+        '''
+        Opens a connection to the database and runs the enclosed statements in one transaction, closing the connection afterwards.
+        '''
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def beginPlaylist(self, playlist_id):
+        '''
+        Starts a new download of a playlist. Its items are passed to `addItems` with the returned download ID, and only replace the stored
+        items of the playlist when `finishPlaylist` is called with it.
+
+        OUTPUT:
+            download_id (str): The ID under which the items of this download are staged.
+        '''
+        download_id = uuid.uuid4().hex
+        now = time.time()
+
+        with self.lock, self.connect() as connection:
+            stale_downloads = [
+                (row['download_id'],)
+                for row in connection.execute('SELECT download_id FROM downloads WHERE started_at < ?', (now - STALE_DOWNLOAD_SECONDS,))
+            ]
+            connection.executemany('DELETE FROM staged_items WHERE download_id = ?', stale_downloads)
+            connection.executemany('DELETE FROM downloads WHERE download_id = ?', stale_downloads)
+
+            connection.execute('INSERT INTO downloads (download_id, playlist_id, started_at) VALUES (?, ?, ?)', (download_id, playlist_id, now))
+
+        return download_id
+
+    def abortPlaylist(self, download_id):
+        '''
+        Drops the staged items of a download that failed. The stored copy of the playlist is left unchanged.
+        '''
+        with self.lock, self.connect() as connection:
+            connection.execute('DELETE FROM staged_items WHERE download_id = ?', (download_id,))
+            connection.execute('DELETE FROM downloads WHERE download_id = ?', (download_id,))
+
+    def addItems(self, playlist_id, start_position, item_keys, tracks, snapshot_id=None, download_id=None):
+        '''
+        Stores a run of consecutive items of a playlist, and the metadata of their tracks.
+
+        INPUT:
+            playlist_id (str): The ID of the playlist.
+            start_position (int): Position of the first item in the playlist.
+            item_keys (list of tuples): (track ID, added_at) of each item. The track ID is None for items without a Spotify track.
+            tracks (dict): Maps track IDs to their metadata (a JSON-serializable dict). Tracks already stored are updated.
+            snapshot_id (str): If given, the playlist is marked as completely stored for this snapshot ID in the same transaction, ending
+                with these items (e.g. when new items are appended to a stored playlist).
+            download_id (str): If given, the items are staged for this download (see `beginPlaylist`) instead of written to the playlist.
+        '''
+        now = time.time()
+
+        with self.lock, self.connect() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO tracks (track_id, metadata, updated_at) VALUES (?, ?, ?)',
+                [(track_id, json.dumps(metadata), now) for track_id, metadata in tracks.items()]
+            )
+
+            if download_id is not None:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO staged_items (download_id, position, track_id, added_at) VALUES (?, ?, ?, ?)',
+                    [(download_id, start_position + offset, track_id, added_at) for offset, (track_id, added_at) in enumerate(item_keys)]
+                )
+                return
+
+            connection.executemany(
+                'INSERT OR REPLACE INTO playlist_items (playlist_id, position, track_id, added_at) VALUES (?, ?, ?, ?)',
+                [(playlist_id, start_position + offset, track_id, added_at) for offset, (track_id, added_at) in enumerate(item_keys)]
+            )
+            if snapshot_id is not None:
+                markStored(connection, playlist_id, snapshot_id, start_position + len(item_keys))
+
+    def addTracks(self, tracks):
+        '''
+        Stores the metadata of tracks that are not (or not only) part of a saved playlist, e.g. recommended tracks.
+
+        INPUT:
+            tracks (dict): Maps track IDs to their metadata (a JSON-serializable dict). Tracks already stored are updated.
+        '''
+        now = time.time()
+
+        with self.lock, self.connect() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO tracks (track_id, metadata, updated_at) VALUES (?, ?, ?)',
+                [(track_id, json.dumps(metadata), now) for track_id, metadata in tracks.items()]
+            )
+
+    def getTracks(self, track_ids):
+        '''
+        OUTPUT:
+            tracks (dict): Maps each given track ID that is stored to its metadata. IDs that are not stored are left out.
+        '''
+        track_ids = list(dict.fromkeys(track_ids))
+        tracks = {}
+
+        with self.connect() as connection:
+            for start in range(0, len(track_ids), LOOKUP_BATCH_SIZE):
+                batch = track_ids[start:start + LOOKUP_BATCH_SIZE]
+                rows = connection.execute(
+                    f"SELECT track_id, metadata FROM tracks WHERE track_id IN ({','.join('?' * len(batch))})",
+                    batch
+                )
+                for track_id, metadata in rows:
+                    tracks[track_id] = json.loads(metadata)
+
+        return tracks
+
+    def finishPlaylist(self, playlist_id, snapshot_id, num_items, download_id=None):
+        '''
+        Marks a playlist as completely stored for the given snapshot ID. If a download ID is given, the items staged by that download replace
+        the stored items of the playlist in the same transaction. Items at or after `num_items` (left over from a longer version of the
+        playlist) are removed.
+        '''
+        with self.lock, self.connect() as connection:
+            if download_id is not None:
+                connection.execute('DELETE FROM playlist_items WHERE playlist_id = ?', (playlist_id,))
+                connection.execute(
+                    '''
+                    INSERT INTO playlist_items (playlist_id, position, track_id, added_at)
+                    SELECT ?, position, track_id, added_at FROM staged_items WHERE download_id = ? AND position < ?
+                    ''',
+                    (playlist_id, download_id, num_items)
+                )
+                connection.execute('DELETE FROM staged_items WHERE download_id = ?', (download_id,))
+                connection.execute('DELETE FROM downloads WHERE download_id = ?', (download_id,))
+
+            markStored(connection, playlist_id, snapshot_id, num_items)
+
+    def getPlaylist(self, playlist_id):
+        '''
+        OUTPUT:
+            playlist (dict): The 'snapshot_id', 'num_items' and 'stored_at' of the playlist, or None if it is not completely stored.
+        '''
+        with self.connect() as connection:
+            row = connection.execute('SELECT * FROM playlists WHERE playlist_id = ?', (playlist_id,)).fetchone()
+
+        return dict(row) if row is not None else None
+
+    def getItemKeys(self, playlist_id):
+        '''
+        OUTPUT:
+            item_keys (list of tuples): (track ID, added_at) of every item of the playlist, in order.
+        '''
+        with self.connect() as connection:
+            rows = connection.execute(
+                'SELECT track_id, added_at FROM playlist_items WHERE playlist_id = ? ORDER BY position',
+                (playlist_id,)
+            ).fetchall()
+
+        return [(row['track_id'], row['added_at']) for row in rows]
+
+    def iterPlaylistTracks(self, playlist_id):
+        '''
+        Yields the metadata of the tracks of a playlist in the order of its items. Items without a stored track are skipped.
+        '''
+        with self.connect() as connection:
+            cursor = connection.execute(
+                '''
+                SELECT tracks.metadata FROM playlist_items
+                JOIN tracks ON tracks.track_id = playlist_items.track_id
+                WHERE playlist_items.playlist_id = ?
+                ORDER BY playlist_items.position
+                ''',
+                (playlist_id,)
+            )
+            for (metadata,) in cursor:
+                yield json.loads(metadata)
+
+    def size(self):
+        '''
+        OUTPUT:
+            sizes (dict): Number of unique 'tracks', of 'playlist_items' and of stored 'playlists'.
+        '''
+        with self.connect() as connection:
+            return {
+                table: connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('tracks', 'playlist_items', 'playlists')
+            }
+
+
+def markStored(connection, playlist_id, snapshot_id, num_items):
+    connection.execute('DELETE FROM playlist_items WHERE playlist_id = ? AND position >= ?', (playlist_id, num_items))
+    connection.execute(
+        'INSERT OR REPLACE INTO playlists (playlist_id, snapshot_id, num_items, stored_at) VALUES (?, ?, ?, ?)',
+        (playlist_id, snapshot_id, num_items, time.time())
+    )
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def getStore():
+    '''
+    Returns the process-wide TrackStore stored at the default location, creating it on first use.
+    '''
+    global _store
+
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = TrackStore()
+
+    return _store
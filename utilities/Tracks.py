@@ -1,40 +1,272 @@
-import requests
-from tqdm import tqdm
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utilities import SpotifyClient, AudioFeaturesCache, FeatureStore, FeatureTable, Memo, Metrics, Playlists, TrackStore
 
+# Maximum number of track IDs accepted by Spotify's audio-features endpoint per request
+BATCH_SIZE = 100
 
-def getAudioFeatures(access_token, track_ids_list):
+# Maximum number of track IDs accepted by Spotify's tracks endpoint per request
+TRACKS_BATCH_SIZE = 50
+
+# The audio features of a given list of tracks are memoized in memory for an hour, on top of the on-disk cache
+AUDIO_FEATURES_TTL = 60 * 60
+
+# A full feature store is compacted down to this fraction of its maximum size, so that it is not rewritten again on the next append
+FEATURE_STORE_COMPACT_RATIO = 0.8
+
+
+def fetchAudioFeaturesBatch(client, headers, track_ids, limiter=None):
+    '''
+    Requests the audio features of a single batch of at most 100 track IDs, retrying on throttling and transient errors.
+
+    OUTPUT:
+        audio_features (list): The audio features returned by the API, aligned with `track_ids`. Tracks without audio features are None.
+    '''
+    base_url = SpotifyClient.apiURL(f"/audio-features?ids={','.join(track_ids)}")
+
+    response = client.getWithRetry(base_url, limiter=limiter, headers=headers)
+    response.raise_for_status()
+
+    return response.json()['audio_features']
+
+
+def fetchAudioFeatures(access_token, track_ids_list, max_workers=4, limiter=None):
     '''
-    Extract audio features given a list of track IDs:
+    Batch engine for the audio features: splits the track IDs into batches of 100 and dispatches them concurrently behind a shared token-bucket
+    rate limiter. Batches that still fail after all the retries are reported instead of aborting the whole run.
 
     INPUT:
         access_token (str): The access token for this app to access Spotify's API.
-        track_ids (np.array): A list of track IDs.
+        track_ids_list (np.array): A list of track IDs.
+        max_workers (int): Maximum number of batches requested at the same time.
+        limiter (TokenBucket): Rate limiter to use. Defaults to the process-wide limiter.
 
     OUTPUT:
-        audio_features (pd.DataFrame): A pandas DataFrame containing the audio features of the tracks.
-    '''
-
-    # Request per 100 tracks as per Spotify's API limit.
-    track_ids = track_ids_list.copy()
-    remaining_tracks = len(track_ids)
-
-    audio_features = []
-    while remaining_tracks > 0:
-        if remaining_tracks >= 100:
-            base_url = f"https://api.spotify.com/v1/audio-features?ids={','.join(track_ids[:100])}"
-            track_ids = track_ids[100:]
-            remaining_tracks -= 100
-        else:
-            base_url = f"https://api.spotify.com/v1/audio-features?ids={','.join(track_ids)}"
-            track_ids = []
-            remaining_tracks = 0
-
-        headers = {
-            'Authorization': f'Bearer {access_token}',
+        features_by_id (dict): Maps every successfully requested track ID to its audio features, or to None if Spotify has no features for it.
+        failed_ids (list): The track IDs whose batch could not be fetched.
+    '''
+    track_ids = list(track_ids_list)
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+    }
+    client = SpotifyClient.getClient()
+    if limiter is None:
+        limiter = SpotifyClient.getRateLimiter()
+
+    batches = [track_ids[start:start + BATCH_SIZE] for start in range(0, len(track_ids), BATCH_SIZE)]
+
+    features_by_id = {}
+    failed_ids = []
+    if not batches:
+        return features_by_id, failed_ids
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+        futures = {
+            executor.submit(fetchAudioFeaturesBatch, client, headers, batch, limiter): batch
+            for batch in batches
         }
 
-        response = requests.get(base_url, headers=headers).json()
-        audio_features.extend(response['audio_features'])
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                audio_features = future.result()
+            except Exception as e:
+                print(f"Audio Features Batch Error: {e}")
+                failed_ids.extend(batch)
+                continue
+
+            for track_id, features in zip(batch, audio_features):
+                features_by_id[track_id] = features
+
+    return features_by_id, failed_ids
+
+
+def listMissingIDs(track_ids_list, audio_features, failed_ids):
+    '''
+    Returns the IDs that could not be fetched, followed by the other requested IDs missing from the table (tracks Spotify has no audio
+    features for), so that the callers warn about every track left out.
+    '''
+    known_ids = set(audio_features.ids) | set(failed_ids)
+    missing_ids = list(failed_ids)
+    missing_ids.extend(track_id for track_id in dict.fromkeys(track_ids_list) if track_id not in known_ids)
+
+    return missing_ids
+
+
+def getAudioFeatureTable(access_token, track_ids_list, cache=None, use_cache=True, store=None):
+    '''
+    Extract audio features given a list of track IDs. The features are read through the shared feature store, which keeps them once per track
+    ID for every playlist. Tracks not in the store are looked up in the on-disk audio-features cache, and only the remaining ones are fetched
+    from Spotify. What was found or fetched is then added to the cache and to the store.
+
+    The cache decides which tracks are kept: the tracks served by the store are marked as used in the cache too, and once the store is full
+    it is compacted down to the tracks most recently used according to the cache.
+
+    INPUT:
+        access_token (str): The access token for this app to access Spotify's API.
+        track_ids (np.array): A list of track IDs.
+        cache (AudioFeaturesCache): The cache to use. Defaults to the process-wide cache.
+        use_cache (bool): If False, every track is requested from Spotify and neither the cache nor the feature store is touched.
+        store (FeatureStore.FeatureStore): The feature store to use. Defaults to the process-wide store.
+
+    OUTPUT:
+        audio_features (FeatureTable.AudioFeatureTable): The audio features of the tracks, in the order of the given IDs. The tracks without
+            audio features, i.e. the IDs that could not be fetched and those Spotify has no audio features for, are left out and listed in
+            `audio_features.failed_ids`.
+    '''
+
+    if not use_cache:
+        features_by_id, failed_ids = fetchAudioFeatures(access_token, list(track_ids_list))
+        audio_features = FeatureTable.AudioFeatureTable.fromRecords(features_by_id.get(track_id) for track_id in track_ids_list)
+        audio_features.failed_ids = listMissingIDs(track_ids_list, audio_features, failed_ids)
+        return audio_features
+
+    if cache is None:
+        cache = AudioFeaturesCache.getCache()
+    if store is None:
+        store = FeatureStore.getStore()
+
+    store.refresh()
+    unique_ids = list(dict.fromkeys(track_ids_list))
+    unstored_ids = [track_id for track_id, row in zip(unique_ids, store.rowsOf(unique_ids)) if row < 0]
+    Metrics.recordCacheLookups('FeatureStore', hits=len(unique_ids) - len(unstored_ids), misses=len(unstored_ids))
+
+    if len(unstored_ids) < len(unique_ids):
+        unstored = set(unstored_ids)
+        cache.touch(track_id for track_id in unique_ids if track_id not in unstored)
+
+    features_by_id, missing_ids = cache.get(unstored_ids) if unstored_ids else ({}, [])
+
+    fetched_features, failed_ids = fetchAudioFeatures(access_token, missing_ids)
+    features_by_id.update(fetched_features)
+
+    if fetched_features:
+        cache.put(fetched_features)
+
+    store.append(features_by_id.values())
+
+    audio_features = store.table(track_ids_list)
+    audio_features.failed_ids = listMissingIDs(track_ids_list, audio_features, failed_ids)
+
+    if store.isFull():
+        store.compact(cache.recentIDs(int(store.max_rows * FEATURE_STORE_COMPACT_RATIO)))
+
+    return audio_features
+
+
+def toAudioFeaturesDataFrame(audio_features, copy=False):
+    '''
+    Converts an AudioFeatureTable into the DataFrame returned by `getAudioFeatures`, with the failed IDs in `attrs['failed_ids']`. Set `copy`
+    when the table is shared (e.g. memoized), so that the DataFrame does not write into it.
+    '''
+    audio_features_df = audio_features.toDataFrame(copy=copy)
+    audio_features_df.attrs['failed_ids'] = list(audio_features.failed_ids)
+
+    return audio_features_df
+
+
+def getAudioFeatures(access_token, track_ids_list, cache=None, use_cache=True, store=None):
+    '''
+    DataFrame version of `getAudioFeatureTable`.
+
+    OUTPUT:
+        audio_features (pd.DataFrame): A pandas DataFrame containing the audio features of the tracks, in the order of the given IDs. The IDs
+            without audio features are listed in `audio_features.attrs['failed_ids']`.
+    '''
+    return toAudioFeaturesDataFrame(getAudioFeatureTable(access_token, track_ids_list, cache, use_cache, store))
+
+
+@Memo.memoize(
+    ttl=AUDIO_FEATURES_TTL,
+    max_entries=64,
+    key=lambda access_token, track_ids_list: tuple(track_ids_list),
+    should_cache=lambda audio_features: not audio_features.failed_ids,
+)
+def getCachedAudioFeatureTable(access_token, track_ids_list):
+    '''
+    Memoized `getAudioFeatureTable`, keyed by the list of track IDs and shared across Streamlit reruns and sessions. Results with failed IDs
+    are not cached. Only the compact table is kept in memory (about 60 bytes of features per track).
+    '''
+    return getAudioFeatureTable(access_token, track_ids_list)
+
+
+def getCachedAudioFeatures(access_token, track_ids_list):
+    '''
+    DataFrame version of `getCachedAudioFeatureTable`. Each call gets its own DataFrame, so it can be modified freely.
+    '''
+    return toAudioFeaturesDataFrame(getCachedAudioFeatureTable(access_token, track_ids_list), copy=True)
+
+
+def fetchTracksBatch(client, headers, track_ids, limiter=None):
+    '''
+    Requests the track objects of a single batch of at most 50 track IDs, retrying on throttling and transient errors.
+
+    OUTPUT:
+        tracks (list): The track objects returned by the API, aligned with `track_ids`. Unknown tracks are None.
+    '''
+    base_url = SpotifyClient.apiURL(f"/tracks?ids={','.join(track_ids)}")
+
+    response = client.getWithRetry(base_url, limiter=limiter, headers=headers)
+    response.raise_for_status()
+
+    return response.json()['tracks']
+
+
+def getTrackRecords(access_token, track_ids_list, store=None):
+    '''
+    Looks up the metadata of tracks (album, artists, name, popularity...) in the track store, and fetches the tracks it does not hold from
+    Spotify in batches of 50. The fetched tracks are added to the store. Batches that fail are left out rather than aborting the lookup.
+
+    INPUT:
+        access_token (str): The access token for this app to access Spotify's API. If None, only the track store is used.
+        track_ids_list (list): A list of track IDs.
+        store (TrackStore.TrackStore): The track store to use. Defaults to the process-wide store.
+
+    OUTPUT:
+        records_by_id (dict): Maps the track IDs that were found to their metadata, as saved for the playlists (see `Playlists.trackRecord`).
+    '''
+    if store is None:
+        store = TrackStore.getStore()
+
+    records_by_id = store.getTracks(track_ids_list)
+    missing_ids = [track_id for track_id in dict.fromkeys(track_ids_list) if track_id not in records_by_id]
+    Metrics.recordCacheLookups('TrackStore', hits=len(records_by_id), misses=len(missing_ids))
+    if not missing_ids or access_token is None:
+        return records_by_id
+
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+    }
+    client = SpotifyClient.getClient()
+    limiter = SpotifyClient.getRateLimiter()
+
+    fetched_records = {}
+    for start in range(0, len(missing_ids), TRACKS_BATCH_SIZE):
+        try:
+            tracks = fetchTracksBatch(client, headers, missing_ids[start:start + TRACKS_BATCH_SIZE], limiter)
+        except Exception as e:
+            print(f"Tracks Batch Error: {e}")
+            continue
+
+        for track in tracks:
+            if track and track.get('id') is not None:
+                fetched_records[track['id']] = Playlists.trackRecord(track)
+
+    if fetched_records:
+        store.addTracks(fetched_records)
+    records_by_id.update(fetched_records)
+
+    return records_by_id
+
+
+def toTrackObject(record):
+    '''
+    Rebuilds the fields of a Spotify track object (as returned by e.g. the recommendations endpoint) from the metadata of a stored track.
+    '''
+    track = {
+        'album': {'name': record['Album']},
+        'artists': [{'name': artist} for artist in record['Artists']],
+    }
+    for detail in Playlists.TRACK_DETAILS:
+        track[detail] = record[detail]
 
-    return pd.DataFrame(audio_features)
+    return track
@@ -0,0 +1,24 @@
+# The submodules of the package are only imported when they are first used (e.g. `from utilities import Playlists` or
+# `utilities.Playlists`), so that importing the package does not import pandas, NumPy, requests or Streamlit for modules a page never uses.
+
+import importlib
+
+SUBMODULES = (
+    'AudioFeaturesCache', 'EmailToken', 'ExtractRecommendedTracks', 'FeatureStore', 'FeatureTable', 'LocalRecommender', 'Memo', 'Metrics',
+    'MetricsPanel', 'Pipeline', 'PlaylistCatalog', 'PlaylistSync', 'Playlists', 'Profiler', 'RecommendationHarvester', 'SeedSelection',
+    'SpotifyAuth', 'SpotifyClient', 'Storage', 'TrackStore', 'Tracks',
+)
+
+__all__ = list(SUBMODULES)
+
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        # import_module stores the submodule as an attribute of the package, so this only runs once per submodule
+        return importlib.import_module(f"{__name__}.{name}")
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(SUBMODULES))